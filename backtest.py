@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+NEXUS BACKTEST — replay vettoriale delle regole v14.5
+  ✅ Breakout 20gg + vol_ratio > VOL_TRIGGER + ADX >= MIN_ADX + IFS >= MIN_IFS_SCORE + regime SPY
+  ✅ Segnali come maschere booleane date × ticker (niente analyze_ticker giorno per giorno)
+  ✅ Stop STOP_ATR_MULT×ATR / target TARGET_R_MULT·R risolti con first-touch vettoriale
+  ✅ Selezione giornaliera MAX_PER_SECTOR / MAX_ALERTS come in main()
+  ✅ Ticker divisi in blocchi su un ProcessPool, prezzi in un SharedPanel float32 condiviso
+
+Uso:
+  python scanner_pro.py --backfill --period 10y
+  python backtest.py --start 2016-01-01 --workers 8 --out trades.csv
+
+Limiti: entry al close del giorno del segnale (live: prezzo intraday),
+filtro earnings non applicato (nessuno storico dei calendari).
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+import scanner_pro as sp
+
+# Regole live di analyze_ticker (soglie lette da CONFIG)
+LIVE_PARAMS = {
+    "min_ifs":     sp.CONFIG["MIN_IFS_SCORE"],
+    "min_adx":     sp.CONFIG["MIN_ADX"],
+    "vol_trigger": sp.CONFIG["VOL_TRIGGER"],
+    "dryup_ratio": sp.CONFIG["VOLUME_DRYUP_RATIO"],
+    "stop_atr":    sp.CONFIG["STOP_ATR_MULT"],
+    "target_r":    sp.CONFIG["TARGET_R_MULT"],
+}
+
+# ==============================
+# 🧮 ARRAY HELPERS (date × ticker)
+# ==============================
+def _shift(x: np.ndarray, k: int) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    if k < len(x):
+        out[k:] = x[:len(x) - k]
+    return out
+
+def _rolling_sum(x: np.ndarray, w: int) -> np.ndarray:
+    """Somma mobile su w righe; NaN se la finestra non è completa (come rolling(w))."""
+    valid = ~np.isnan(x)
+    zero  = np.zeros((1, x.shape[1]))
+    cs    = np.vstack([zero, np.cumsum(np.where(valid, x, 0.0), axis=0)])
+    cn    = np.vstack([zero, np.cumsum(valid, axis=0)])
+    out   = np.full_like(x, np.nan)
+    if len(x) >= w:
+        out[w - 1:] = np.where(cn[w:] - cn[:-w] == w, cs[w:] - cs[:-w], np.nan)
+    return out
+
+def _rolling_max(x: np.ndarray, w: int) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    if len(x) >= w:
+        out[w - 1:] = sliding_window_view(x, w, axis=0).max(axis=-1)
+    return out
+
+# ==============================
+# 🧠 FEATURES (calcolate una volta, riusate da ogni set di parametri)
+# ==============================
+def compute_features(panel: dict, spy_close: pd.Series) -> dict:
+    """
+    Tutte le grandezze di analyze_ticker/institutional_score per ogni (data, ticker).
+    Le componenti che dipendono da parametri sono salvate in forma grezza
+    (es. dry_feat = 2° minimo di V/avg20 nei 3gg prima) così la soglia si applica dopo.
+    """
+    dates = panel["dates"]
+    C, H, L, V = panel["close"], panel["high"], panel["low"], panel["volume"]
+    valid = ~(np.isnan(C) | np.isnan(H) | np.isnan(L) | np.isnan(V))
+
+    spy   = spy_close.reindex(dates).to_numpy(dtype=float)
+    sma50 = spy_close.rolling(50).mean()
+    bull  = ((spy_close > sma50) & (sma50 > sma50.shift(4))).reindex(dates, fill_value=False).to_numpy(bool)
+    spy_rs = spy_close.pct_change(63, fill_method=None).reindex(dates).to_numpy(dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg20     = _rolling_sum(V, 20) / 20
+        vol_ratio = V / avg20
+        res       = _shift(_rolling_max(H, 20), 1)
+        rs        = C / _shift(C, 63) - 1 - spy_rs[:, None]
+        prev_c    = _shift(C, 1)
+        tr        = np.fmax(np.fmax(H - L, np.abs(H - prev_c)), np.abs(L - prev_c))
+        atr       = _rolling_sum(tr, 14) / 14
+
+        c_accum   = _rolling_sum((V > avg20).astype(float), 5) >= 3
+        hl        = H - L
+        r5, r20   = _rolling_sum(hl, 5) / 5, _rolling_sum(hl, 20) / 20
+        c_vcp     = (r20 > 0) & (r5 < r20)
+        c_rs      = rs > 0
+        c_close   = (hl > 0) & ((C - L) / hl > 0.75)
+        rs_line   = C / spy[:, None]
+        c_rs_high = rs_line > _shift(_rolling_max(rs_line, 20), 1)
+        dry_feat  = np.sort(np.stack([_shift(vol_ratio, k) for k in (1, 2, 3)]), axis=0)[1]
+
+    first = valid.argmax(axis=0)
+    adx   = sp.panel_adx(H, L, C, first)
+    bars  = np.cumsum(valid, axis=0)
+
+    eligible = (
+        valid & (bars >= 60) & bull[:, None]
+        & ~np.isnan(res) & ~np.isnan(rs) & (avg20 > 0)
+        & (C * V >= sp.CONFIG["MIN_VOLUME_USD"]) & (C > res)
+    )
+    return {
+        "dates": dates, "tickers": panel["tickers"], "bull": bull,
+        "close": C, "high": H, "low": L,
+        "eligible": eligible, "vol_ratio": vol_ratio, "adx": adx, "atr": atr,
+        "rs": rs, "res": res, "dry_feat": dry_feat,
+        "ifs_base": 2 * c_accum + 2 * c_vcp + 2 * c_rs + 1 * c_close + 2 * c_rs_high,
+    }
+
+def signal_mask(feat: dict, params: dict) -> tuple:
+    """Maschera segnali (date × ticker) e IFS per un set di parametri."""
+    ifs = feat["ifs_base"] + (feat["dry_feat"] < params["dryup_ratio"])
+    with np.errstate(invalid="ignore"):
+        mask = (
+            feat["eligible"]
+            & (feat["vol_ratio"] > params["vol_trigger"])
+            & sp.not_below(feat["adx"], params["min_adx"])   # come "if adx < MIN_ADX: skip" (NaN passa)
+            & (ifs >= params["min_ifs"])
+            & (feat["atr"] > 0)
+        )
+    return mask, ifs
+
+# ==============================
+# 🎯 FIRST-TOUCH (stop / target)
+# ==============================
+def resolve_trades(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                   rows: np.ndarray, cols: np.ndarray, stop: np.ndarray,
+                   target: np.ndarray, max_hold: int) -> dict:
+    """
+    Per ogni trade (riga di entry, colonna ticker) cerca in un colpo solo la prima barra
+    successiva che tocca stop o target. Stessa barra → stop (ipotesi conservativa).
+    Nessun tocco entro max_hold → uscita al close ("expired"), o "open" a fine dati.
+    """
+    T   = len(close)
+    fwd = rows[:, None] + 1 + np.arange(max_hold)[None, :]
+    inb = fwd < T
+    fr  = np.clip(fwd, 0, T - 1)
+    c   = cols[:, None]
+    hi  = np.where(inb, high[fr, c], np.nan)
+    lo  = np.where(inb, low[fr, c], np.nan)
+    cl  = np.where(inb, close[fr, c], np.nan)
+
+    with np.errstate(invalid="ignore"):
+        hit_stop = lo <= stop[:, None]
+        hit_tgt  = hi >= target[:, None]
+    never     = max_hold + 1
+    i_stop    = np.where(hit_stop.any(axis=1), hit_stop.argmax(axis=1), never)
+    i_tgt     = np.where(hit_tgt.any(axis=1), hit_tgt.argmax(axis=1), never)
+    first_hit = np.minimum(i_stop, i_tgt)
+
+    avail   = (~np.isnan(cl)).sum(axis=1)
+    last_ok = np.maximum(avail - 1, 0)
+    outcome = np.where(i_stop <= i_tgt, "stop", "target")
+    outcome = np.where(first_hit == never, np.where(avail >= max_hold, "expired", "open"), outcome)
+    held    = np.where(first_hit == never, last_ok, first_hit) + 1
+    exit_px = np.where(outcome == "stop", stop,
+              np.where(outcome == "target", target, cl[np.arange(len(rows)), last_ok]))
+    return {"outcome": outcome, "exit": exit_px, "held": held,
+            "exit_row": np.minimum(rows + held, T - 1)}
+
+# ==============================
+# ⚙️ WORKER (un blocco di ticker)
+# ==============================
+_shared = {}   # nel worker: SharedPanel attaccato dall'initializer del pool
+
+def _attach_panel(spec: dict):
+    _shared["panel"] = sp.SharedPanel.attach(spec)
+
+def _load_chunk(tickers: list, spy_df: pd.DataFrame = None) -> dict:
+    """Panel del blocco: viste sul SharedPanel del processo padre, o dallo store se assente."""
+    if "panel" in _shared:
+        return _shared["panel"].panel(tickers)
+    histories = {t: df for t in tickers if (df := sp.store_load(t)) is not None and len(df)}
+    return sp.build_panel(histories, spy_df)
+
+def _spy_close(spy_df: pd.DataFrame = None) -> pd.Series:
+    return _shared["panel"].spy_close() if "panel" in _shared else spy_df["Close"]
+
+def shared_store_panel(tickers: list) -> "sp.SharedPanel":
+    """SharedPanel (float32) dei ticker + SPY dallo store; SystemExit se manca SPY."""
+    shared = sp.SharedPanel.from_store(list(tickers) + ["SPY"])
+    if "SPY" not in shared.col:
+        shared.close()
+        shared.unlink()
+        raise SystemExit("❌ SPY non presente nello store — eseguire prima: python scanner_pro.py --backfill --period 10y")
+    return shared
+
+def _signals_for(feat: dict, params: dict, start, end, max_hold: int) -> pd.DataFrame:
+    mask, ifs = signal_mask(feat, params)
+    dates = feat["dates"]
+    in_range = (dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))
+    mask &= np.asarray(in_range)[:, None]
+    rows, cols = np.nonzero(mask)
+    if not len(rows):
+        return pd.DataFrame()
+
+    entry  = feat["close"][rows, cols]
+    atr    = feat["atr"][rows, cols]
+    stop   = entry - atr * params["stop_atr"]
+    risk   = entry - stop
+    target = entry + risk * params["target_r"]
+    out    = resolve_trades(feat["high"], feat["low"], feat["close"], rows, cols, stop, target, max_hold)
+
+    tickers = np.asarray(feat["tickers"])[cols]
+    return pd.DataFrame({
+        "date":      dates[rows],
+        "ticker":    tickers,
+        "sector":    [sp.SECTOR_MAP.get(t, "Other") for t in tickers],
+        "ifs":       ifs[rows, cols].astype(int),
+        "rs":        np.round(feat["rs"][rows, cols] * 100, 1),
+        "adx":       np.round(feat["adx"][rows, cols], 1),
+        "vol_ratio": np.round(feat["vol_ratio"][rows, cols], 2),
+        "entry":     entry,
+        "stop":      stop,
+        "target":    target,
+        "outcome":   out["outcome"],
+        "exit":      out["exit"],
+        "exit_date": dates[out["exit_row"]],
+        "held":      out["held"],
+        "r":         (out["exit"] - entry) / risk,
+    })
+
+def _run_chunk(tickers: list, params: dict, start, end, max_hold: int, spy_df: pd.DataFrame = None) -> pd.DataFrame:
+    panel = _load_chunk(tickers, spy_df)
+    if not panel["tickers"]:
+        return pd.DataFrame()
+    feat = compute_features(panel, _spy_close(spy_df))
+    return _signals_for(feat, params, start, end, max_hold)
+
+# ==============================
+# 📊 SELEZIONE + STATISTICHE
+# ==============================
+def select_daily(signals: pd.DataFrame, max_per_sector: int, max_alerts: int) -> pd.DataFrame:
+    """Stessa selezione di main(): ordina per (ifs, rs), cap per settore, poi MAX_ALERTS al giorno."""
+    if signals.empty:
+        return signals
+    s = signals.sort_values(["date", "ifs", "rs"], ascending=[True, False, False], kind="stable")
+    s = s[s.groupby(["date", "sector"]).cumcount() < max_per_sector]
+    s = s[s.groupby("date").cumcount() < max_alerts]
+    return s.reset_index(drop=True)
+
+def summarize(trades: pd.DataFrame) -> dict:
+    if trades.empty:
+        return {"trades": 0}
+    closed = trades[trades["outcome"] != "open"]
+    r      = closed["r"]
+    gains, losses = r[r > 0].sum(), -r[r < 0].sum()
+    equity = r.cumsum()
+    return {
+        "trades":        int(len(trades)),
+        "closed":        int(len(closed)),
+        "win_rate":      round(float((closed["outcome"] == "target").mean()), 3) if len(closed) else None,
+        "avg_r":         round(float(r.mean()), 3) if len(r) else None,
+        "total_r":       round(float(r.sum()), 2),
+        "profit_factor": round(float(gains / losses), 2) if losses > 0 else None,
+        "max_dd_r":      round(float((equity.cummax() - equity).max()), 2) if len(r) else 0.0,
+        "avg_held":      round(float(trades["held"].mean()), 1),
+        "outcomes":      trades["outcome"].value_counts().to_dict(),
+    }
+
+def yearly_table(trades: pd.DataFrame) -> pd.DataFrame:
+    closed = trades[trades["outcome"] != "open"]
+    if closed.empty:
+        return pd.DataFrame()
+    g = closed.groupby(closed["date"].dt.year)
+    return pd.DataFrame({
+        "trades":   g.size(),
+        "win_rate": g["outcome"].apply(lambda o: (o == "target").mean()).round(3),
+        "avg_r":    g["r"].mean().round(3),
+        "total_r":  g["r"].sum().round(2),
+    })
+
+def run_backtest(tickers: list, params: dict = None, start="2000-01-01", end="2100-01-01",
+                 workers: int = None, max_hold: int = 60, chunk_size: int = 32) -> pd.DataFrame:
+    """Segnali di tutti i ticker (in parallelo) → selezione giornaliera. Ritorna i trade selezionati."""
+    params = {**LIVE_PARAMS, **(params or {})}
+    chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+    n = len(chunks)
+    with shared_store_panel(tickers) as shared, \
+         ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             initializer=_attach_panel, initargs=(shared.spec,)) as pool:
+        parts = list(pool.map(_run_chunk, chunks, [params] * n, [start] * n, [end] * n, [max_hold] * n))
+    parts = [p for p in parts if not p.empty]
+    signals = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    print(f"🧪 Segnali grezzi: {len(signals)}")
+    return select_daily(signals, sp.CONFIG["MAX_PER_SECTOR"], sp.CONFIG["MAX_ALERTS"])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="NEXUS backtest vettoriale (regole v14.5)")
+    parser.add_argument("--start", default="2000-01-01")
+    parser.add_argument("--end", default="2100-01-01")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-hold", type=int, default=60, help="barre massime in posizione")
+    parser.add_argument("--out", default=None, help="CSV con i trade selezionati")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    t0 = time.time()
+    trades = run_backtest(sp.MY_WATCHLIST, start=args.start, end=args.end,
+                          workers=args.workers, max_hold=args.max_hold)
+    print("=" * 70)
+    print(f"🧪 NEXUS BACKTEST — {len(sp.MY_WATCHLIST)} ticker | {time.time() - t0:.1f}s")
+    print("=" * 70)
+    for k, v in summarize(trades).items():
+        print(f"   {k:<14} {v}")
+    table = yearly_table(trades)
+    if not table.empty:
+        print()
+        print(table.to_string())
+    if args.out and not trades.empty:
+        trades.to_csv(args.out, index=False)
+        print(f"💾 Trade salvati in {args.out}")
@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+NEXUS BENCH — benchmark offline dello scanner (nessuna chiamata di rete)
+  ✅ yf.download e yf.Ticker (history 1d/5m + calendar), CSV stooq e Telegram sostituiti da fixture locali
+  ✅ Universi sintetici deterministici (250 / 2.000 / 10.000 ticker) con breakout veri
+  ✅ Latenza e 429 iniettabili (stessa probabilità per yahoo, stooq e Telegram)
+  ✅ calc_adx, institutional_score, analyze_ticker e main() con store freddo e caldo
+  ✅ Ogni caso in un processo separato → picco RSS non contaminato dagli altri casi
+  ✅ Risultati JSON (throughput, p50/p95 per ticker, picco memoria) + confronto con una baseline
+
+Uso:
+  python bench.py --out bench.json
+  python bench.py --sizes 250,2000 --latency-ms 40 --fail-rate 0.05 --sleep-scale 0
+  python bench.py --baseline bench_prev.json --tolerance 0.15
+  python bench.py --cases main_cold,main_warm --set PANEL_ENGINE=false
+
+Per i casi main la latenza per ticker è il tempo tra la prima richiesta del ticker
+e la risposta servita (include coda del token bucket e backoff dopo un 429).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import scanner_pro as sp
+
+_read_csv = pd.read_csv
+_post     = sp.telegram_session.post
+
+RATE_LIMIT_MSG = "Too Many Requests. Rate limited. Try after a while."
+SECTORS  = sorted(set(sp.SECTOR_MAP.values()))
+CASES    = ("calc_adx", "institutional_score", "analyze_ticker", "main_cold", "main_warm")
+MICRO    = {"calc_adx", "institutional_score", "analyze_ticker"}
+PERIOD_DAYS = {"wk": 7, "mo": 31, "y": 366}
+
+# ==============================
+# 🧪 DATI SINTETICI
+# ==============================
+def universe(size: int) -> list:
+    return [f"SYN{i:05d}" for i in range(size)]
+
+def synthetic_frame(ticker: str, bars: int, end) -> pd.DataFrame:
+    """OHLCV deterministico per ticker: random walk con accumulazioni e breakout su volume."""
+    rng   = np.random.default_rng(zlib.crc32(ticker.encode()))
+    idx   = pd.bdate_range(end=end, periods=bars)
+    ret   = rng.normal(0.0006, 0.02, bars)
+    close = rng.uniform(10, 300) * np.exp(np.cumsum(ret))
+    high  = close * (1 + rng.uniform(0, 0.02, bars))
+    low   = close * (1 - rng.uniform(0, 0.02, bars))
+    vol   = rng.lognormal(np.log(2e6), 0.5, bars) * np.where(ret > 0.03, 3.0, 1.0)
+    return pd.DataFrame({"Open": (high + low) / 2, "High": high, "Low": low,
+                         "Close": close, "Volume": vol.round()}, index=idx)
+
+def intraday_frame(daily: pd.DataFrame, ticker: str, now=None) -> pd.DataFrame:
+    """Barre 5m (ora di New York) coerenti con le giornaliere: volume su una curva a "U" con rumore."""
+    slot   = np.arange(sp.SESSION_SLOTS)
+    shape  = np.diff(np.r_[0.0, sp._default_volume_curve()])
+    frames = []
+    for day, row in daily.iterrows():
+        rng   = np.random.default_rng(zlib.crc32(f"{ticker}:{day.date()}".encode()))
+        w     = shape * rng.lognormal(0, 0.3, sp.SESSION_SLOTS)
+        path  = np.linspace(row["Open"], row["Close"], sp.SESSION_SLOTS + 1)
+        idx   = day.normalize() + pd.to_timedelta(sp.SESSION_OPEN + 5 * slot, unit="min")
+        frames.append(pd.DataFrame({
+            "Open": path[:-1], "High": np.maximum(path[:-1], path[1:]) * 1.001,
+            "Low": np.minimum(path[:-1], path[1:]) * 0.999, "Close": path[1:],
+            "Volume": (row["Volume"] * w / w.sum()).round()}, index=idx))
+    df = pd.concat(frames) if frames else pd.DataFrame(columns=daily.columns)
+    if now is not None:
+        df = df[df.index <= now]                        # sessione in corso: solo barre già aperte
+    df.index = pd.DatetimeIndex(df.index).tz_localize("America/New_York")
+    return df
+
+def spy_frame(bars: int, end) -> pd.DataFrame:
+    """SPY in trend rialzista regolare: regime sempre BULL, lo scan non si ferma al gate."""
+    idx   = pd.bdate_range(end=end, periods=bars)
+    t     = np.arange(bars)
+    close = 400 * np.exp(0.0006 * t) * (1 + 0.002 * np.sin(t / 3))
+    return pd.DataFrame({"Open": close, "High": close * 1.004, "Low": close * 0.996,
+                         "Close": close, "Volume": np.full(bars, 8e7)}, index=idx)
+
+# ==============================
+# 🌐 FAKE UPSTREAM (yfinance / stooq / Telegram)
+# ==============================
+class _FakeResponse:
+    def __init__(self, status_code: int, payload: dict):
+        self.status_code = status_code
+        self._payload    = payload
+        self.text        = json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+class _FakeTicker:
+    def __init__(self, market: "FakeMarket", ticker: str):
+        self.market, self.ticker = market, ticker
+
+    def history(self, period=None, start=None, end=None, raise_errors=False, interval="1d", **kwargs):
+        self.market._request("yahoo", [self.ticker])
+        if interval != "1d":
+            df = self.market.intraday(self.ticker, start, end, period)
+        else:
+            df = self.market._slice(self.market.frame(self.ticker), start, end, period).copy()
+            df.index = df.index.tz_localize("America/New_York")
+        df["Dividends"], df["Stock Splits"] = 0.0, 0.0
+        self.market._served([self.ticker])
+        return df
+
+    @property
+    def calendar(self):
+        self.market._request("yahoo")
+        h = zlib.crc32(f"cal:{self.ticker}".encode()) / 2 ** 32
+        if h < 0.15:                                         # ETF / nessun calendario
+            return {}
+        days = 0 if h < 0.15 + self.market.earnings_rate else 5 + int(h * 80)
+        return {"Earnings Date": [(self.market.end + pd.Timedelta(days=days)).date()]}
+
+    @property
+    def options(self):
+        self.market._request("yahoo")
+        h = zlib.crc32(f"opt:{self.ticker}".encode()) / 2 ** 32
+        if h < 0.1:                                          # nessuna opzione quotata
+            return ()
+        start = self.market.end + pd.Timedelta(days=(4 - self.market.end.weekday()) % 7)
+        return tuple((start + pd.Timedelta(weeks=w)).strftime("%Y-%m-%d") for w in range(6))
+
+    def option_chain(self, expiry: str):
+        """Catena sintetica attorno all'ultimo prezzo: OI decrescente dall'ATM, flusso call/put dal ticker."""
+        self.market._request("yahoo", [self.ticker])
+        price  = float(self.market.frame(self.ticker)["Close"].iloc[-1])
+        step   = 1.0 if price < 100 else 5.0
+        h      = zlib.crc32(f"flow:{self.ticker}:{expiry}".encode()) / 2 ** 32
+        strike = np.round(price / step) * step + step * np.arange(-10, 11)
+        oi     = np.round(2000 * np.exp(-np.abs(strike - price) / (4 * step)))
+        def side(ratio):
+            return pd.DataFrame({"contractSymbol": [f"{self.ticker}{expiry}{s:g}" for s in strike],
+                                 "strike": strike, "lastPrice": 1.0, "bid": np.where(oi > 50, 0.5, 0.0),
+                                 "ask": 0.6, "volume": np.round(oi * ratio), "openInterest": oi})
+        return SimpleNamespace(calls=side(0.2 + 1.5 * h), puts=side(0.3), underlying={})
+
+class FakeMarket:
+    """Stand-in locale degli upstream: dati deterministici, latenza e 429 configurabili."""
+
+    def __init__(self, bars: int = 520, latency: float = 0.0, fail_rate: float = 0.0,
+                 earnings_rate: float = 0.03, seed: int = 0):
+        self.bars, self.latency, self.fail_rate = bars, latency, fail_rate
+        self.earnings_rate = earnings_rate
+        self.end      = pd.Timestamp(sp._ny_today())
+        self.rng      = random.Random(seed)
+        self._frames  = {}
+        self._lock    = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.counters = defaultdict(int)
+            self.first    = {}
+            self.served   = {}
+
+    def frame(self, ticker: str) -> pd.DataFrame:
+        with self._lock:
+            df = self._frames.get(ticker)
+        if df is None:
+            df = (spy_frame(self.bars, self.end) if ticker == "SPY"
+                  else synthetic_frame(ticker, self.bars, self.end))
+            with self._lock:
+                self._frames[ticker] = df
+        return df
+
+    def _request(self, host: str, tickers=()):
+        now = time.perf_counter()
+        with self._lock:
+            self.counters[f"{host}_requests"] += 1
+            for t in tickers:
+                self.first.setdefault(t, now)
+            throttled = self.rng.random() < self.fail_rate
+            if throttled:
+                self.counters[f"{host}_429"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            raise Exception(RATE_LIMIT_MSG)
+
+    def _served(self, tickers):
+        now = time.perf_counter()
+        with self._lock:
+            for t in tickers:
+                self.served.setdefault(t, now)
+
+    @staticmethod
+    def _slice(df: pd.DataFrame, start=None, end=None, period=None) -> pd.DataFrame:
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df.index < pd.Timestamp(end)]
+        if period:
+            n, unit = re.fullmatch(r"(\d+)(d|wk|mo|y)", period).groups()
+            if unit == "d":
+                df = df.iloc[-int(n):]
+            else:
+                df = df[df.index > df.index[-1] - pd.Timedelta(days=int(n) * PERIOD_DAYS[unit])]
+        return df
+
+    def intraday(self, ticker: str, start=None, end=None, period=None) -> pd.DataFrame:
+        now = pd.Timestamp(datetime.now(sp.pytz.timezone("America/New_York")).replace(tzinfo=None))
+        return intraday_frame(self._slice(self.frame(ticker), start, end, period), ticker, now)
+
+    # --- yfinance ---
+    def download(self, tickers, start=None, end=None, period=None, group_by="column", interval="1d",
+                 **kwargs):
+        names = [tickers] if isinstance(tickers, str) else list(tickers)
+        self._request("yahoo", names)
+        if interval != "1d":
+            frames = {t: self.intraday(t, start, end, period) for t in names}
+        else:
+            frames = {t: self._slice(self.frame(t), start, end, period) for t in names}
+        df = pd.concat(frames, axis=1, names=["Ticker", "Price"])
+        if group_by != "ticker":                              # yfinance >= 0.2.48: (Price, Ticker)
+            df = df.swaplevel(0, 1, axis=1)
+        self._served(names)
+        return df
+
+    def ticker(self, ticker: str, session=None) -> _FakeTicker:
+        return _FakeTicker(self, ticker)
+
+    # --- stooq ---
+    def read_csv(self, path, *args, **kwargs):
+        if not (isinstance(path, str) and path.startswith("https://stooq.com")):
+            return _read_csv(path, *args, **kwargs)
+        query  = dict(kv.split("=", 1) for kv in path.split("?", 1)[1].split("&"))
+        ticker = query["s"].rsplit(".", 1)[0].upper()
+        self._request("stooq", [ticker])
+        df = self.frame(ticker)
+        if "d1" in query:
+            df = df[(df.index >= pd.Timestamp(query["d1"])) & (df.index <= pd.Timestamp(query["d2"]))]
+        self._served([ticker])
+        csv = df.rename_axis("Date").to_csv()
+        return _read_csv(io.StringIO(csv), *args, **kwargs)
+
+    # --- Telegram ---
+    def post(self, url, *args, **kwargs):
+        if "api.telegram.org" not in str(url):
+            return _post(url, *args, **kwargs)
+        try:
+            self._request("telegram")
+        except Exception:
+            return _FakeResponse(429, {"ok": False, "error_code": 429,
+                                       "description": "Too Many Requests: retry after 3",
+                                       "parameters": {"retry_after": 3}})
+        return _FakeResponse(200, {"ok": True, "result": {}})
+
+    @contextlib.contextmanager
+    def patched(self):
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(mock.patch.object(sp.yf, "download", self.download))
+            stack.enter_context(mock.patch.object(sp.yf, "Ticker", self.ticker))
+            stack.enter_context(mock.patch.object(sp.pd, "read_csv", self.read_csv))
+            stack.enter_context(mock.patch.object(sp.telegram_session, "post", self.post))
+            yield self
+
+class _ScaledTime:
+    """Modulo time per scanner_pro con time.sleep scalato (pause Telegram, backoff sincroni)."""
+
+    def __init__(self, scale: float):
+        self._scale = scale
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds * self._scale)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+@contextlib.contextmanager
+def sandbox(workdir: str, tickers: list, overrides: dict, sleep_scale: float, yahoo_rate: float):
+    """File, watchlist, CONFIG e rate limiter di scanner_pro isolati nella cartella del benchmark."""
+    store = os.path.join(workdir, ".ohlcv_store")
+    attrs = {
+        "STORE_DIR":           store,
+        "STORE_INDEX":         os.path.join(store, "index.json"),
+        "PROXIMITY_FILE":      os.path.join(store, "proximity.json"),
+        "VOLUME_PROFILE_FILE": os.path.join(store, "volume_profiles.json"),
+        "OPTIONS_CACHE":       os.path.join(store, "options_cache.json"),
+        "LOG_FILE":            os.path.join(workdir, "nexus_trade_log.csv"),
+        "TRADE_DB":            os.path.join(workdir, "nexus_trades.db"),
+        "EARNINGS_CACHE":      os.path.join(workdir, ".earnings_cache.json"),
+        "METRICS_FILE":        os.path.join(workdir, "nexus_run_report.json"),
+        "UNIVERSE_FILE":       os.path.join(workdir, ".universe_cache.json"),
+        "SHARD_DIR":           os.path.join(workdir, ".shards"),
+        "MY_WATCHLIST":        tickers,
+        "is_market_gold_hour": lambda: True,
+    }
+    with contextlib.ExitStack() as stack:
+        for name, value in attrs.items():
+            stack.enter_context(mock.patch.object(sp, name, value))
+        stack.enter_context(mock.patch.dict(sp.CONFIG, overrides))
+        stack.enter_context(mock.patch.object(sp.snapshots, "root", os.path.join(workdir, ".snapshots")))
+        stack.enter_context(mock.patch.dict(
+            sp.SECTOR_MAP, {t: SECTORS[i % len(SECTORS)] for i, t in enumerate(tickers)}))
+        stack.enter_context(mock.patch.dict(sp.rate_limiters, {
+            "yahoo": sp.TokenBucket(yahoo_rate, max(1, int(yahoo_rate))),
+            "stooq": sp.TokenBucket(*sp.CONFIG["RATE_LIMITS"]["stooq"]),
+        }))
+        stack.enter_context(mock.patch.dict(sp.telegram_buckets, clear=True))
+        if sleep_scale != 1:
+            stack.enter_context(mock.patch.object(sp, "time", _ScaledTime(sleep_scale)))
+        sp.history_cache.clear()
+        sp.indicator_states.clear()
+        sp.universe_sectors.clear()
+        yield
+
+# ==============================
+# ⏱️ CASI
+# ==============================
+def _latency_stats(wall: float, latencies: list, n: int) -> dict:
+    lat = np.asarray(latencies) * 1000
+    return {
+        "n":                n,
+        "wall_s":           round(wall, 4),
+        "throughput_per_s": round(n / wall, 2) if wall > 0 else None,
+        "p50_ms":           round(float(np.percentile(lat, 50)), 3) if len(lat) else None,
+        "p95_ms":           round(float(np.percentile(lat, 95)), 3) if len(lat) else None,
+        "max_ms":           round(float(lat.max()), 3) if len(lat) else None,
+    }
+
+def _timed(fn, items) -> dict:
+    latencies = []
+    t0 = time.perf_counter()
+    for x in items:
+        s = time.perf_counter()
+        fn(x)
+        latencies.append(time.perf_counter() - s)
+    return _latency_stats(time.perf_counter() - t0, latencies, len(latencies))
+
+def _analysis_frames(market: FakeMarket, tickers: list) -> dict:
+    return {t: sp._analysis_window(market.frame(t)) for t in tickers}
+
+def bench_calc_adx(market: FakeMarket, tickers: list) -> dict:
+    frames = _analysis_frames(market, tickers)
+    return _timed(sp.calc_adx, frames.values())
+
+def bench_institutional_score(market: FakeMarket, tickers: list) -> dict:
+    frames = _analysis_frames(market, tickers)
+    spy    = sp._analysis_window(market.frame("SPY"))
+    return _timed(lambda df: sp.institutional_score(df, 0.05, spy), frames.values())
+
+def bench_analyze_ticker(market: FakeMarket, tickers: list) -> dict:
+    frames = _analysis_frames(market, tickers)
+    spy    = sp._analysis_window(market.frame("SPY"))
+    cal    = sp.load_earnings_cache()
+    return _timed(lambda t: sp.analyze_ticker(t, spy, set(), cal, frames[t]), tickers)
+
+def bench_main(market: FakeMarket, tickers: list) -> dict:
+    market.reset_stats()
+    t0 = time.perf_counter()
+    sp.main()
+    wall = time.perf_counter() - t0
+    fetch = [market.served[t] - market.first[t] for t in market.served if t in market.first]
+    out = _latency_stats(wall, fetch, len(tickers))
+    out["fetched"] = len(fetch)
+    out.update(sorted(market.counters.items()))
+    out["stages_s"] = {k: st["total_s"] for k, st in sp.metrics.to_dict()["stages"].items()}
+    return out
+
+RUNNERS = {
+    "calc_adx":            bench_calc_adx,
+    "institutional_score": bench_institutional_score,
+    "analyze_ticker":      bench_analyze_ticker,
+    "main_cold":           bench_main,
+    "main_warm":           bench_main,
+}
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except Exception:
+        return None
+
+def _run_case(case: str, size: int, workdir: str, opts: dict) -> dict:
+    """Eseguito in un processo figlio: fake upstream + sandbox, poi il caso richiesto."""
+    tickers = universe(size)
+    if case in MICRO:
+        tickers = tickers[:opts["micro_cap"]]
+    market = FakeMarket(bars=opts["bars"], latency=opts["latency"], fail_rate=opts["fail_rate"],
+                        earnings_rate=opts["earnings_rate"], seed=opts["seed"])
+    base_rss = _rss_mb()
+    out = io.StringIO() if not opts["verbose"] else sys.stdout
+    with market.patched(), sandbox(workdir, universe(size), opts["overrides"],
+                                   opts["sleep_scale"], opts["yahoo_rate"]), \
+            contextlib.redirect_stdout(out):
+        result = RUNNERS[case](market, tickers)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024    # KB su Linux
+    return {"case": case, "size": size, **result,
+            "base_rss_mb": base_rss, "peak_rss_mb": round(peak, 1)}
+
+def run_suite(sizes: list, cases: list, opts: dict) -> list:
+    ctx = multiprocessing.get_context("fork")
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="nexus-bench-") as workdir:
+            for case in cases:        # main_warm riusa lo store lasciato da main_cold
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    res = pool.submit(_run_case, case, size, workdir, opts).result()
+                results.append(res)
+                print(f"⏱️  {case:<20} {size:>6} ticker | {res['wall_s']:>8.2f}s | "
+                      f"{res['throughput_per_s'] or 0:>9.1f}/s | p95 {res['p95_ms'] or 0:>8.2f} ms | "
+                      f"RSS {res['peak_rss_mb']:.0f} MB", flush=True)
+    return results
+
+# ==============================
+# 📈 REPORT + BASELINE
+# ==============================
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=sp.BASE_DIR, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """Regressioni oltre la tolleranza: throughput giù, p95 o picco RSS su."""
+    base = {(r["case"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        b = base.get((r["case"], r["size"]))
+        if not b:
+            continue
+        for key, higher_better in (("throughput_per_s", True), ("p95_ms", False), ("peak_rss_mb", False)):
+            old, new = b.get(key), r.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_better else change) > tolerance:
+                regressions.append({"case": r["case"], "size": r["size"], "metric": key,
+                                    "baseline": old, "current": new, "change": round(change, 3)})
+    return regressions
+
+
+def _parse_override(spec: str) -> tuple:
+    key, _, raw = spec.partition("=")
+    if key not in sp.CONFIG:
+        raise argparse.ArgumentTypeError(f"chiave CONFIG sconosciuta: {key}")
+    try:
+        return key, json.loads(raw)
+    except ValueError:
+        return key, raw
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="NEXUS benchmark offline (upstream simulati)")
+    parser.add_argument("--sizes", default="250,2000,10000", help="dimensioni dell'universo sintetico")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"sottoinsieme di {','.join(CASES)}")
+    parser.add_argument("--micro-cap", type=int, default=1000,
+                        help="ticker massimi per i casi per-funzione (costo per chiamata indipendente da N)")
+    parser.add_argument("--bars", type=int, default=520, help="barre giornaliere per ticker (≈ 2y)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latenza per richiesta upstream")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="probabilità di 429 per richiesta")
+    parser.add_argument("--earnings-rate", type=float, default=0.03, help="quota di ticker con earnings oggi")
+    parser.add_argument("--yahoo-rate", type=float, default=1000.0,
+                        help="token/s del bucket yahoo (quello di produzione misura il rate limit, non il codice)")
+    parser.add_argument("--sleep-scale", type=float, default=1.0, help="fattore su time.sleep di scanner_pro")
+    parser.add_argument("--set", dest="overrides", type=_parse_override, action="append", default=[],
+                        help="override CONFIG, es. PANEL_ENGINE=false")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="mostra l'output dello scanner")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="JSON di un run precedente da confrontare")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="scarto relativo tollerato")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args  = parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    cases = [c for c in args.cases.split(",") if c]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        raise SystemExit(f"❌ Casi sconosciuti: {sorted(unknown)}")
+    if "main_warm" in cases and "main_cold" not in cases:
+        cases.insert(cases.index("main_warm"), "main_cold")
+    opts = {
+        "bars": args.bars, "latency": args.latency_ms / 1000, "fail_rate": args.fail_rate,
+        "earnings_rate": args.earnings_rate, "yahoo_rate": args.yahoo_rate,
+        "sleep_scale": args.sleep_scale, "micro_cap": args.micro_cap, "seed": args.seed,
+        "overrides": dict(args.overrides), "verbose": args.verbose,
+    }
+
+    print("=" * 70)
+    print(f"🏎️  NEXUS BENCH — sizes {sizes} | latency {args.latency_ms} ms | 429 {args.fail_rate:.0%}")
+    print("=" * 70)
+    t0 = time.time()
+    results = run_suite(sizes, cases, opts)
+    report = {
+        "meta": {
+            "created":  datetime.now().isoformat(timespec="seconds"),
+            "git":      _git_rev(),
+            "python":   platform.python_version(),
+            "numpy":    np.__version__,
+            "pandas":   pd.__version__,
+            "cpus":     os.cpu_count(),
+            "options":  {k: v for k, v in opts.items() if k != "verbose"},
+            "total_s":  round(time.time() - t0, 1),
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Risultati salvati in {args.out}")
+
+    for r in report.get("regressions", []):
+        print(f"   🔻 {r['case']} @ {r['size']}: {r['metric']} {r['baseline']} → {r['current']} "
+              f"({r['change']:+.0%})")
+    if report.get("regressions"):
+        sys.exit(1)
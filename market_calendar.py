@@ -0,0 +1,147 @@
+"""
+NEXUS — calendario NYSE e finestra Gold Hour, solo libreria standard.
+
+Festività e chiusure anticipate calcolate dalle regole NYSE (nessun download, nessuna
+dipendenza): il gate della Gold Hour gira prima di importare pandas/yfinance, quindi
+un run fuori sessione o in un giorno di borsa chiusa termina in pochi millisecondi.
+"""
+
+import functools
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+NY = ZoneInfo("America/New_York")
+
+SESSION_OPEN  = time(9, 30)
+REGULAR_CLOSE = time(16, 0)
+EARLY_CLOSE   = time(13, 0)
+GOLD_START    = time(10, 0)                # Gold Hour: 10:00 → chiusura − GOLD_END_MARGIN
+GOLD_END_MARGIN = timedelta(minutes=30)
+
+# chiusure straordinarie (lutti nazionali, eventi): non derivabili da regole
+SPECIAL_CLOSURES = {
+    date(2018, 12, 5): "National Day of Mourning (G.H.W. Bush)",
+    date(2025, 1, 9):  "National Day of Mourning (J. Carter)",
+}
+
+# ==============================
+# 📅 FESTIVITÀ NYSE
+# ==============================
+def _easter(year: int) -> date:
+    """Pasqua gregoriana (algoritmo anonimo di Meeus/Jones/Butcher)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """n-esimo `weekday` (0 = lunedì) del mese; n = -1 → ultimo."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+def _observed(d: date) -> date:
+    """Sabato → venerdì prima, domenica → lunedì dopo."""
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+@functools.lru_cache(maxsize=None)
+def nyse_holidays(year: int) -> dict:
+    """{data: nome} dei giorni di borsa chiusa dell'anno (weekend esclusi)."""
+    days = {
+        _nth_weekday(year, 1, 0, 3):  "Martin Luther King Jr. Day",
+        _nth_weekday(year, 2, 0, 3):  "Washington's Birthday",
+        _easter(year) - timedelta(days=2): "Good Friday",
+        _nth_weekday(year, 5, 0, -1): "Memorial Day",
+        _observed(date(year, 7, 4)):  "Independence Day",
+        _nth_weekday(year, 9, 0, 1):  "Labor Day",
+        _nth_weekday(year, 11, 3, 4): "Thanksgiving Day",
+        _observed(date(year, 12, 25)): "Christmas Day",
+    }
+    # Capodanno di sabato: nessun recupero il 31/12 (regola NYSE), di domenica → lunedì 2
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days[_observed(new_year)] = "New Year's Day"
+    if year >= 2022:
+        days[_observed(date(year, 6, 19))] = "Juneteenth"
+    days.update({d: name for d, name in SPECIAL_CLOSURES.items() if d.year == year})
+    return days
+
+@functools.lru_cache(maxsize=None)
+def early_closes(year: int) -> dict:
+    """{data: orario di chiusura} delle sedute ridotte (13:00 ET)."""
+    days = {_nth_weekday(year, 11, 3, 4) + timedelta(days=1): EARLY_CLOSE}   # venerdì dopo Thanksgiving
+    if date(year, 7, 4).weekday() in (1, 2, 3, 4):      # 3 luglio se il 4 cade mar–ven
+        days[date(year, 7, 3)] = EARLY_CLOSE
+    if date(year, 12, 24).weekday() in (0, 1, 2, 3):    # vigilia di Natale lun–gio
+        days[date(year, 12, 24)] = EARLY_CLOSE
+    return days
+
+def session(day: date):
+    """(apertura, chiusura) ET della seduta, None se la borsa è chiusa."""
+    if day.weekday() > 4 or day in nyse_holidays(day.year):
+        return None
+    return SESSION_OPEN, early_closes(day.year).get(day, REGULAR_CLOSE)
+
+# ==============================
+# ⏰ GOLD HOUR
+# ==============================
+def gold_hour(day: date):
+    """(inizio, fine) ET della Gold Hour del giorno, None se la borsa è chiusa."""
+    s = session(day)
+    if s is None:
+        return None
+    end = (datetime.combine(day, s[1]) - GOLD_END_MARGIN).time()
+    return GOLD_START, end
+
+def _now_ny(now: datetime = None) -> datetime:
+    if now is None:
+        return datetime.now(NY)
+    return now.astimezone(NY) if now.tzinfo else now.replace(tzinfo=NY)
+
+def gate_reason(now: datetime = None):
+    """None se `now` (default: adesso) è in Gold Hour, altrimenti il motivo per cui non lo è."""
+    now = _now_ny(now)
+    day = now.date()
+    if day.weekday() > 4:
+        return "Weekend — NYSE chiuso"
+    holiday = nyse_holidays(day.year).get(day)
+    if holiday:
+        return f"NYSE chiuso ({holiday})"
+    start, end = gold_hour(day)
+    if not start <= now.time() <= end:
+        early = " — seduta ridotta" if day in early_closes(day.year) else ""
+        return f"Outside Gold Hour ({start:%H:%M}–{end:%H:%M} ET{early})"
+    return None
+
+def in_gold_hour(now: datetime = None) -> bool:
+    return gate_reason(now) is None
+
+def next_gold_hour(now: datetime = None) -> datetime:
+    """Prossimo inizio di Gold Hour dopo `now` (ET, timezone-aware)."""
+    now = _now_ny(now)
+    for d in range(15):
+        day    = now.date() + timedelta(days=d)
+        window = gold_hour(day)
+        if window is None:
+            continue
+        opens = datetime.combine(day, window[0], tzinfo=NY)
+        if opens > now:
+            return opens
+    return now + timedelta(days=1)
+
+def seconds_to_gold_hour(now: datetime = None) -> float:
+    now = _now_ny(now)
+    return (next_gold_hour(now) - now).total_seconds()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+NEXUS — entry point veloce per cron / GitHub Actions.
+
+Stessi argomenti di scanner_pro.py. Per uno scan normale (nessun comando, al più
+--shard / --record) controlla prima la Gold Hour sul calendario NYSE con la sola
+libreria standard: fuori sessione, nel weekend o in un giorno festivo esce subito,
+senza importare pandas, numpy, yfinance e requests. Solo se lo scan partirà davvero
+carica scanner_pro e gli passa gli argomenti.
+
+  python nexus.py                      # scan (gate veloce)
+  python nexus.py --profile-imports    # + tempi di import dello stack dati/analisi
+  python nexus.py --backfill           # qualsiasi comando di scanner_pro (nessun gate)
+"""
+
+import importlib
+import sys
+import time
+
+_T0 = time.perf_counter()
+
+import market_calendar
+
+HEAVY_MODULES = ("numpy", "pandas", "requests", "pytz", "yfinance", "scanner_pro")
+SCAN_OPTIONS  = {"--shard": True, "--record": False}    # opzione → prende un valore
+
+def is_plain_scan(argv: list) -> bool:
+    """True se gli argomenti portano a main() di scanner_pro (quindi al gate Gold Hour)."""
+    expect_value = False
+    for arg in argv:
+        if expect_value:
+            expect_value = False
+            continue
+        name = arg.split("=", 1)[0]
+        if name not in SCAN_OPTIONS:
+            return False
+        expect_value = SCAN_OPTIONS[name] and "=" not in arg
+    return True
+
+def load_scanner(profile: bool = False):
+    """Importa scanner_pro; con profile stampa il costo di import di ogni modulo dello stack."""
+    if not profile:
+        return importlib.import_module("scanner_pro")
+    rows, total = [], 0.0
+    for name in HEAVY_MODULES:
+        t0 = time.perf_counter()
+        importlib.import_module(name)
+        dt = time.perf_counter() - t0
+        rows.append((name, dt))
+        total += dt
+    print("📦 Import (incrementale, nell'ordine):")
+    for name, dt in rows:
+        print(f"   {name:<12} {dt * 1000:8.1f} ms")
+    print(f"   {'totale':<12} {total * 1000:8.1f} ms")
+    return sys.modules["scanner_pro"]
+
+def main(argv: list = None) -> int:
+    argv    = list(sys.argv[1:] if argv is None else argv)
+    profile = "--profile-imports" in argv
+    argv    = [a for a in argv if a != "--profile-imports"]
+
+    if is_plain_scan(argv):
+        reason = market_calendar.gate_reason()
+        if reason:
+            print(f"⏰ {reason}. Exiting. ({(time.perf_counter() - _T0) * 1000:.1f} ms, nessun import pesante)")
+            return 0
+    if profile:
+        print(f"⏱️  Avvio + gate: {(time.perf_counter() - _T0) * 1000:.1f} ms")
+    load_scanner(profile).cli(argv)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
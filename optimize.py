@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+NEXUS OPTIMIZE — sweep delle soglie CONFIG sulle feature del backtest
+  ✅ Feature calcolate una sola volta (compute_features per blocco di ticker, in parallelo)
+  ✅ Candidati pre-filtrati con le soglie più larghe della griglia → tabella 1-D compatta
+  ✅ Esiti stop/target pre-risolti per ogni coppia (stop_atr, target_r)
+  ✅ Combinazioni valutate su più core, tabella dei candidati in shared_memory
+  ✅ Modalità grid / random / walk-forward → classifica ordinata per metrica
+
+Uso:
+  python optimize.py --mode grid --out sweep.csv
+  python optimize.py --mode random --samples 2000 --param min_adx=18,20,22,25,28
+  python optimize.py --mode walkforward --train-years 3 --test-years 1
+
+Le soglie vincenti vanno riportate in CONFIG (MIN_IFS_SCORE, MIN_ADX, VOL_TRIGGER,
+VOLUME_DRYUP_RATIO, STOP_ATR_MULT, TARGET_R_MULT). Nel walk-forward un trade del periodo
+di train può chiudersi con prezzi del periodo di test (max_hold barre a cavallo).
+"""
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import backtest as bt
+import scanner_pro as sp
+
+DEFAULT_GRID = {
+    "min_ifs":     [4, 5, 6, 7],
+    "min_adx":     [18, 20, 22, 25, 28, 30],
+    "vol_trigger": [1.2, 1.5, 1.8, 2.0, 2.5],
+    "dryup_ratio": [0.4, 0.5, 0.6, 0.7],
+    "stop_atr":    [1.0, 1.5, 2.0],
+    "target_r":    [1.5, 2.0, 2.5, 3.0],
+}
+METRICS = ("total_r", "avg_r", "profit_factor", "win_rate")
+SECTORS = sorted(set(sp.SECTOR_MAP.values()) | {"Other"})
+OUTCOME_CODES = {"stop": 0, "target": 1, "expired": 2, "open": 3}
+
+# ==============================
+# 🧠 CANDIDATI (un passaggio sui dati)
+# ==============================
+def _loose_params(grid: dict) -> dict:
+    """Soglie più permissive della griglia: ogni combinazione è un sottoinsieme di questi segnali."""
+    return {
+        "min_ifs":     min(grid["min_ifs"]),
+        "min_adx":     min(grid["min_adx"]),
+        "vol_trigger": min(grid["vol_trigger"]),
+        "dryup_ratio": max(grid["dryup_ratio"]),
+    }
+
+def _candidates_chunk(tickers: list, grid: dict, pairs: list, start, end, max_hold: int,
+                      spy_df: pd.DataFrame = None):
+    panel = bt._load_chunk(tickers, spy_df)
+    if not panel["tickers"]:
+        return None
+    feat  = bt.compute_features(panel, bt._spy_close(spy_df))
+    mask, _ = bt.signal_mask(feat, _loose_params(grid))
+    dates = feat["dates"]
+    mask &= np.asarray((dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end)))[:, None]
+    rows, cols = np.nonzero(mask)
+    if not len(rows):
+        return None
+
+    entry = feat["close"][rows, cols]
+    atr   = feat["atr"][rows, cols]
+    r     = np.empty((len(rows), len(pairs)))
+    code  = np.empty((len(rows), len(pairs)), dtype=np.int8)
+    held  = np.empty((len(rows), len(pairs)), dtype=np.int32)
+    for k, (stop_atr, target_r) in enumerate(pairs):
+        stop   = entry - atr * stop_atr
+        risk   = entry - stop
+        target = entry + risk * target_r
+        out    = bt.resolve_trades(feat["high"], feat["low"], feat["close"], rows, cols, stop, target, max_hold)
+        r[:, k]    = (out["exit"] - entry) / risk
+        code[:, k] = [OUTCOME_CODES[o] for o in out["outcome"]]
+        held[:, k] = out["held"]
+
+    tickers = np.asarray(feat["tickers"])[cols]
+    return {
+        "day":       dates[rows].to_numpy().astype("datetime64[D]").astype(np.int64),
+        "sector":    np.array([SECTORS.index(sp.SECTOR_MAP.get(t, "Other")) for t in tickers], dtype=np.int64),
+        "vol_ratio": feat["vol_ratio"][rows, cols],
+        "adx":       feat["adx"][rows, cols],
+        "rs":        np.round(feat["rs"][rows, cols] * 100, 1),   # come in select_daily
+        "ifs_base":  feat["ifs_base"][rows, cols].astype(np.int64),
+        "dry_feat":  feat["dry_feat"][rows, cols],
+        "r": r, "code": code, "held": held,
+    }
+
+def build_candidates(tickers: list, grid: dict, pairs: list, start, end, max_hold: int,
+                     workers: int = None, chunk_size: int = 32) -> dict:
+    """Feature + esiti per tutti i ticker, concatenati nell'ordine di run_backtest."""
+    chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+    n = len(chunks)
+    with bt.shared_store_panel(tickers) as shared, \
+         ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             initializer=bt._attach_panel, initargs=(shared.spec,)) as pool:
+        parts = [p for p in pool.map(_candidates_chunk, chunks, [grid] * n, [pairs] * n,
+                                     [start] * n, [end] * n, [max_hold] * n) if p]
+    if not parts:
+        return {}
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+def _sort_orders(cands: dict, dryups: list) -> np.ndarray:
+    """Per ogni dryup_ratio: ordine (data ↑, ifs ↓, rs ↓) stabile, come select_daily."""
+    orders = []
+    for d in dryups:
+        ifs = cands["ifs_base"] + (cands["dry_feat"] < d)
+        orders.append(np.lexsort((-cands["rs"], -ifs, cands["day"])))
+    return np.stack(orders)
+
+# ==============================
+# 🧩 SHARED MEMORY
+# ==============================
+def _share(arrays: dict) -> tuple:
+    """Copia gli array in blocchi shared_memory; ritorna (blocchi, spec per i worker)."""
+    blocks, specs = [], {}
+    for name, a in arrays.items():
+        a   = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, a.dtype, buffer=shm.buf)[...] = a
+        blocks.append(shm)
+        specs[name] = (shm.name, a.shape, a.dtype.str)
+    return blocks, specs
+
+_shared: dict = {}
+
+def _attach(specs: dict, meta: dict):
+    """Initializer dei worker: viste numpy sui blocchi condivisi (nessuna copia)."""
+    _shared["blocks"] = []
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shared["blocks"].append(shm)
+        _shared[name] = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+    _shared.update(meta)
+
+# ==============================
+# ⚙️ VALUTAZIONE
+# ==============================
+def _cumcount(keys: np.ndarray) -> np.ndarray:
+    """Posizione di ogni elemento tra quelli con la stessa chiave, nell'ordine dato (groupby.cumcount)."""
+    order = np.argsort(keys, kind="stable")
+    sk    = keys[order]
+    idx   = np.arange(len(sk))
+    start = np.ones(len(sk), dtype=bool)
+    start[1:] = sk[1:] != sk[:-1]
+    out = np.empty(len(keys), dtype=np.int64)
+    out[order] = idx - np.maximum.accumulate(np.where(start, idx, 0))
+    return out
+
+def _stats(r: np.ndarray, code: np.ndarray, held: np.ndarray) -> dict:
+    """Stesse metriche di backtest.summarize, su array già in ordine cronologico."""
+    closed = code != OUTCOME_CODES["open"]
+    rc     = r[closed]
+    losses = -rc[rc < 0].sum()
+    equity = np.cumsum(rc)
+    return {
+        "trades":        int(len(r)),
+        "closed":        int(closed.sum()),
+        "win_rate":      float((code[closed] == OUTCOME_CODES["target"]).mean()) if len(rc) else np.nan,
+        "avg_r":         float(rc.mean()) if len(rc) else np.nan,
+        "total_r":       float(rc.sum()),
+        "profit_factor": float(rc[rc > 0].sum() / losses) if losses > 0 else np.nan,
+        "max_dd_r":      float((np.maximum.accumulate(equity) - equity).max()) if len(rc) else 0.0,
+        "avg_held":      float(held.mean()) if len(held) else np.nan,
+    }
+
+def _evaluate(params: dict, lo: int, hi: int) -> dict:
+    t   = _shared
+    o   = t["order"][t["dryups"].index(params["dryup_ratio"])]
+    day = t["day"][o]
+    ifs = t["ifs_base"][o] + (t["dry_feat"][o] < params["dryup_ratio"])
+    with np.errstate(invalid="ignore"):
+        m = ((day >= lo) & (day < hi)
+             & (t["vol_ratio"][o] > params["vol_trigger"])
+             & sp.not_below(t["adx"][o], params["min_adx"])
+             & (ifs >= params["min_ifs"]))
+    sel, day = o[m], day[m]
+    keep     = _cumcount(day * len(SECTORS) + t["sector"][sel]) < t["max_per_sector"]
+    sel, day = sel[keep], day[keep]
+    sel      = sel[_cumcount(day) < t["max_alerts"]]
+    k = t["pairs"].index((params["stop_atr"], params["target_r"]))
+    return _stats(t["r"][sel, k], t["code"][sel, k], t["held"][sel, k])
+
+def _evaluate_batch(combos: list, lo: int, hi: int) -> list:
+    return [_evaluate(p, lo, hi) for p in combos]
+
+def evaluate_all(pool: ProcessPoolExecutor, combos: list, lo: int, hi: int,
+                 batch: int = 64) -> pd.DataFrame:
+    batches = [combos[i:i + batch] for i in range(0, len(combos), batch)]
+    n = len(batches)
+    stats = [s for part in pool.map(_evaluate_batch, batches, [lo] * n, [hi] * n) for s in part]
+    return pd.concat([pd.DataFrame(combos), pd.DataFrame(stats)], axis=1)
+
+def rank(table: pd.DataFrame, metric: str, min_trades: int) -> pd.DataFrame:
+    ok = table[table["closed"] >= min_trades]
+    return ok.sort_values([metric, "trades"], ascending=False, kind="stable").reset_index(drop=True)
+
+# ==============================
+# 🔀 COMBINAZIONI
+# ==============================
+def grid_combos(grid: dict) -> list:
+    keys = list(grid)
+    return [dict(zip(keys, vals)) for vals in itertools.product(*grid.values())]
+
+def random_combos(grid: dict, samples: int, seed: int = 0) -> list:
+    """Campione senza ripetizioni del prodotto cartesiano (senza materializzarlo)."""
+    keys  = list(grid)
+    sizes = [len(grid[k]) for k in keys]
+    total = int(np.prod(sizes))
+    picks = np.random.default_rng(seed).choice(total, size=min(samples, total), replace=False)
+    idx   = np.unravel_index(np.sort(picks), sizes)
+    return [{k: grid[k][int(i[j])] for k, i in zip(keys, idx)} for j in range(len(picks))]
+
+def walk_forward_folds(days: np.ndarray, train_years: int, test_years: int) -> list:
+    """Finestre annuali scorrevoli: train [Y−train, Y), test [Y, Y+test), in giorni epoch."""
+    years = pd.to_datetime(days.astype("datetime64[D]")).year
+    first, last = int(years.min()), int(years.max())
+    to_day = lambda y: int(np.datetime64(f"{y}-01-01", "D").astype(np.int64))
+    return [(to_day(y - train_years), to_day(y), to_day(y), to_day(y + test_years))
+            for y in range(first + train_years, last + 1, test_years)]
+
+def _day_str(day: int) -> str:
+    return str(np.datetime64(day, "D"))
+
+def walk_forward(pool: ProcessPoolExecutor, combos: list, days: np.ndarray, train_years: int,
+                 test_years: int, metric: str, min_trades: int) -> pd.DataFrame:
+    """Per ogni fold: migliore combinazione in-sample, poi la stessa misurata out-of-sample."""
+    rows = []
+    for tr_lo, tr_hi, te_lo, te_hi in walk_forward_folds(days, train_years, test_years):
+        ranked = rank(evaluate_all(pool, combos, tr_lo, tr_hi), metric, min_trades)
+        if ranked.empty:
+            print(f"   ⚠️  {_day_str(te_lo)[:4]}: nessuna combinazione con ≥ {min_trades} trade in-sample")
+            continue
+        best = {k: ranked.iloc[0][k] for k in combos[0]}
+        test = evaluate_all(pool, [best], te_lo, te_hi).iloc[0]
+        rows.append({
+            "train": f"{_day_str(tr_lo)}→{_day_str(tr_hi - 1)}",
+            "test":  f"{_day_str(te_lo)}→{_day_str(te_hi - 1)}",
+            **best,
+            f"is_{metric}": ranked.iloc[0][metric],
+            "oos_trades":   test["trades"],
+            "oos_total_r":  test["total_r"],
+            "oos_avg_r":    test["avg_r"],
+            "oos_win_rate": test["win_rate"],
+        })
+    return pd.DataFrame(rows)
+
+# ==============================
+# 🚀 SWEEP
+# ==============================
+def run_sweep(tickers: list, grid: dict, mode: str = "grid", samples: int = 1000, seed: int = 0,
+              metric: str = "total_r", min_trades: int = 30, start="2000-01-01", end="2100-01-01",
+              workers: int = None, max_hold: int = 60, train_years: int = 3,
+              test_years: int = 1) -> pd.DataFrame:
+    pairs = list(itertools.product(grid["stop_atr"], grid["target_r"]))
+    t0 = time.time()
+    cands = build_candidates(tickers, grid, pairs, start, end, max_hold, workers)
+    if not cands:
+        print("🧪 Nessun candidato nel periodo")
+        return pd.DataFrame()
+    print(f"🧠 Candidati: {len(cands['day'])} (soglie larghe) | {len(pairs)} coppie stop/target "
+          f"| {time.time() - t0:.1f}s")
+
+    combos = grid_combos(grid) if mode != "random" else random_combos(grid, samples, seed)
+    arrays = dict(cands)
+    arrays["order"] = _sort_orders(cands, list(grid["dryup_ratio"]))
+    meta = {"dryups": list(grid["dryup_ratio"]), "pairs": pairs,
+            "max_per_sector": sp.CONFIG["MAX_PER_SECTOR"], "max_alerts": sp.CONFIG["MAX_ALERTS"]}
+    blocks, specs = _share(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 initializer=_attach, initargs=(specs, meta)) as pool:
+            t1 = time.time()
+            if mode == "walkforward":
+                out = walk_forward(pool, combos, cands["day"], train_years, test_years, metric, min_trades)
+            else:
+                lo, hi = int(cands["day"].min()), int(cands["day"].max()) + 1
+                out = rank(evaluate_all(pool, combos, lo, hi), metric, min_trades)
+            print(f"⚙️  {len(combos)} combinazioni valutate in {time.time() - t1:.1f}s")
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return out
+
+
+def _parse_param(spec: str) -> tuple:
+    name, _, values = spec.partition("=")
+    if name not in DEFAULT_GRID or not values:
+        raise argparse.ArgumentTypeError(f"atteso nome=v1,v2,... con nome in {list(DEFAULT_GRID)}")
+    cast = int if name == "min_ifs" else float
+    return name, [cast(v) for v in values.split(",")]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="NEXUS sweep parametri (feature del backtest riusate)")
+    parser.add_argument("--mode", choices=("grid", "random", "walkforward"), default="grid")
+    parser.add_argument("--param", type=_parse_param, action="append", default=[],
+                        help="sostituisce i valori di un parametro, es. min_adx=20,22,25")
+    parser.add_argument("--samples", type=int, default=1000, help="combinazioni in modalità random")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metric", choices=METRICS, default="total_r")
+    parser.add_argument("--min-trades", type=int, default=30, help="trade chiusi minimi per entrare in classifica")
+    parser.add_argument("--start", default="2000-01-01")
+    parser.add_argument("--end", default="2100-01-01")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-hold", type=int, default=60, help="barre massime in posizione")
+    parser.add_argument("--train-years", type=int, default=3)
+    parser.add_argument("--test-years", type=int, default=1)
+    parser.add_argument("--top", type=int, default=20, help="righe della classifica a video")
+    parser.add_argument("--out", default=None, help="CSV con la classifica completa")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    grid = {**DEFAULT_GRID, **dict(args.param)}
+    t0 = time.time()
+    table = run_sweep(sp.MY_WATCHLIST, grid, mode=args.mode, samples=args.samples, seed=args.seed,
+                      metric=args.metric, min_trades=args.min_trades, start=args.start, end=args.end,
+                      workers=args.workers, max_hold=args.max_hold,
+                      train_years=args.train_years, test_years=args.test_years)
+    print("=" * 70)
+    print(f"🔬 NEXUS OPTIMIZE [{args.mode}] — {len(sp.MY_WATCHLIST)} ticker | {time.time() - t0:.1f}s")
+    print("=" * 70)
+    if table.empty:
+        print("Nessun risultato (alzare il periodo o abbassare --min-trades)")
+    else:
+        print(table.head(args.top).round(3).to_string(index=False))
+        if args.mode == "walkforward":
+            print(f"\n   OOS totale: {int(table['oos_trades'].sum())} trade | "
+                  f"{table['oos_total_r'].sum():.2f} R")
+    if args.out and not table.empty:
+        table.to_csv(args.out, index=False)
+        print(f"💾 Classifica salvata in {args.out}")
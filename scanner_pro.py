@@ -19,9 +19,29 @@ import time
 import os
 import json
 import random
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from collections import defaultdict
+import argparse
+import asyncio
+import threading
+import signal
+import traceback
+import sqlite3
+import bisect
+import contextlib
+import functools
+import math
+from abc import ABC, abstractmethod
+import io
+import zlib
+import glob
+import shutil
+import hashlib
+from datetime import datetime, timedelta
+import queue
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from collections import ChainMap, defaultdict, deque
+import multiprocessing
+from multiprocessing import shared_memory
+import market_calendar
 
 warnings.filterwarnings("ignore")
 import urllib3
@@ -48,8 +68,23 @@ TELEGRAM_TOKEN   = os.getenv("TELEGRAM_TOKEN",   "YOUR_TOKEN_HERE")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "YOUR_CHAT_ID_HERE")
 
 BASE_DIR       = os.path.dirname(os.path.abspath(__file__))
-LOG_FILE       = os.path.join(BASE_DIR, "nexus_trade_log.csv")
+LOG_FILE       = os.path.join(BASE_DIR, "nexus_trade_log.csv")      # formato legacy / export
+TRADE_DB       = os.path.join(BASE_DIR, "nexus_trades.db")
 EARNINGS_CACHE = os.path.join(BASE_DIR, ".earnings_cache.json")
+STORE_DIR      = os.path.join(BASE_DIR, ".ohlcv_store")
+METRICS_FILE   = os.path.join(BASE_DIR, "nexus_run_report.json")
+PROM_TEXTFILE  = os.getenv("NEXUS_PROM_TEXTFILE")   # es. /var/lib/node_exporter/nexus.prom
+STORE_INDEX    = os.path.join(STORE_DIR, "index.json")
+PROXIMITY_FILE = os.path.join(STORE_DIR, "proximity.json")
+VOLUME_PROFILE_FILE = os.path.join(STORE_DIR, "volume_profiles.json")
+UNIVERSE_FILE  = os.path.join(BASE_DIR, ".universe_cache.json")
+SHARD_DIR      = os.path.join(BASE_DIR, ".shards")
+SNAPSHOT_DIR   = os.path.join(BASE_DIR, ".snapshots")
+OPTIONS_CACHE  = os.path.join(STORE_DIR, "options_cache.json")
+
+indicator_states: dict = {}   # ticker → IndicatorState (ultima barra chiusa)
+universe_sectors: dict = {}   # ticker → settore dell'universo corrente (fallback SECTOR_MAP)
+history_cache: dict    = {}   # ticker → storico chiuso già letto/scritto (caldo in --daemon)
 
 CONFIG = {
     "TOTAL_EQUITY":            100_000,
@@ -58,15 +93,259 @@ CONFIG = {
     "MIN_VOLUME_USD":          1_000_000,
     "MAX_ALERTS":              7,
     "MIN_IFS_SCORE":           5,        # ora su scala 10 con i 3 nuovi filtri
-    "MIN_ADX":                 22,       # ADX minimo (semaforo trend)
+    "MIN_ADX":                 25,       # ADX minimo (semaforo trend, regola v14.5)
     "VOLUME_DRYUP_RATIO":      0.5,      # volume dry-up: giorni precedenti < 50% media
+    "VOL_TRIGGER":             1.5,      # breakout: vol_ratio > trigger
+    "STOP_ATR_MULT":           1.5,      # stop = prezzo − mult·ATR
+    "TARGET_R_MULT":           2.5,      # target = prezzo + mult·rischio
+    "SIGNAL_RULES": [                    # filtri in AND: (nome, feature, op, soglia | chiave CONFIG | feature)
+        ("liquid",     "dollar_vol", ">=", "MIN_VOLUME_USD"),
+        ("resistance", "price",      ">",  "resistance"),
+        ("breakout",   "vol_ratio",  ">",  "VOL_TRIGGER"),
+        ("adx",        "adx",        "!<", "MIN_ADX"),           # "!<" = non sotto soglia: ADX NaN passa (v14.5)
+        ("ifs",        "ifs",        ">=", "MIN_IFS_SCORE"),
+    ],
+    "IFS_RULES": [                       # componenti IFS: (nome, feature, op, soglia, punti)
+        ("c_accum",   "accum_days",  ">=", 3,    2),    # 3/5 giorni sopra la media 20gg
+        ("c_vcp",     "vcp_gap",     ">",  0,    2),    # range 5gg < range 20gg
+        ("c_rs",      "rs_val",      ">",  0,    2),    # sovraperformance SPY 63gg
+        ("c_close",   "close_pos",   ">",  0.75, 1),    # chiusura nel top 25% del range
+        ("c_rs_high", "rs_line_gap", ">",  0,    2),    # RS line su nuovo max 20gg
+        ("c_dryup",   "dry_days",    ">=", 2,    1),    # 2/3 gg pre-breakout < VOLUME_DRYUP_RATIO·media
+    ],
+    "RULE_ORDER":              "cost",   # "cost" = costo / (1 − pass rate osservato), "declared" = come sopra
     "MAX_PER_SECTOR":          2,
+    "STRATEGIES": {                      # registro: nome → soglie/selezione (STRATEGY_PARAMS), "rules",
+                                         # "universe" (all | curated | screened | [ticker]), "sectors", "chat"
+        "v14.5":        {},                                      # regole correnti, TELEGRAM_CHAT_ID
+        "midcap_loose": {"universe": "screened", "chat": "TELEGRAM_CHAT_ID_MIDCAP",
+                         "MIN_IFS_SCORE": 4, "MIN_ADX": 20, "VOL_TRIGGER": 1.3, "MAX_ALERTS": 5},
+        "adx_strict":   {"chat": "TELEGRAM_CHAT_ID_ADX",
+                         "MIN_ADX": 35, "MIN_IFS_SCORE": 6, "MAX_PER_SECTOR": 1, "MAX_ALERTS": 3},
+    },
+    "ACTIVE_STRATEGIES":       ["v14.5"],  # valutate sullo stesso passaggio dati; la prima è la primaria
+    "OUTCOME_TRACKING":        True,     # esiti dei segnali (target/stop/expired, MFE/MAE) a fine scan
+    "OUTCOME_MAX_HOLD":        60,       # barre dopo l'alert prima di "expired" (= backtest --max-hold)
+    "OPTIONS_CONFIRM":         True,     # catene opzioni dei soli finalisti → label / strike reali
+    "OPTIONS_EXPIRIES":        2,        # scadenze più vicine analizzate per ticker
+    "OPTIONS_MIN_DTE":         2,        # scadenze a meno di N giorni ignorate
+    "OPTIONS_OTM_PCT":         0.05,     # strike call suggerito: +5% OTM
+    "OPTIONS_MIN_OI":          100,      # strike "liquido": open interest minimo (e bid > 0)
+    "OPTIONS_SWEEP_VOL_OI":    0.5,      # OPTION SWEEP: volume call / OI ≥ soglia …
+    "OPTIONS_SWEEP_SKEW":      2.0,      # … e volume call / put ≥ soglia
+    "OPTIONS_CACHE_TTL":       900,      # validità di una catena in cache (s)
+    "OPTIONS_CONCURRENCY":     4,        # finalisti scaricati in parallelo
+    "OPTIONS_TIMEOUT":         20,       # attesa max dello stage (s); oltre → label dal volume azioni
     "EARNINGS_LOOKBACK_DAYS":  1,
     "EARNINGS_LOOKAHEAD_DAYS": 1,
+    "EARNINGS_TTL_DAYS":       7,        # validità di una data earnings nota
+    "EARNINGS_NEG_TTL_DAYS":   3,        # validità di "nessuna data nota" (negative cache)
+    "EARNINGS_CONCURRENCY":    4,        # richieste calendar in parallelo nel prefetch
+    "EARNINGS_REFRESH_TIMEOUT": 60,      # attesa max del refresh in background a fine run (s)
+    "EARNINGS_PREFETCH_TIMEOUT": 20,     # attesa max dei calendari mancanti prima dello scan (s)
     "YF_RETRIES":              3,
-    "YF_RETRY_DELAY":          15,
+    "BATCH_DOWNLOAD":          True,     # scarica la watchlist a blocchi (multi-ticker)
+    "BATCH_SIZE":              50,       # ticker per singola chiamata yf.download
+    "BATCH_PAUSE":             1.0,      # pausa (s) tra un blocco e il successivo
+    "STORE_ENABLED":           True,     # storico OHLCV locale + download incrementale
+    "STORE_BACKFILL_PERIOD":   "2y",     # periodo scaricato per backfill / refetch completo
+    "STORE_OVERLAP_DAYS":      7,        # giorni già in archivio riscaricati per il controllo split
+    "STORE_ADJ_TOLERANCE":     1e-4,     # scarto relativo max su Close prima di forzare il refetch
+    "STORE_ANALYSIS_DAYS":     365,      # finestra passata all'analisi (= period "1y")
+    "ASYNC_FETCH":             True,     # fetch asincrono con token bucket + concorrenza AIMD
+    "FETCH_START_CONCURRENCY": 4,
+    "FETCH_MIN_CONCURRENCY":   1,
+    "FETCH_MAX_CONCURRENCY":   16,       # = dimensione pool HTTP della session
+    "RATE_LIMITS":             {"yahoo": (8.0, 8), "stooq": (2.0, 2),    # (token/s, burst) per host
+                                "telegram": (1.0, 1)},                   # Telegram: ~1 msg/s per chat
+    "PROVIDERS":               ["yahoo", "stooq"],  # ordine delle sorgenti; "local" = LOCAL_DATA_DIR (test)
+    "HEDGE_AFTER_S":           4.0,      # sorgente successiva in gara dopo N s senza risposta (None = off)
+    "PROVIDER_TIMEOUT":        30.0,     # latenza massima di una richiesta, hedging incluso (s)
+    "BREAKER_FAILURES":        5,        # errori consecutivi che aprono il circuito di un provider
+    "BREAKER_COOLDOWN":        120,      # secondi a circuito aperto prima della richiesta di prova
+    "BACKOFF_BASE":            2.0,      # backoff esponenziale con jitter dopo un 429 (s)
+    "BACKOFF_CAP":             60.0,     # attesa massima per singolo retry (s)
+    "PROXIMITY_INDEX":         True,     # analisi completa solo per i ticker vicini al breakout
+    "PROXIMITY_ATR_BAND":      0.25,     # prezzo snapshot ≥ resistenza − banda·ATR
+    "PROXIMITY_VOL_BAND":      0.9,      # volume snapshot ≥ banda · volume richiesto
+    "INTRADAY_MODE":           True,     # barra di oggi da 5m con volume proiettato a fine giornata
+    "INTRADAY_PROFILE_PERIOD": "1mo",    # storico 5m usato per il profilo volume di ogni ticker
+    "INTRADAY_PROFILE_TTL_DAYS": 7,      # validità di un profilo volume
+    "INTRADAY_PROFILE_BATCH":  100,      # profili ricostruiti per run (gli altri: profilo mediano)
+    "INTRADAY_MIN_FRACTION":   0.05,     # frazione di giornata minima usata nella proiezione
+    "DAEMON_INTERVAL":         300,      # secondi tra due scan in --daemon
+    "DAEMON_IDLE_MAX_SLEEP":   1800,     # fuori Gold Hour: ricontrolla almeno ogni 30 min
+    "PANEL_ENGINE":            True,     # indicatori vettoriali su pannello date × ticker
+    "STREAM_PIPELINE":         True,     # scan a stadi (fetch → parse → scoring) collegati da code
+    "PIPELINE_BLOCK":          50,       # ticker per blocco in uscita dal fetch
+    "PIPELINE_QUEUE":          2,        # blocchi in attesa tra due stadi (backpressure)
+    "PIPELINE_PARSERS":        2,        # thread di normalizzazione
+    "PIPELINE_SCORERS":        None,     # processi di scoring (None = tutti i core, 1 = in-process)
+    "INCREMENTAL_STATE":       True,     # stato ADX/ATR persistito nello store (O(1) per barra)
+    "UNIVERSE_SOURCES":        ["watchlist"],  # "watchlist" | URL tabella HTML | CSV locale
+    # es. ["https://en.wikipedia.org/wiki/List_of_S%26P_400_companies",
+    #      "https://en.wikipedia.org/wiki/List_of_S%26P_600_companies"]
+    "UNIVERSE_TTL_DAYS":       7,        # validità della tabella costituenti in cache
+    "UNIVERSE_MIN_MCAP":       2e9,      # market cap minima (non applicata alla watchlist curata)
+    "UNIVERSE_MAX_MCAP":       20e9,     # market cap massima: niente mega-cap
+    "UNIVERSE_MIN_DOLLAR_VOL": 20e6,     # controvalore medio giornaliero minimo ($)
+    "UNIVERSE_CONCURRENCY":    8,        # richieste fast_info in parallelo durante il build
+    "SHARD_MAX_AGE_MIN":       30,       # --merge ignora i file shard più vecchi (min)
+    "SNAPSHOT_RECORD":         False,    # registra gli input di ogni scan in SNAPSHOT_DIR (anche --record)
+    "SNAPSHOT_KEEP_DAYS":      14,       # giorni di snapshot conservati
+    "TELEGRAM_DIGEST":         False,    # True: tutti i segnali selezionati in un solo messaggio
+    "TELEGRAM_RETRIES":        3,        # tentativi per messaggio dopo un 429 (rispetta retry_after)
+    "TELEGRAM_FLUSH_TIMEOUT":  60,       # attesa max della coda di invio a fine run (s)
+    "METRICS_ENABLED":         True,     # timing per stage, contatori e funnel → report JSON
+    "METRICS_SAMPLE_RATE":     1.0,      # frazione di chiamate cronometrate (contatori sempre esatti)
 }
 
+# pool HTTP dimensionato sulla concorrenza massima del fetch
+session.mount("https://", requests.adapters.HTTPAdapter(
+    pool_connections=8, pool_maxsize=CONFIG["FETCH_MAX_CONCURRENCY"]))
+
+# ==============================
+# 📊 TELEMETRIA (stage, contatori, funnel)
+# ==============================
+class RunMetrics:
+    """
+    Telemetria di un run: istogrammi di latenza per stage, contatori (retry, 429, byte)
+    e funnel dei candidati. Thread-safe; con sample_rate < 1 viene cronometrata solo
+    una frazione delle chiamate, contatori e funnel restano esatti.
+    """
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    FUNNEL  = ("scanned", "liquid", "breakout", "adx", "ifs", "sector_cap", "sent")
+
+    def __init__(self, enabled: bool = True, sample_rate: float = 1.0):
+        self.enabled     = enabled
+        self.sample_rate = sample_rate
+        self._lock       = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started  = time.time()
+            self.stages   = {}
+            self.counters = defaultdict(float)
+            self.funnel   = dict.fromkeys(self.FUNNEL, 0)
+
+    def _sampled(self) -> bool:
+        return self.enabled and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            st = self.stages.get(stage)
+            if st is None:
+                st = self.stages[stage] = {"count": 0, "sum": 0.0, "max": 0.0,
+                                           "buckets": [0] * (len(self.BUCKETS) + 1)}
+            st["count"] += 1
+            st["sum"]   += seconds
+            st["max"]    = max(st["max"], seconds)
+            st["buckets"][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+
+    @contextlib.contextmanager
+    def timer(self, stage: str):
+        if not self._sampled():
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def timed(self, stage: str):
+        """Decoratore: ogni chiamata (campionata) della funzione finisce nell'istogramma `stage`."""
+        def deco(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self._sampled():
+                    return fn(*args, **kwargs)
+                t0 = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - t0)
+            return wrapper
+        return deco
+
+    def incr(self, name: str, n: float = 1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def funnel_add(self, step: str, n: int = 1):
+        if self.enabled:
+            with self._lock:
+                self.funnel[step] += int(n)
+
+    def _quantile(self, st: dict, q: float) -> float:
+        """Limite superiore del bucket che contiene il quantile q (mai oltre il max osservato)."""
+        seen = 0
+        for i, n in enumerate(st["buckets"]):
+            seen += n
+            if n and seen >= q * st["count"]:
+                return min(self.BUCKETS[i] if i < len(self.BUCKETS) else st["max"], st["max"])
+        return st["max"]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages   = {k: dict(v, buckets=list(v["buckets"])) for k, v in self.stages.items()}
+            counters = dict(self.counters)
+            funnel   = dict(self.funnel)
+        labels = [str(b) for b in self.BUCKETS] + ["+Inf"]
+        return {
+            "started":     datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "duration_s":  round(time.time() - self.started, 3),
+            "sample_rate": self.sample_rate,
+            "stages": {
+                k: {
+                    "count":   st["count"],
+                    "total_s": round(st["sum"], 4),
+                    "mean_ms": round(1000 * st["sum"] / st["count"], 3),
+                    "p50_ms":  round(1000 * self._quantile(st, 0.50), 3),
+                    "p95_ms":  round(1000 * self._quantile(st, 0.95), 3),
+                    "max_ms":  round(1000 * st["max"], 3),
+                    "buckets": dict(zip(labels, st["buckets"])),
+                }
+                for k, st in sorted(stages.items())
+            },
+            "counters": {k: (int(v) if float(v).is_integer() else round(v, 3)) for k, v in sorted(counters.items())},
+            "funnel":   funnel,
+        }
+
+    def to_prometheus(self, prefix: str = "nexus") -> str:
+        """Formato textfile del node_exporter (istogrammi cumulativi, contatori, funnel)."""
+        report = self.to_dict()
+        lines  = [f"# HELP {prefix}_stage_seconds Latenza per stage dell'ultimo run",
+                  f"# TYPE {prefix}_stage_seconds histogram"]
+        for stage, st in report["stages"].items():
+            cum = 0
+            for le, n in st["buckets"].items():
+                cum += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cum}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {st["total_s"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {st["count"]}')
+        lines += [f"# HELP {prefix}_events Contatori dell'ultimo run (retry, 429, byte, skip)",
+                  f"# TYPE {prefix}_events gauge"]
+        lines += [f'{prefix}_events{{event="{k}"}} {v}' for k, v in report["counters"].items()]
+        lines += [f"# HELP {prefix}_funnel Candidati sopravvissuti a ogni filtro",
+                  f"# TYPE {prefix}_funnel gauge"]
+        lines += [f'{prefix}_funnel{{step="{k}"}} {v}' for k, v in report["funnel"].items()]
+        lines += [f"# TYPE {prefix}_run_duration_seconds gauge",
+                  f"{prefix}_run_duration_seconds {report['duration_s']}",
+                  f"# TYPE {prefix}_run_timestamp_seconds gauge",
+                  f"{prefix}_run_timestamp_seconds {int(self.started)}"]
+        return "\n".join(lines) + "\n"
+
+metrics = RunMetrics(CONFIG["METRICS_ENABLED"], CONFIG["METRICS_SAMPLE_RATE"])
+
+def _count_bytes(resp, *args, **kwargs):
+    """Hook della session: byte scaricati dagli upstream (Content-Length o corpo letto)."""
+    metrics.incr("bytes_downloaded", int(resp.headers.get("Content-Length") or len(resp.content)))
+
+session.hooks["response"].append(_count_bytes)
+
 # ==============================
 # 📋 SECTOR MAP (250+ tickers — complete, no stubs)
 # ==============================
@@ -196,470 +475,4152 @@ MY_WATCHLIST = [
     "STNE","NU","PAGS","ASTS","RKLB","HIMS","MSTR",
 ]
 
+def sector_of(ticker: str) -> str:
+    return universe_sectors.get(ticker) or SECTOR_MAP.get(ticker, "Other")
+
 # ==============================
 # 🛠️ UTILITIES
 # ==============================
 def is_market_gold_hour():
-    tz  = pytz.timezone("America/New_York")
-    now = datetime.now(tz)
-    if now.weekday() > 4:
-        return False
-    return (
-        datetime.strptime("10:00", "%H:%M").time()
-        <= now.time() <=
-        datetime.strptime("15:30", "%H:%M").time()
-    )
+    """10:00 → 30 min prima della chiusura ET, solo nei giorni di borsa aperta (calendario NYSE)."""
+    return market_calendar.in_gold_hour()
+
+class TradeLog:
+    """
+    Trade log su SQLite in WAL: una riga per alert, indice (date, ticker) per il lookup
+    "già alertati oggi" senza rileggere lo storico. La riga completa è salvata in JSON
+    nell'ordine di colonne del vecchio CSV, così export_csv() riproduce lo stesso formato.
+    Più processi (cron + daemon) possono scrivere insieme: WAL + busy timeout.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS trades (
+            id        INTEGER PRIMARY KEY AUTOINCREMENT,
+            date      TEXT NOT NULL,
+            timestamp TEXT,
+            ticker    TEXT NOT NULL,
+            sector    TEXT,
+            ifs       INTEGER,
+            price     REAL,
+            data      TEXT NOT NULL,
+            strategy  TEXT                     -- NULL = righe precedenti alle strategie (primaria)
+        );
+        CREATE INDEX IF NOT EXISTS idx_trades_date_ticker ON trades(date, ticker);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS outcomes (
+            trade_id  INTEGER PRIMARY KEY REFERENCES trades(id),
+            status    TEXT NOT NULL,           -- open / target / stop / expired / void
+            last_date TEXT NOT NULL,           -- ultima barra valutata (= uscita se chiuso)
+            bars      INTEGER NOT NULL DEFAULT 0,
+            entry     REAL,
+            stop      REAL,
+            target    REAL,
+            prob      REAL,
+            mfe       REAL,                    -- escursione massima favorevole / avversa, in R
+            mae       REAL,
+            exit      REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_outcomes_status ON outcomes(status);
+    """
+    _ready: set = set()
+
+    def __init__(self, path: str):
+        self.path = path
+        if path not in TradeLog._ready:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with contextlib.closing(self._connect()) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(self.SCHEMA)
+                if "strategy" not in {c[1] for c in conn.execute("PRAGMA table_info(trades)")}:
+                    try:
+                        conn.execute("ALTER TABLE trades ADD COLUMN strategy TEXT")
+                    except sqlite3.OperationalError:
+                        pass                       # aggiunta nel frattempo da un altro processo
+            TradeLog._ready.add(path)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _record(row: dict) -> tuple:
+        data = json.dumps(row, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+        ifs, price = row.get("ifs"), row.get("price")
+        strategy = row.get("strategy")
+        return (str(row["date"]), row.get("timestamp"), str(row["ticker"]), row.get("sector"),
+                None if ifs is None or pd.isna(ifs) else int(ifs),
+                None if price is None or pd.isna(price) else float(price), data,
+                None if strategy is None or pd.isna(strategy) else str(strategy))
+
+    def _insert(self, conn: sqlite3.Connection, rows: list):
+        conn.executemany(
+            "INSERT INTO trades (date, timestamp, ticker, sector, ifs, price, data, strategy) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._record(r) for r in rows])
+
+    def append(self, row: dict):
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._insert(conn, [row])
+            conn.execute("COMMIT")
+
+    def alerted_on(self, day: str) -> set:
+        """Ticker già alertati in `day` (YYYY-MM-DD): range scan sull'indice, O(log n + k)."""
+        with contextlib.closing(self._connect()) as conn:
+            return {t for (t,) in conn.execute("SELECT DISTINCT ticker FROM trades WHERE date = ?", (day,))}
+
+    def alerted_by_strategy(self, day: str) -> dict:
+        """{strategia: ticker alertati in `day`}; None = righe senza strategia."""
+        out: defaultdict = defaultdict(set)
+        with contextlib.closing(self._connect()) as conn:
+            for strategy, t in conn.execute("SELECT DISTINCT strategy, ticker FROM trades WHERE date = ?", (day,)):
+                out[strategy].add(t)
+        return dict(out)
+
+    def rows(self) -> list:
+        with contextlib.closing(self._connect()) as conn:
+            return [json.loads(d) for (d,) in conn.execute("SELECT data FROM trades ORDER BY id")]
+
+    def __len__(self):
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+
+    def export_csv(self, path: str) -> int:
+        """Esporta nel formato di nexus_trade_log.csv (colonne nell'ordine di log_trade)."""
+        rows = self.rows()
+        pd.DataFrame(rows).to_csv(path, index=False)
+        return len(rows)
+
+    def migrate_csv(self, csv_path: str) -> int:
+        """Import una tantum del vecchio CSV; i run successivi lo saltano (marker in meta)."""
+        key = f"migrated:{os.path.abspath(csv_path)}"
+        with contextlib.closing(self._connect()) as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                return 0
+            df = pd.read_csv(csv_path, dtype={"date": str, "timestamp": str, "ticker": str})
+            rows = [{k: (None if pd.isna(v) else v) for k, v in r.items()}
+                    for r in df.to_dict("records") if pd.notna(r.get("date")) and pd.notna(r.get("ticker"))]
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                conn.execute("ROLLBACK")               # migrato nel frattempo da un altro processo
+                return 0
+            self._insert(conn, rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)",
+                         (key, datetime.now().isoformat(timespec="seconds")))
+            conn.execute("COMMIT")
+        print(f"🗃️  Trade log: {len(rows)} righe importate da {os.path.basename(csv_path)} in {os.path.basename(self.path)}")
+        return len(rows)
+
+    @staticmethod
+    def _level(d: dict, key: str):
+        v = d.get(key)
+        try:
+            v = float(v)
+        except (TypeError, ValueError):
+            return None
+        return None if np.isnan(v) else v
+
+    def open_outcomes(self) -> pd.DataFrame:
+        """
+        Segnali ancora aperti (indice su status). I trade nuovi, oltre il watermark in meta,
+        entrano prima in outcomes come "open" con entry/stop/target letti una volta dal JSON;
+        quelli senza livelli validi diventano "void" e non vengono più ricaricati.
+        """
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row     = conn.execute("SELECT value FROM meta WHERE key = 'outcomes:last_id'").fetchone()
+            last_id = int(row[0]) if row else 0
+            new     = conn.execute("SELECT id, date, data FROM trades WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+            seeds   = []
+            for tid, day, data in new:
+                d = json.loads(data)
+                entry, stop, target = (self._level(d, k) for k in ("price", "sl", "tg"))
+                ok = None not in (entry, stop, target) and stop < entry < target
+                seeds.append((tid, "open" if ok else "void", day, entry, stop, target, self._level(d, "prob")))
+            conn.executemany(
+                "INSERT OR IGNORE INTO outcomes (trade_id, status, last_date, entry, stop, target, prob) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", seeds)
+            if new:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('outcomes:last_id', ?)",
+                             (str(new[-1][0]),))
+            conn.execute("COMMIT")
+            return pd.read_sql_query(
+                "SELECT o.trade_id, t.ticker, o.last_date, o.bars, o.entry, o.stop, o.target, o.mfe, o.mae "
+                "FROM outcomes o JOIN trades t ON t.id = o.trade_id WHERE o.status = 'open'", conn)
+
+    def save_outcomes(self, updates: list):
+        """updates: (status, last_date, bars, mfe, mae, exit, trade_id)."""
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE outcomes SET status = ?, last_date = ?, bars = ?, mfe = ?, mae = ?, exit = ? "
+                             "WHERE trade_id = ?", updates)
+            conn.execute("COMMIT")
+
+    def outcome_table(self, by: str) -> pd.DataFrame:
+        """Esiti aggregati per "ifs", "sector" o "strategy" (GROUP BY su SQLite, nessun segnale in memoria)."""
+        if by not in ("ifs", "sector", "strategy"):
+            raise ValueError(f"outcome_table: raggruppamento non supportato: {by}")
+        query = f"""
+            SELECT t.{by} AS {by}, COUNT(*) AS signals,
+                   SUM(o.status != 'open') AS closed,
+                   SUM(o.status = 'target') AS target,
+                   SUM(o.status = 'stop') AS stop,
+                   SUM(o.status = 'expired') AS expired,
+                   AVG(o.prob) AS prob,
+                   AVG(CASE WHEN o.status != 'open' THEN (o.exit - o.entry) / (o.entry - o.stop) END) AS avg_r,
+                   AVG(o.mfe) AS mfe, AVG(o.mae) AS mae, AVG(o.bars) AS bars
+            FROM outcomes o JOIN trades t ON t.id = o.trade_id
+            WHERE o.status != 'void'
+            GROUP BY t.{by} ORDER BY t.{by}"""
+        with contextlib.closing(self._connect()) as conn:
+            df = pd.read_sql_query(query, conn)
+        df.insert(df.columns.get_loc("prob"), "hit_rate",
+                  (100 * df["target"] / df["closed"].where(df["closed"] > 0)).round(1))
+        return df.round({"prob": 1, "avg_r": 2, "mfe": 2, "mae": 2, "bars": 1})
+
+def open_trade_log() -> TradeLog:
+    """Trade log corrente; al primo uso importa il CSV legacy se presente."""
+    log = TradeLog(TRADE_DB)
+    if os.path.isfile(LOG_FILE):
+        try:
+            log.migrate_csv(LOG_FILE)
+        except Exception as e:
+            print(f"⚠️  Migrazione trade log fallita: {e}")
+    return log
 
 def log_trade(data: dict, vol_ratio: float):
-    file_exists = os.path.isfile(LOG_FILE)
     row = data.copy()
     row["date"]      = datetime.now().strftime("%Y-%m-%d")
     row["timestamp"] = datetime.now().strftime("%H:%M:%S")
     row["vol_ratio"] = round(vol_ratio, 2)
-    pd.DataFrame([row]).to_csv(LOG_FILE, mode="a", index=False, header=not file_exists)
+    open_trade_log().append(row)
+
+# ==============================
+# 📦 BULK DOWNLOAD (multi-ticker)
+# ==============================
+def _split_grouped_frame(df: pd.DataFrame, tickers: list) -> dict:
+    """Divide il frame MultiIndex (group_by="ticker") in un DataFrame per ticker."""
+    out = {}
+    if df is None or df.empty:
+        return out
+    if not isinstance(df.columns, pd.MultiIndex):
+        # un solo ticker: yfinance può restituire colonne piatte
+        if len(tickers) == 1:
+            sub = df.dropna(how="all")
+            if not sub.empty:
+                out[tickers[0]] = sub
+        return out
+    level0 = set(df.columns.get_level_values(0))
+    for t in tickers:
+        if t not in level0:
+            continue
+        sub = df[t].dropna(how="all")
+        if sub.empty or "Close" not in sub.columns or sub["Close"].isna().all():
+            continue
+        sub.columns.name = None
+        out[t] = sub.copy()
+    return out
 
-def yf_download_with_retry(ticker: str, **kwargs):
+@metrics.timed("download_batch")
+def yf_download_batch(tickers: list, **kwargs) -> dict:
+    """
+    Scarica un blocco di ticker con una sola chiamata yf.download.
+    Ritorna {ticker: DataFrame}; i ticker mancanti/vuoti non compaiono.
+    """
     kwargs.setdefault("session",     session)
     kwargs.setdefault("auto_adjust", True)
     kwargs.setdefault("progress",    False)
+    kwargs.setdefault("group_by",    "ticker")
+    kwargs.setdefault("threads",     True)
     for attempt in range(CONFIG["YF_RETRIES"]):
         try:
-            df = yf.download(ticker, **kwargs)
-            if df is not None and not df.empty:
-                return df
+            df = yf.download(tickers, **kwargs)
+            return _split_grouped_frame(df, tickers)
         except Exception as e:
-            msg = str(e)
-            if any(k in msg for k in ("Rate", "429", "Too Many")):
-                wait = CONFIG["YF_RETRY_DELAY"] * (attempt + 1)
-                print(f"⏳ Rate-limited [{ticker}] — waiting {wait}s "
+            if _is_rate_limit(e):
+                wait = _backoff_delay(attempt)
+                rate_limiters["yahoo"].penalize(wait / 2)
+                _count_throttle(wait)
+                print(f"⏳ Rate-limited [batch {tickers[0]}…{tickers[-1]}] — waiting {wait:.1f}s "
                       f"(attempt {attempt+1}/{CONFIG['YF_RETRIES']})")
                 time.sleep(wait)
             else:
+                print(f"⚠️  Batch error [{tickers[0]}…{tickers[-1]}]: {e}")
                 break
-    return None
+    return {}
+
+def bulk_fetch_histories(tickers: list, **kwargs) -> dict:
+    """
+    Scarica tutta la lista a blocchi di CONFIG["BATCH_SIZE"].
+    I ticker che mancano nel risultato di un blocco vengono riprovati uno a uno.
+    Con ASYNC_FETCH i ticker passano invece dalla pipeline asincrona.
+    """
+    if CONFIG["ASYNC_FETCH"]:
+        return async_fetch_histories(tickers, **kwargs)
+    histories = {}
+    size  = max(1, int(CONFIG["BATCH_SIZE"]))
+    total = 0
+    for i in range(0, len(tickers), size):
+        chunk = tickers[i:i + size]
+        if i > 0:
+            time.sleep(CONFIG["BATCH_PAUSE"])
+        got = yf_download_batch(chunk, **kwargs)
+        total += 1
+        histories.update(got)
+        missing = [t for t in chunk if t not in got]
+        if missing:
+            print(f"🔁 Batch {i // size + 1}: {len(missing)} ticker mancanti, retry singolo…")
+        for t in missing:
+            df = fetch_history_with_retry(t, **kwargs)
+            total += 1
+            if df is not None:
+                histories[t] = df
+    print(f"📦 Bulk download: {len(histories)}/{len(tickers)} ticker in {total} richieste")
+    return histories
 
 # ==============================
-# 📅 EARNINGS CALENDAR
+# ⚡ ASYNC FETCH (token bucket + AIMD)
 # ==============================
-def load_earnings_cache() -> dict:
-    if os.path.exists(EARNINGS_CACHE):
-        try:
-            with open(EARNINGS_CACHE) as f:
-                data = json.load(f)
-            age = (datetime.now() - datetime.fromisoformat(data.get("updated", "2000-01-01"))).days
-            if age < 7:
-                return data.get("earnings", {})
-        except:
-            pass
-    return {}
+def _is_rate_limit(err) -> bool:
+    msg = str(err)
+    return any(k in msg for k in ("Rate", "429", "Too Many"))
 
-def save_earnings_cache(cache: dict):
-    try:
-        with open(EARNINGS_CACHE, "w") as f:
-            json.dump({"updated": datetime.now().isoformat(), "earnings": cache}, f)
-    except:
-        pass
+def _backoff_delay(attempt: int) -> float:
+    """Backoff esponenziale con full jitter: uniform(0, min(cap, base·2^attempt))."""
+    return random.uniform(0, min(CONFIG["BACKOFF_CAP"], CONFIG["BACKOFF_BASE"] * 2 ** attempt))
 
-def check_earnings_risk(ticker: str, cache: dict) -> bool:
-    if ticker not in cache:
-        try:
-            import urllib3
-            urllib3.disable_warnings()  # sopprimi 404 silenziosamente
-            ticker_obj = yf.Ticker(ticker)
-            cal = ticker_obj.calendar
-            if cal is not None and not cal.empty and "Earnings Date" in cal.index:
-                raw = cal.loc["Earnings Date"]
-                val = raw.iloc[0] if hasattr(raw, "iloc") else raw
-                if pd.notna(val):
-                    cache[ticker] = pd.to_datetime(val).date().isoformat()
-        except Exception:
-            pass  # 404 e altri errori ignorati silenziosamente
-        return True
-    try:
-        diff = (datetime.fromisoformat(cache[ticker]).date() - datetime.now().date()).days
-        if -CONFIG["EARNINGS_LOOKBACK_DAYS"] <= diff <= CONFIG["EARNINGS_LOOKAHEAD_DAYS"]:
-            return False
-    except:
-        pass
-    return True
+def _count_throttle(wait: float, host: str = "yahoo"):
+    metrics.incr(f"{host}_429")
+    metrics.incr("retries")
+    metrics.incr("backoff_s", wait)
 
-# ==============================
-# 📊 MARKET REGIME
-# ==============================
-def _fetch_spy_stooq() -> pd.DataFrame:
-    """Fallback: scarica SPY da stooq.com (nessun rate limit su GitHub Actions)"""
-    try:
-        url = "https://stooq.com/q/d/l/?s=spy.us&i=d"
-        df  = pd.read_csv(url, parse_dates=["Date"], index_col="Date")
-        df  = df.sort_index()
-        # Rinomina colonne per compatibilità
-        df.columns = [c.capitalize() for c in df.columns]
-        if "Close" not in df.columns:
-            return None
-        # Aggiungi Volume fittizio se assente (stooq non lo include sempre)
-        if "Volume" not in df.columns:
-            df["Volume"] = 0
-        return df.tail(300)   # ultimi 300 giorni bastano per SMA50
-    except Exception as e:
-        print(f"⚠️  Stooq fallback error: {e}")
-        return None
+class TokenBucket:
+    """Token bucket condiviso per host upstream; thread-safe e indipendente dall'event loop."""
 
-def get_market_regime():
-    """Prova yfinance, poi stooq come fallback anti-rate-limit."""
-    spy = yf_download_with_retry("SPY", period="1y", interval="1d")
+    def __init__(self, rate: float, burst: int):
+        self.rate     = float(rate)
+        self.capacity = float(burst)
+        self.tokens   = float(burst)
+        self.stamp    = time.monotonic()
+        self._lock    = threading.Lock()
 
-    if spy is None:
-        print("⚠️  yfinance rate-limited — provo stooq fallback...")
-        spy = _fetch_spy_stooq()
+    def _reserve(self, n: float = 1.0) -> float:
+        """Prenota n token (anche a debito) e ritorna i secondi da attendere."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp  = now
+            self.tokens -= n
+            return max(0.0, -self.tokens / self.rate)
 
-    if spy is None:
-        print("❌ SPY non disponibile da nessuna fonte.")
-        return False, None
+    async def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
 
-    if isinstance(spy.columns, pd.MultiIndex):
-        spy.columns = spy.columns.get_level_values(0)
-    if len(spy) < 60:
-        return False, None
+    def acquire_sync(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
 
-    spy["SMA50"] = spy["Close"].rolling(50).mean()
-    is_bull = float(spy["Close"].iloc[-1]) > float(spy["SMA50"].iloc[-1])
-    slope   = float(spy["SMA50"].iloc[-1]) > float(spy["SMA50"].iloc[-5])
-    print(f"📡 SPY: ${float(spy['Close'].iloc[-1]):.2f} | SMA50: ${float(spy['SMA50'].iloc[-1]):.2f} | {'🟢 BULL' if is_bull else '🔴 BEAR'}")
-    return bool(is_bull and slope), spy
+    def penalize(self, seconds: float):
+        """Dopo un 429 svuota il bucket: tutto l'host rallenta, non solo il worker colpito."""
+        with self._lock:
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
 
-# ==============================
-# 🧠 HELPER: ADX Calculator
-# ==============================
-def calc_adx(df: pd.DataFrame, period: int = 14) -> float:
-    """Calcola ADX (Average Directional Index) — misura forza del trend"""
-    try:
-        high  = df["High"]
-        low   = df["Low"]
-        close = df["Close"]
+class AIMDLimiter:
+    """Concorrenza adattiva: +1 slot per finestra di successi, dimezzata a ogni 429."""
 
-        # True Range
-        tr = pd.concat([
-            high - low,
-            (high - close.shift()).abs(),
-            (low  - close.shift()).abs(),
-        ], axis=1).max(axis=1)
+    def __init__(self, start: int, lo: int, hi: int):
+        self.limit    = float(start)
+        self.lo, self.hi = lo, hi
+        self.inflight = 0
+        self._loop    = None
+        self._cond    = None
 
-        # Directional Movement
-        dm_plus  = (high - high.shift()).clip(lower=0)
-        dm_minus = (low.shift() - low).clip(lower=0)
-        # Se DM+ < DM- o DM- < DM+, zero l'altro
-        dm_plus  = dm_plus.where(dm_plus > dm_minus, 0)
-        dm_minus = dm_minus.where(dm_minus > dm_plus, 0)
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._cond = loop, asyncio.Condition()
+        return self._cond
 
-        # Smoothed (Wilder)
-        atr_s    = tr.ewm(alpha=1/period, adjust=False).mean()
-        di_plus  = 100 * dm_plus.ewm(alpha=1/period, adjust=False).mean() / atr_s
-        di_minus = 100 * dm_minus.ewm(alpha=1/period, adjust=False).mean() / atr_s
+    async def acquire(self):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
 
-        dx = (100 * (di_plus - di_minus).abs() / (di_plus + di_minus).replace(0, np.nan))
-        adx = dx.ewm(alpha=1/period, adjust=False).mean()
-        return float(adx.iloc[-1])
-    except Exception:
-        return 0.0
+    async def release(self, outcome: str = "ok"):
+        """"ok" allarga, "throttled" (429) dimezza; altri esiti (errore, timeout, nessun dato) neutri."""
+        cond = self._condition()
+        async with cond:
+            self.inflight -= 1
+            if outcome == "throttled":
+                self.limit = max(self.lo, self.limit / 2)
+            elif outcome == "ok":
+                self.limit = min(self.hi, self.limit + 1 / max(self.limit, 1))
+            cond.notify_all()
+
+rate_limiters = {host: TokenBucket(*cfg) for host, cfg in CONFIG["RATE_LIMITS"].items() if host != "telegram"}
+telegram_buckets: dict = {}     # chat_id → TokenBucket (RATE_LIMITS["telegram"]): un 429 frena solo la sua chat
+yahoo_concurrency = AIMDLimiter(CONFIG["FETCH_START_CONCURRENCY"],
+                                CONFIG["FETCH_MIN_CONCURRENCY"], CONFIG["FETCH_MAX_CONCURRENCY"])
+
+def _history_one(ticker: str, kwargs: dict, paced: bool = True):
+    """Storico di un ticker via provider (Ticker.history è thread-safe, al contrario di yf.download)."""
+    return fetch_history(ticker, kwargs, paced=paced)
+
+async def _fetch_one_async(ticker: str, kwargs: dict, executor, stats: dict):
+    bucket = rate_limiters["yahoo"]
+    for attempt in range(CONFIG["YF_RETRIES"]):
+        # circuit yahoo aperto: la richiesta va alle sorgenti secondarie, niente token né slot AIMD
+        paced = providers["yahoo"].breaker.state != "open"
+        if paced:
+            await bucket.acquire()
+            await yahoo_concurrency.acquire()
+        outcome = "error"
+        try:
+            loop = asyncio.get_running_loop()
+            df   = await loop.run_in_executor(executor, _history_one, ticker, kwargs, paced)
+            if df is not None:
+                outcome = "ok"
+            return df
+        except Exception as e:
+            if not _is_rate_limit(e):
+                return None
+            outcome = "throttled"
+        finally:
+            if paced:
+                await yahoo_concurrency.release(outcome)
+        # 429: il worker è già libero, si attende senza occupare thread
+        stats["throttled"] += 1
+        wait = _backoff_delay(attempt)
+        bucket.penalize(wait / 2)
+        _count_throttle(wait)
+        print(f"⏳ Rate-limited [{ticker}] — retry in {wait:.1f}s "
+              f"(attempt {attempt+1}/{CONFIG['YF_RETRIES']}, concurrency {yahoo_concurrency.limit:.1f})")
+        await asyncio.sleep(wait)
+    return None
+
+async def _fetch_all_async(tickers: list, kwargs: dict) -> dict:
+    stats = {"throttled": 0}
+    start = yahoo_concurrency.limit
+    with metrics.timer("download_async"), \
+         ThreadPoolExecutor(max_workers=CONFIG["FETCH_MAX_CONCURRENCY"]) as executor:
+        frames = await asyncio.gather(*(_fetch_one_async(t, kwargs, executor, stats) for t in tickers))
+    out = {t: df for t, df in zip(tickers, frames) if df is not None}
+    print(f"⚡ Async fetch: {len(out)}/{len(tickers)} ok | 429: {stats['throttled']} | "
+          f"concurrency {start:.0f}→{yahoo_concurrency.limit:.0f}")
+    return out
+
+def async_fetch_histories(tickers: list, **kwargs) -> dict:
+    """Scarica gli storici in parallelo con rate limit per host e concorrenza AIMD."""
+    if not tickers:
+        return {}
+    return asyncio.run(_fetch_all_async(list(tickers), kwargs))
 
 # ==============================
-# 🧠 INSTITUTIONAL FLOW SCORE (10-point)
+# 🛰️ DATA PROVIDERS (failover, hedging, circuit breaker)
 # ==============================
-def institutional_score(df: pd.DataFrame, rs_val: float, spy_df: pd.DataFrame) -> tuple:
-    """
-    Score 0-10 con 6 componenti:
-      +2  Volume accumulation   (3/5 giorni sopra media 20gg)
-      +2  Range compression VCP (range 5gg < range 20gg)
-      +2  Relative strength     (sovraperformance SPY 63gg)
-      +1  Bullish close         (chiusura top 25% range giornaliero)
-      +2  RS Line new high      (RS line fa nuovo max con il breakout)
-      +1  Volume dry-up         (3gg prima del breakout: volumi < 50% media)
+LOCAL_DATA_DIR = os.getenv("NEXUS_LOCAL_DATA", os.path.join(BASE_DIR, "local_data"))
 
-    ADX viene restituito separatamente come filtro hard (non nel score).
+class CircuitBreaker:
+    """
+    closed → open dopo `failures` errori consecutivi. Dopo `cooldown` secondi diventa
+    half-open: passa una sola richiesta di prova, che richiude o riapre il circuito.
     """
-    if len(df) < 30:
-        return 0, 0.0
 
-    score = 0
+    def __init__(self, name: str, failures: int, cooldown: float):
+        self.name, self.failures, self.cooldown = name, failures, cooldown
+        self._lock   = threading.Lock()
+        self._errors = 0
+        self._opened = None
+        self._probe  = False
 
-    # 1. Volume accumulation
-    avg20 = df["Volume"].rolling(20).mean()
-    if (df["Volume"].iloc[-5:] > avg20.iloc[-5:]).sum() >= 3:
-        score += 2
+    def _state(self) -> str:
+        if self._opened is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self._opened >= self.cooldown else "open"
 
-    # 2. VCP range compression
-    hl  = df["High"] - df["Low"]
-    r5  = float(hl.rolling(5).mean().iloc[-1])
-    r20 = float(hl.rolling(20).mean().iloc[-1])
-    if pd.notna(r5) and pd.notna(r20) and r20 > 0 and r5 < r20:
-        score += 2
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
 
-    # 3. Relative strength vs SPY (63gg)
-    if rs_val > 0:
-        score += 2
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probe:
+                self._probe = True
+                return True
+            return False
 
-    # 4. Bullish close structure
-    day_range = float(df["High"].iloc[-1]) - float(df["Low"].iloc[-1])
-    if day_range > 0:
-        close_pos = (float(df["Close"].iloc[-1]) - float(df["Low"].iloc[-1])) / day_range
-        if close_pos > 0.75:
-            score += 1
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                if self._opened is not None:
+                    print(f"🟢 Circuit {self.name} chiuso", flush=True)
+                self._errors, self._opened, self._probe = 0, None, False
+                return
+            self._errors += 1
+            if self._probe or (self._opened is None and self._errors >= self.failures):
+                print(f"🔴 Circuit {self.name} aperto per {self.cooldown:.0f}s "
+                      f"({self._errors} errori consecutivi)", flush=True)
+                metrics.incr(f"{self.name}_breaker_open")
+                self._opened, self._probe = time.monotonic(), False
 
-    # 5. RS Line new high (nuovo massimo a 20 giorni della forza relativa)
-    try:
-        # RS Line = Close ticker / Close SPY (allineati per data)
-        aligned = df["Close"].align(spy_df["Close"], join="inner")
-        rs_line = aligned[0] / aligned[1]
-        if len(rs_line) >= 21:
-            rs_max20 = rs_line.iloc[-21:-1].max()   # max dei 20gg precedenti
-            if float(rs_line.iloc[-1]) > float(rs_max20):
-                score += 2
-    except Exception:
-        pass
+def _slice_period(df: pd.DataFrame, kwargs: dict) -> pd.DataFrame:
+    """Applica start/end/period come farebbe yfinance (sorgenti che restituiscono tutto lo storico)."""
+    if kwargs.get("start") is not None:
+        df = df[df.index >= pd.Timestamp(kwargs["start"])]
+    if kwargs.get("end") is not None:
+        df = df[df.index < pd.Timestamp(kwargs["end"])]
+    period = kwargs.get("period")
+    if not period or period == "max" or df.empty:
+        return df
+    for unit, days in (("mo", 31), ("wk", 7), ("y", 366), ("d", None)):
+        if period.endswith(unit):
+            n = int(period[:-len(unit)])
+            break
+    else:
+        return df
+    if days is None:   # "Nd" = ultime N sedute (anche per barre intraday)
+        sessions = df.index.normalize()
+        return df[sessions.isin(sessions.unique()[-n:])]
+    return df[df.index > df.index[-1] - pd.Timedelta(days=days * n)]
 
-    # 6. Volume dry-up: 3 giorni prima volumi < 50% della media 20gg
-    try:
-        avg20_val = float(avg20.iloc[-4])            # media al giorno -4
-        dry_days  = (df["Volume"].iloc[-4:-1] < avg20.iloc[-4:-1] * 0.50).sum()
-        if dry_days >= 2:                            # almeno 2 dei 3gg pre-breakout
-            score += 1
-    except Exception:
-        pass
+class DataProvider(ABC):
+    """
+    Sorgente OHLCV. fetch() ritorna un DataFrame normalizzato (colonne piatte Open…Volume,
+    indice naive) o None se il ticker non ha dati; solleva se l'upstream è in errore.
+    Le sottoclassi implementano _fetch (risposta grezza dell'upstream).
+    """
+    name      = "base"
+    intervals = ("1d",)
 
-    # ADX calcolato separatamente
-    adx = calc_adx(df)
+    def __init__(self):
+        self.breaker = CircuitBreaker(self.name, CONFIG["BREAKER_FAILURES"], CONFIG["BREAKER_COOLDOWN"])
 
-    return score, adx
+    def supports(self, kwargs: dict) -> bool:
+        return kwargs.get("interval", "1d") in self.intervals
 
-# ==============================
-# 🔎 ANALYZE TICKER
-# ==============================
-def analyze_ticker(ticker: str, spy_df: pd.DataFrame,
-                   already_alerted: set, earnings_cache: dict):
-    print(f"🔎 Scanning: {ticker}", flush=True)
-    if ticker in already_alerted:
-        print(f"   ⏭️  {ticker} — già alertato oggi", flush=True)
-        return None
-    if not check_earnings_risk(ticker, earnings_cache):
-        print(f"   ⚠️  {ticker} — earnings imminenti, skip", flush=True)
-        return None
-    try:
-        time.sleep(random.uniform(0.2, 0.6))
-        df = yf_download_with_retry(ticker, period="1y", interval="1d")
-        if df is None or len(df) < 60:
-            return None
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
+    @abstractmethod
+    def _fetch(self, ticker: str, kwargs: dict, paced: bool):
+        """DataFrame grezzo (o None se il ticker non ha dati) per `kwargs` stile yfinance."""
 
-        # squeeze() ensures scalar even if yfinance returns single-col DataFrame
-        price    = float(df["Close"].iloc[-1].squeeze() if hasattr(df["Close"].iloc[-1], "squeeze") else df["Close"].iloc[-1])
-        vol_mean = float(df["Volume"].rolling(20).mean().iloc[-1].squeeze() if hasattr(df["Volume"].rolling(20).mean().iloc[-1], "squeeze") else df["Volume"].rolling(20).mean().iloc[-1])
-        if pd.isna(vol_mean) or vol_mean == 0:
+    def fetch(self, ticker: str, kwargs: dict, paced: bool = False):
+        df = self._fetch(ticker, kwargs, paced)
+        if df is None or df.empty:
             return None
-        vol_last = df["Volume"].iloc[-1]
-        vol_last = float(vol_last.squeeze() if hasattr(vol_last, "squeeze") else vol_last)
-        if price * vol_last < CONFIG["MIN_VOLUME_USD"]:
+        df = _normalize_ohlcv(df)
+        if df.empty:
             return None
+        df.attrs["provider"] = self.name
+        return df
 
-        vol_ratio  = vol_last / vol_mean
-        res_raw    = df["High"].rolling(20).max().iloc[-2]
-        resistance = float(res_raw.squeeze() if hasattr(res_raw, "squeeze") else res_raw)
-        rs_raw     = df["Close"].pct_change(63).iloc[-1]
-        spy_rs_raw = spy_df["Close"].pct_change(63).iloc[-1]
-        rs_val     = (
-            float(rs_raw.squeeze() if hasattr(rs_raw, "squeeze") else rs_raw)
-            - float(spy_rs_raw.squeeze() if hasattr(spy_rs_raw, "squeeze") else spy_rs_raw)
-        )
-        if pd.isna(resistance) or pd.isna(rs_val):
+class YahooProvider(DataProvider):
+    name      = "yahoo"
+    intervals = ("1d", "5m", "15m", "1h")
+
+    def _fetch(self, ticker, kwargs, paced):
+        if not paced:
+            rate_limiters["yahoo"].acquire_sync()
+        kw = {k: v for k, v in kwargs.items() if k in ("period", "interval", "start", "end", "auto_adjust")}
+        kw.setdefault("auto_adjust", True)
+        try:
+            return yf.Ticker(ticker, session=session).history(raise_errors=True, **kw)
+        except (yf.exceptions.YFTickerMissingError, yf.exceptions.YFInvalidPeriodError):
+            return None   # delisted / senza dati: non è un guasto dell'upstream
+
+class StooqProvider(DataProvider):
+    """Solo barre giornaliere; nessun rate limit stretto (utile anche su GitHub Actions)."""
+    name = "stooq"
+
+    def _fetch(self, ticker, kwargs, paced):
+        url = f"https://stooq.com/q/d/l/?s={ticker.lower()}.us&i=d"
+        if kwargs.get("start") is not None:   # solo il delta richiesto, non tutto lo storico
+            url += f"&d1={pd.Timestamp(kwargs['start']):%Y%m%d}&d2={_ny_today():%Y%m%d}"
+        rate_limiters["stooq"].acquire_sync()
+        df = pd.read_csv(url, parse_dates=["Date"], index_col="Date").sort_index()
+        df.columns = [c.capitalize() for c in df.columns]
+        if "Close" not in df.columns:   # "No data": ticker sconosciuto
             return None
+        if "Volume" not in df.columns:  # stooq non lo include sempre
+            df["Volume"] = 0
+        return _slice_period(df, kwargs)
 
-        if price > resistance and vol_ratio > 1.5:
-            ifs, adx = institutional_score(df, rs_val, spy_df)
+class LocalProvider(DataProvider):
+    """File in LOCAL_DATA_DIR: {TICKER}.parquet|csv (1d) o {TICKER}_{interval}.parquet|csv. Per test offline."""
+    name      = "local"
+    intervals = ("1d", "5m")
 
-            # Filtro ADX >= 25 (semaforo intensità trend)
-            if adx < 25:
-                print(f"   📉 {ticker} — ADX {adx:.1f} < 25, trend debole skip", flush=True)
-                return None
+    def _fetch(self, ticker, kwargs, paced):
+        interval = kwargs.get("interval", "1d")
+        stem = ticker if interval == "1d" else f"{ticker}_{interval}"
+        for ext, read in ((".parquet", pd.read_parquet),
+                          (".csv", lambda p: pd.read_csv(p, index_col=0, parse_dates=True))):
+            path = os.path.join(LOCAL_DATA_DIR, stem + ext)
+            if os.path.exists(path):
+                return _slice_period(read(path).sort_index(), kwargs)
+        return None
 
-            if ifs < CONFIG["MIN_IFS_SCORE"]:
-                return None
+providers = {p.name: p for p in (YahooProvider(), StooqProvider(), LocalProvider())}
+_provider_pool = ThreadPoolExecutor(max_workers=2 * CONFIG["FETCH_MAX_CONCURRENCY"],
+                                    thread_name_prefix="provider")
 
-            tr  = pd.concat([
-                df["High"] - df["Low"],
-                (df["High"] - df["Close"].shift()).abs(),
-                (df["Low"]  - df["Close"].shift()).abs(),
-            ], axis=1).max(axis=1)
-            atr = float(tr.rolling(14).mean().iloc[-1])
-            if pd.isna(atr) or atr == 0:
-                return None
+def _provider_call(provider: DataProvider, ticker: str, kwargs: dict, paced: bool):
+    try:
+        df = provider.fetch(ticker, kwargs, paced)
+    except Exception:
+        provider.breaker.record(False)
+        metrics.incr(f"{provider.name}_errors")
+        raise
+    provider.breaker.record(True)   # anche "nessun dato" è una risposta sana
+    return df
 
-            stop_loss = price - atr * 1.5
-            risk      = price - stop_loss
-            if risk <= 0:
-                return None
+@metrics.timed("download")
+def fetch_history(ticker: str, kwargs: dict, paced: bool = False):
+    """
+    Storico di un ticker dal primo provider disponibile in CONFIG["PROVIDERS"] (circuit aperti esclusi).
+    Errore o nessun dato → si passa subito al successivo; se la richiesta tarda più di HEDGE_AFTER_S
+    il successivo parte in gara e vince la prima risposta con dati. Latenza massima PROVIDER_TIMEOUT.
+    Se nessuno risponde e il primario era in rate limit, rilancia quell'errore (backoff del chiamante).
+    `paced`: il token bucket yahoo è già stato preso dal chiamante (pipeline asincrona).
+    """
+    chain   = [providers[n] for n in CONFIG["PROVIDERS"] if providers[n].supports(kwargs)]
+    primary  = chain[0] if chain else None
+    deadline = time.monotonic() + CONFIG["PROVIDER_TIMEOUT"]
+    hedge    = CONFIG["HEDGE_AFTER_S"]
+    pending  = {}
+    error    = None
 
-            target = price + risk * 2.5
-            size   = int((CONFIG["TOTAL_EQUITY"] * CONFIG["RISK_PER_TRADE_PERCENT"]) / risk)
-            strike = round(price * 1.05)
-            label  = "⚡ OPTION SWEEP" if vol_ratio > 2.0 else "🧊 ACCUMULATION"
-
-            result = {
-                "ticker":    ticker,
-                "price":     round(price, 2),
-                "ifs":       ifs,
-                "label":     label,
-                "strike":    strike,
-                "tg":        round(target, 2),
-                "sl":        round(stop_loss, 2),
-                "rs":        round(rs_val * 100, 1),
-                "size":      size,
-                "prob":      min(50 + ifs * 5, 92),  # scala su 10 punti
-                "sector":    SECTOR_MAP.get(ticker, "Other"),
-                "r1":        round(resistance, 2),
-                "r2":        round(price + atr * 2, 2),
-                "vol_ratio": round(vol_ratio, 2),
-                "adx":       round(adx, 1),
-            }
-            print(f"   🚨 SEGNALE: {ticker} | IFS {ifs}/10 | ADX {adx:.1f} | ${round(price,2)} | {label}", flush=True)
-            return result
+    def start_next() -> bool:
+        while chain:
+            p = chain.pop(0)
+            if p.breaker.allow():
+                fut = _provider_pool.submit(_provider_call, p, ticker, kwargs, paced and p.name == "yahoo")
+                pending[fut] = p
+                return True
+        return False
 
-    except Exception as e:
-        print(f"   ❌ {ticker} — errore: {e}", flush=True)
-        return None
-    print(f"   ➖ {ticker} — nessun breakout", flush=True)
+    start_next()
+    while pending:
+        timeout = deadline - time.monotonic()
+        if chain and hedge is not None:
+            timeout = min(timeout, hedge)
+        done, _ = wait(pending, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+        if not done:
+            if time.monotonic() >= deadline:
+                metrics.incr("provider_timeouts")
+                break
+            if start_next():
+                metrics.incr("hedged")
+            continue
+        for fut in done:
+            p = pending.pop(fut)
+            try:
+                df = fut.result()
+            except Exception as e:
+                error = error or e
+                continue
+            if df is not None:
+                if p is not primary:
+                    metrics.incr(f"served_by_{p.name}")
+                return df
+        if not pending and start_next():
+            metrics.incr("failover")
+    if error is not None and _is_rate_limit(error):
+        raise error
+    return None
+
+def fetch_history_with_retry(ticker: str, **kwargs):
+    """fetch_history sincrono con backoff esponenziale quando tutte le sorgenti sono in rate limit."""
+    for attempt in range(CONFIG["YF_RETRIES"]):
+        try:
+            return fetch_history(ticker, kwargs)
+        except Exception as e:
+            if not _is_rate_limit(e):
+                return None
+            wait_s = _backoff_delay(attempt)
+            rate_limiters["yahoo"].penalize(wait_s / 2)
+            _count_throttle(wait_s)
+            print(f"⏳ Rate-limited [{ticker}] — waiting {wait_s:.1f}s "
+                  f"(attempt {attempt+1}/{CONFIG['YF_RETRIES']})")
+            time.sleep(wait_s)
     return None
 
 # ==============================
-# 📤 TELEGRAM
+# 💾 OHLCV STORE (storico locale + delta)
 # ==============================
-def send_telegram(message: str) -> bool:
+def _ny_today():
+    return datetime.now(pytz.timezone("America/New_York")).date()
+
+def _atomic_write(path: str, write_fn):
+    """Scrive su file temporaneo nella stessa cartella e poi os.replace()."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
     try:
-        resp = requests.post(
-            f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
-            data={"chat_id": TELEGRAM_CHAT_ID, "text": message, "parse_mode": "Markdown"},
-            timeout=10,
-        )
-        if resp.status_code != 200:
-            print(f"❌ Telegram error: {resp.text}")
-            return False
-        return True
-    except Exception as e:
-        print(f"❌ Telegram exception: {e}")
-        return False
+        write_fn(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
 
-# ==============================
-# 🚀 MAIN
-# ==============================
-def main():
-    print("=" * 70)
-    print("🧬 NEXUS v14.5 — WHALE DETECTOR EDITION")
-    print("=" * 70)
+def _store_path(ticker: str) -> str:
+    return os.path.join(STORE_DIR, f"{ticker}.parquet")
 
-    # Gold Hour gate — decommentare per attivare in produzione
-    if not is_market_gold_hour():
-        print("⏰ Outside Gold Hour (10:00–15:30 EST). Exiting.")
-        return
+def _normalize_ohlcv(df: pd.DataFrame) -> pd.DataFrame:
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    cols = [c for c in ("Open", "High", "Low", "Close", "Volume") if c in df.columns]
+    df = df[cols].copy()
+    df.index = pd.to_datetime(df.index)
+    if df.index.tz is not None:
+        df.index = df.index.tz_localize(None)
+    df.index.name = "Date"
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    return df.dropna(subset=["Close"])
 
-    is_bull, spy_df = get_market_regime()
-    if not is_bull or spy_df is None:
-        print("🛑 Regime Bearish / SPY unavailable. Scan cancelled.")
-        return
-    print("✅ Market Regime: BULLISH")
+def load_store_index() -> dict:
+    try:
+        with open(STORE_INDEX) as f:
+            return json.load(f)
+    except Exception:
+        return {}
 
-    earnings_cache = load_earnings_cache()
-    print(f"📅 Earnings cache: {len(earnings_cache)} tickers")
+def save_store_index(index: dict):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    def _write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=0, sort_keys=True)
+    _atomic_write(STORE_INDEX, _write)
 
-    already_alerted: set = set()
-    today = datetime.now().strftime("%Y-%m-%d")
-    if os.path.exists(LOG_FILE):
-        try:
-            log_df = pd.read_csv(LOG_FILE)
-            if "date" in log_df.columns:
-                already_alerted = set(log_df[log_df["date"] == today]["ticker"].values)
-                print(f"⏭️  Already alerted today: {len(already_alerted)} tickers")
-        except:
-            pass
+def store_load(ticker: str):
+    if ticker in history_cache:
+        return history_cache[ticker]
+    path = _store_path(ticker)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_parquet(path)
+    except Exception as e:
+        print(f"⚠️  Store corrotto [{ticker}]: {e}")
+        return None
+    history_cache[ticker] = df
+    return df
 
-    print(f"🔍 Scanning {len(MY_WATCHLIST)} tickers ({CONFIG['MAX_THREADS']} threads)…")
-    results = []
+def store_save(ticker: str, df: pd.DataFrame):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    _atomic_write(_store_path(ticker), lambda tmp: df.to_parquet(tmp))
+    history_cache[ticker] = df
 
-    import sys; sys.stdout.flush()  # forza output prima del scan
-    with ThreadPoolExecutor(max_workers=CONFIG["MAX_THREADS"]) as executor:
-        futures = {
-            executor.submit(analyze_ticker, t, spy_df, already_alerted, earnings_cache): t
-            for t in MY_WATCHLIST
-        }
-        for future in as_completed(futures):
-            res = future.result()
-            if res:
-                results.append(res)
+def _adjustment_changed(stored: pd.DataFrame, fresh: pd.DataFrame) -> bool:
+    """True se le barre in sovrapposizione differiscono (split/dividendo → storico riaggiustato)."""
+    common = stored.index.intersection(fresh.index)
+    if len(common) == 0:
+        return True
+    a = stored.loc[common, "Close"].astype(float)
+    b = fresh.loc[common, "Close"].astype(float)
+    rel = ((a - b).abs() / a.abs().replace(0, np.nan)).max()
+    return bool(pd.notna(rel) and rel > CONFIG["STORE_ADJ_TOLERANCE"])
 
-    print(f"📊 Raw candidates (IFS ≥ {CONFIG['MIN_IFS_SCORE']}): {len(results)}")
+def _state_path(ticker: str) -> str:
+    return os.path.join(STORE_DIR, f"{ticker}.state.json")
+
+def load_indicator_state(ticker: str):
+    try:
+        with open(_state_path(ticker)) as f:
+            return IndicatorState.from_dict(json.load(f))
+    except Exception:
+        return None
+
+def save_indicator_state(ticker: str, state):
+    def _write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(state.to_dict(), f)
+    _atomic_write(_state_path(ticker), _write)
+
+def _update_indicator_state(ticker: str, final: pd.DataFrame, old_wm, rebuild: bool):
+    """Avanza lo stato con le sole barre nuove; lo ricostruisce se non allineato al watermark."""
+    state = None if rebuild else (indicator_states.get(ticker) or load_indicator_state(ticker))
+    if state is None or state.date is None or state.date != old_wm:
+        state = IndicatorState.from_history(final)
+    else:
+        state.advance(final)
+    save_indicator_state(ticker, state)
+    indicator_states[ticker] = state
+
+def get_indicator_states(tickers) -> dict:
+    """Stati già in memoria, altrimenti letti dallo store. In replay nessuno (lo store è di oggi)."""
+    if snapshots.replaying is not None:
+        return {}
+    for t in tickers:
+        if t not in indicator_states:
+            state = load_indicator_state(t)
+            if state is not None:
+                indicator_states[t] = state
+    return {t: indicator_states[t] for t in tickers if t in indicator_states}
+
+def _store_persist(histories: dict, index: dict, force: set = frozenset()):
+    """Salva solo le barre chiuse (data < oggi NY) e aggiorna il watermark."""
+    today = _ny_today()
+    for t, df in histories.items():
+        final = df[df.index.date < today]
+        if final.empty:
+            continue
+        wm     = final.index[-1].strftime("%Y-%m-%d")
+        old_wm = index.get(t, {}).get("watermark")
+        if t not in force and old_wm == wm:
+            continue
+        store_save(t, final)
+        if CONFIG["INCREMENTAL_STATE"]:
+            _update_indicator_state(t, final, old_wm, rebuild=t in force)
+        index[t] = {"watermark": wm, "updated": datetime.now().isoformat(timespec="seconds")}
+    save_store_index(index)
+
+def store_update(tickers: list) -> dict:
+    """
+    Carica lo storico locale e scarica solo le barre dopo il watermark
+    (più qualche giorno di sovrapposizione + la barra parziale di oggi).
+    Ticker senza storico o con aggiustamenti cambiati → refetch completo.
+    Ritorna {ticker: DataFrame} sulla finestra STORE_ANALYSIS_DAYS.
+    """
+    index     = load_store_index()
+    histories = {}
+    stored    = {}
+    stale     = []
+    by_start  = defaultdict(list)
+    for t in tickers:
+        df = store_load(t)
+        wm = index.get(t, {}).get("watermark")
+        if df is None or df.empty or wm is None:
+            stale.append(t)
+            continue
+        stored[t] = df
+        start = (pd.Timestamp(wm) - pd.Timedelta(days=CONFIG["STORE_OVERLAP_DAYS"])).strftime("%Y-%m-%d")
+        by_start[start].append(t)
+
+    for start, group in by_start.items():
+        fresh = bulk_fetch_histories(group, start=start, interval="1d")
+        for t in group:
+            new = fresh.get(t)
+            if new is None:
+                histories[t] = stored[t]   # upstream non disponibile: solo storico locale
+                continue
+            old = stored[t]
+            if new.attrs.get("provider", "yahoo") != "yahoo":
+                # sorgente di riserva: aggiustamenti diversi da yahoo → solo barre dopo lo storico
+                new = new[new.index > old.index[-1]]
+            else:
+                new = _normalize_ohlcv(new)
+                if _adjustment_changed(old, new):
+                    print(f"🔀 {t} — storico riaggiustato (split/dividendo), refetch completo")
+                    stale.append(t)
+                    continue
+            histories[t] = pd.concat([old[~old.index.isin(new.index)], new]).sort_index()
+
+    if stale:
+        fresh = bulk_fetch_histories(stale, period=CONFIG["STORE_BACKFILL_PERIOD"], interval="1d")
+        for t in stale:
+            if t in fresh:
+                histories[t] = _normalize_ohlcv(fresh[t])
+
+    _store_persist(histories, index, force=set(stale))
+    print(f"💾 Store: {len(stored)} incrementali, {len(stale)} completi, {len(histories)}/{len(tickers)} disponibili")
+
+    return {t: _analysis_window(df) for t, df in histories.items()}
+
+def store_backfill(tickers: list, period: str = None):
+    """Riscarica da zero lo storico di tutti i ticker (comando --backfill)."""
+    period = period or CONFIG["STORE_BACKFILL_PERIOD"]
+    print(f"💾 Backfill {len(tickers)} ticker — period {period}")
+    fresh = bulk_fetch_histories(tickers, period=period, interval="1d")
+    histories = {t: _normalize_ohlcv(df) for t, df in fresh.items()}
+    _store_persist(histories, load_store_index(), force=set(histories))
+    print(f"💾 Backfill completato: {len(histories)}/{len(tickers)} ticker salvati in {STORE_DIR}")
+    if CONFIG["INTRADAY_MODE"]:
+        profiles = load_volume_profiles()
+        refresh_volume_profiles(list(histories), profiles.setdefault("tickers", {}))
+        save_volume_profiles(profiles)
+
+def fetch_histories(tickers: list) -> dict:
+    """
+    Storico giornaliero (1y) per l'analisi: store locale se attivo (filtrato dal
+    proximity index), altrimenti bulk download. Con INTRADAY_MODE la barra di oggi
+    è quella provvisoria da 5m, con volume proiettato a fine giornata.
+    Il risultato finisce nello snapshot in registrazione; in replay viene dallo snapshot.
+    """
+    if snapshots.replaying is not None:
+        return snapshots.histories(tickers)
+    if CONFIG["STORE_ENABLED"] and CONFIG["PROXIMITY_INDEX"]:
+        histories = proximity_funnel(tickers)
+    elif CONFIG["STORE_ENABLED"]:
+        histories = _with_intraday(store_update(tickers))
+    else:
+        histories = _with_intraday(bulk_fetch_histories(tickers, period="1y", interval="1d"))
+    snapshots.record_histories(histories)
+    return histories
+
+# ==============================
+# 🕔 INTRADAY (barra provvisoria da 5m + proiezione volume)
+# ==============================
+SESSION_OPEN  = 9 * 60 + 30   # minuti dalla mezzanotte NY
+SESSION_SLOTS = 78            # barre da 5 minuti tra 9:30 e 16:00
+
+def _default_volume_curve() -> np.ndarray:
+    """Curva cumulativa a "U" generica (apertura e chiusura più pesanti), se non ci sono profili."""
+    i = np.arange(SESSION_SLOTS)
+    w = 1 + 2.5 * np.exp(-i / 4) + 1.5 * np.exp(-(SESSION_SLOTS - 1 - i) / 4)
+    return np.cumsum(w) / w.sum()
+
+def _session_slot(index: pd.DatetimeIndex) -> np.ndarray:
+    return np.asarray((index.hour * 60 + index.minute - SESSION_OPEN) // 5)
+
+def _intraday_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Barre 5m in ora di New York (naive), solo sessione regolare."""
+    df = df.copy()
+    df.index = pd.to_datetime(df.index)
+    if df.index.tz is not None:
+        df.index = df.index.tz_convert("America/New_York")
+    df   = _normalize_ohlcv(df)
+    slot = _session_slot(df.index)
+    return df[(slot >= 0) & (slot < SESSION_SLOTS)]
+
+def volume_curve_from_bars(df: pd.DataFrame):
+    """
+    Frazione cumulativa del volume giornaliero a fine di ogni slot da 5m (mediana sui giorni
+    con sessione completa). None se i giorni completi sono meno di 3.
+    """
+    bars = _intraday_frame(df)
+    if bars.empty:
+        return None
+    day, _ = pd.factorize(bars.index.normalize())
+    slot   = _session_slot(bars.index)
+    vol    = np.zeros((day.max() + 1, SESSION_SLOTS))
+    seen   = np.zeros_like(vol, dtype=bool)
+    np.add.at(vol, (day, slot), bars["Volume"].to_numpy(float))
+    seen[day, slot] = True
+    # giornata parziale di oggi e mezze sedute restano fuori
+    vol = vol[(seen.sum(axis=1) >= 0.9 * SESSION_SLOTS) & (vol.sum(axis=1) > 0)]
+    if len(vol) < 3:
+        return None
+    cum   = np.cumsum(vol, axis=1) / vol.sum(axis=1, keepdims=True)
+    curve = np.maximum.accumulate(np.median(cum, axis=0))
+    return curve / curve[-1]
+
+def load_volume_profiles() -> dict:
+    try:
+        with open(VOLUME_PROFILE_FILE) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_volume_profiles(profiles: dict):
+    def _write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(profiles, f)
+    _atomic_write(VOLUME_PROFILE_FILE, _write)
+
+def refresh_volume_profiles(tickers: list, entries: dict, limit: int = None) -> int:
+    """Ricostruisce i profili mancanti o scaduti (al massimo `limit` per run). Ritorna quanti."""
+    cutoff = (_ny_today() - timedelta(days=CONFIG["INTRADAY_PROFILE_TTL_DAYS"])).isoformat()
+    todo   = [t for t in tickers if entries.get(t, {}).get("built", "") <= cutoff]
+    if limit is not None:
+        todo = todo[:limit]
+    if not todo:
+        return 0
+    fresh = bulk_fetch_histories(todo, period=CONFIG["INTRADAY_PROFILE_PERIOD"], interval="5m")
+    today = _ny_today().isoformat()
+    for t in todo:
+        curve = volume_curve_from_bars(fresh[t]) if t in fresh else None
+        # anche "profilo non calcolabile" è un'entry: niente refetch a ogni run fino al TTL
+        entries[t] = {"built": today, "curve": None if curve is None else [round(float(x), 5) for x in curve]}
+    metrics.incr("volume_profiles", len(todo))
+    print(f"📈 Profili volume intraday: {sum(1 for t in todo if entries[t]['curve'])}/{len(todo)} ricostruiti")
+    return len(todo)
+
+def _market_curve(entries: dict) -> np.ndarray:
+    """Profilo mediano dei ticker noti: fallback per chi non ha ancora un profilo proprio."""
+    curves = [e["curve"] for e in entries.values() if e.get("curve")]
+    if len(curves) < 5:
+        return _default_volume_curve()
+    return np.median(np.array(curves, dtype=float), axis=0)
+
+def _session_fraction(curve: np.ndarray, elapsed_min: float) -> float:
+    ends = np.arange(SESSION_SLOTS + 1) * 5.0
+    return float(np.interp(elapsed_min, ends, np.r_[0.0, curve]))
+
+@metrics.timed("intraday")
+def intraday_snapshot(tickers: list) -> dict:
+    """
+    Barra giornaliera provvisoria di oggi dalle sole barre 5m della sessione: OHLC aggregati,
+    Volume proiettato a fine giornata (volume cumulato / frazione attesa dal profilo del ticker
+    all'ora dell'ultima barra). Ritorna {ticker: DataFrame di una riga}; vuoto fuori sessione.
+    """
+    today = pd.Timestamp(_ny_today())
+    now   = pd.Timestamp(datetime.now(pytz.timezone("America/New_York")).replace(tzinfo=None))
+    if not tickers or today.weekday() > 4 or now < today + pd.Timedelta(minutes=SESSION_OPEN):
+        return {}
+    profiles = load_volume_profiles()
+    entries  = profiles.setdefault("tickers", {})
+    if refresh_volume_profiles(tickers, entries, CONFIG["INTRADAY_PROFILE_BATCH"]):
+        save_volume_profiles(profiles)
+    market = _market_curve(entries)
+
+    fresh = bulk_fetch_histories(tickers, period="1d", interval="5m")
+    snap  = {}
+    for t, df in fresh.items():
+        bars = _intraday_frame(df)
+        bars = bars[bars.index.normalize() == today]
+        if bars.empty:
+            continue
+        # l'ultima barra è ancora aperta: fine slot come stima prudente dell'ora
+        as_of   = min(now, bars.index[-1] + pd.Timedelta(minutes=5))
+        elapsed = (as_of - today).total_seconds() / 60 - SESSION_OPEN
+        curve   = entries.get(t, {}).get("curve")
+        frac    = _session_fraction(np.asarray(curve) if curve else market, elapsed)
+        volume  = float(bars["Volume"].sum()) / max(frac, CONFIG["INTRADAY_MIN_FRACTION"])
+        snap[t] = pd.DataFrame({
+            "Open":   [float(bars["Open"].iloc[0])],
+            "High":   [float(bars["High"].max())],
+            "Low":    [float(bars["Low"].min())],
+            "Close":  [float(bars["Close"].iloc[-1])],
+            "Volume": [round(volume)],
+        }, index=pd.DatetimeIndex([today], name="Date"))
+    metrics.incr("intraday_bars", len(snap))
+    print(f"🕔 Intraday: {len(snap)}/{len(tickers)} barre provvisorie da 5m (volume proiettato)")
+    return snap
+
+def merge_intraday(histories: dict, snap: dict) -> dict:
+    """Sostituisce (o aggiunge) la barra di oggi con quella provvisoria dello snapshot."""
+    for t, bar in snap.items():
+        base = histories.get(t)
+        if base is not None:
+            histories[t] = pd.concat([base[base.index < bar.index[0]], bar])
+    return histories
+
+def _with_intraday(histories: dict) -> dict:
+    if CONFIG["INTRADAY_MODE"] and histories:
+        merge_intraday(histories, intraday_snapshot(list(histories)))
+    return histories
+
+# ==============================
+# 🎯 BREAKOUT PROXIMITY INDEX
+# ==============================
+def _analysis_window(df: pd.DataFrame) -> pd.DataFrame:
+    cutoff = pd.Timestamp(_ny_today()) - pd.Timedelta(days=CONFIG["STORE_ANALYSIS_DAYS"])
+    return df[df.index >= cutoff].copy()
+
+def proximity_gates() -> dict:
+    """
+    Soglie del funnel dalla strategia più permissiva tra le attive, così il funnel non scarta
+    ticker che una di loro accetterebbe:
+      vol_trigger = minimo sulle strategie del trigger su vol_ratio (0 se una non lo richiede)
+      price       = banda sulla resistenza solo se tutte richiedono price > resistance
+    ADX, IFS e liquidità non sono filtrati qui: li valuta l'analisi completa.
+    """
+    vol, price = [], []
+    for st in strategies or activate_strategies():
+        specs = st.engine.specs or CONFIG["SIGNAL_RULES"]
+        vol.append(max((float(st.engine.param(rhs) if isinstance(rhs, str) else rhs)
+                        for _, feature, op, rhs in specs
+                        if feature == "vol_ratio" and op in (">", ">=", "!<") and rhs not in FEATURE_COSTS),
+                       default=0.0))
+        price.append(any(feature == "price" and op in (">", ">=") and rhs == "resistance"
+                         for _, feature, op, rhs in specs))
+    return {"vol_trigger": min(vol), "price": all(price)}
+
+def _proximity_entry(final: pd.DataFrame, k: float):
+    """
+    Livelli di trigger per la prossima barra, dalle sole barre chiuse:
+      resistance = max High ultimi 20gg (= rolling(20).max().iloc[-2] domani)
+      vol_req    = volume oltre il quale vol_ratio > k (proximity_gates), con la media 20gg che include la barra:
+                   V > k·(S19 + V)/20  ⇔  V > k·S19 / (20 − k)
+    """
+    if len(final) < 60:
+        return None
+    high, low, close, vol = (final[c].to_numpy(float) for c in ("High", "Low", "Close", "Volume"))
+    tr  = np.fmax(np.fmax(high[-14:] - low[-14:], np.abs(high[-14:] - close[-15:-1])),
+                  np.abs(low[-14:] - close[-15:-1]))
+    atr = float(tr.mean())
+    res = float(high[-20:].max())
+    if not (atr > 0) or np.isnan(res):
+        return None
+    return {
+        "resistance": round(res, 4),
+        "atr":        round(atr, 4),
+        "vol_req":    round(k * float(vol[-19:].sum()) / (20 - k), 0),
+        "dist_atr":   round((res - float(close[-1])) / atr, 2),
+        "date":       final.index[-1].strftime("%Y-%m-%d"),
+    }
+
+def build_proximity_index(histories: dict, gates: dict = None) -> dict:
+    gates = gates or proximity_gates()
+    today = _ny_today()
+    entries = {}
+    for t, df in histories.items():
+        entry = _proximity_entry(df[df.index.date < today], gates["vol_trigger"])
+        if entry:
+            entries[t] = entry
+    return {"day": today.isoformat(), "gates": gates, "tickers": entries}
+
+def load_proximity_index() -> dict:
+    try:
+        with open(PROXIMITY_FILE) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_proximity_index(index: dict):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    def _write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+    _atomic_write(PROXIMITY_FILE, _write)
+
+def _is_near(entry: dict, bar: pd.Series, gates: dict) -> bool:
+    price, vol = float(bar["Close"]), float(bar["Volume"])
+    return ((not gates["price"] or price >= entry["resistance"] - CONFIG["PROXIMITY_ATR_BAND"] * entry["atr"])
+            and vol >= CONFIG["PROXIMITY_VOL_BAND"] * entry["vol_req"])
+
+def proximity_funnel(tickers: list) -> dict:
+    """
+    Primo run del giorno: store_update completo + ricostruzione indice (scan di tutti).
+    Run successivi: snapshot della sola barra di oggi, storico dallo store solo per i
+    ticker entro la banda dal trigger. Ritorna {ticker: DataFrame} come fetch_histories.
+    I ticker senza entry vengono aggiunti all'indice del giorno: chiamate a blocchi
+    (pipeline) costruiscono lo stesso indice di una chiamata unica. L'indice si ricostruisce
+    anche se cambiano le soglie delle strategie attive (proximity_gates).
+    """
+    gates = proximity_gates()
+    index = load_proximity_index()
+    if index.get("day") != _ny_today().isoformat() or index.get("gates") != gates:
+        histories = _with_intraday(store_update(tickers))
+        index = build_proximity_index(histories, gates)
+        save_proximity_index(index)
+        print(f"🎯 Proximity index ricostruito: {len(index['tickers'])} ticker")
+        return histories
+
+    entries = index["tickers"]
+    known   = [t for t in tickers if t in entries]
+    unknown = [t for t in tickers if t not in entries]
+    snap    = intraday_snapshot(known) if CONFIG["INTRADAY_MODE"] else {}
+    daily   = [t for t in known if t not in snap]   # fuori sessione o 5m non disponibili
+    if daily:
+        fresh = bulk_fetch_histories(daily, period="1d", interval="1d")
+        snap.update({t: _normalize_ohlcv(df).iloc[-1:] for t, df in fresh.items()})
+    near    = [t for t in known if t in snap and _is_near(entries[t], snap[t].iloc[-1], gates)]
+
+    histories = {}
+    for t in near:
+        base = store_load(t)
+        if base is None:
+            unknown.append(t)
+            continue
+        bar = snap[t]
+        histories[t] = _analysis_window(pd.concat([base[base.index < bar.index[0]], bar]))
+    if unknown:
+        fresh = _with_intraday(store_update(unknown))
+        histories.update(fresh)
+        added = build_proximity_index(fresh, gates)["tickers"]
+        if added:
+            entries.update(added)
+            save_proximity_index(index)
+    metrics.incr("proximity_near", len(near))
+    metrics.incr("proximity_far", len(known) - len(near))
+    print(f"🎯 Proximity: {len(near)}/{len(known)} ticker vicini al trigger"
+          + (f" | {len(unknown)} senza indice" if unknown else ""))
+    return histories
+
+# ==============================
+# 📅 EARNINGS CALENDAR
+# ==============================
+def _fetch_earnings_date(ticker: str):
+    """Prossima data earnings (ISO) o None se non nota. Solleva solo per rate limit."""
+    try:
+        cal = yf.Ticker(ticker, session=session).calendar
+    except Exception as e:
+        if _is_rate_limit(e):
+            raise
+        return None  # 404 (ETF, ticker senza calendario) → entry negativa
+    if cal is None:
+        return None
+    if isinstance(cal, dict):                      # yfinance >= 0.2.4x
+        raw = cal.get("Earnings Date")
+    elif not cal.empty and "Earnings Date" in cal.index:
+        raw = cal.loc["Earnings Date"]
+    else:
+        return None
+    if isinstance(raw, (list, tuple)):
+        raw = raw[0] if raw else None
+    elif hasattr(raw, "iloc"):
+        raw = raw.iloc[0] if len(raw) else None
+    if raw is None or pd.isna(raw):
+        return None
+    return pd.to_datetime(raw).date().isoformat()
+
+class EarningsCalendar:
+    """
+    Cache earnings thread-safe: {ticker: {"date": ISO | None, "fetched": ISO}}.
+    Anche "nessuna data nota" è un'entry (negative caching) con TTL proprio.
+    prefetch() scarica le mancanti prima dello scan (al massimo EARNINGS_PREFETCH_TIMEOUT s)
+    e rinfresca le scadute in background; lo scan legge solo dalla memoria.
+    """
+
+    def __init__(self, path: str, entries: dict = None):
+        self.path     = path
+        self.entries  = entries or {}
+        self._lock    = threading.Lock()
+        self._workers = []
+
+    @classmethod
+    def load(cls, path: str) -> "EarningsCalendar":
+        entries = {}
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if "entries" in data:
+                entries = data["entries"]
+            else:  # formato v14.5: {"updated": ..., "earnings": {ticker: date}}
+                fetched = data.get("updated", "2000-01-01")
+                entries = {t: {"date": d, "fetched": fetched} for t, d in data.get("earnings", {}).items()}
+        except Exception:
+            pass
+        return cls(path, entries)
+
+    def save(self):
+        with self._lock:
+            payload = {"updated": datetime.now().isoformat(), "entries": dict(self.entries)}
+        def _write(tmp):
+            with open(tmp, "w") as f:
+                json.dump(payload, f)
+        try:
+            _atomic_write(self.path, _write)
+        except Exception as e:
+            print(f"⚠️  Earnings cache non salvata: {e}")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _is_fresh(self, entry: dict, now: datetime) -> bool:
+        age = (now - datetime.fromisoformat(entry["fetched"])).total_seconds() / 86400
+        if entry.get("date") is None:
+            return age < CONFIG["EARNINGS_NEG_TTL_DAYS"]
+        passed = (now.date() - datetime.fromisoformat(entry["date"]).date()).days
+        return age < CONFIG["EARNINGS_TTL_DAYS"] and passed <= CONFIG["EARNINGS_LOOKBACK_DAYS"]
+
+    def _split(self, tickers: list):
+        now = datetime.now()
+        with self._lock:
+            missing = [t for t in tickers if t not in self.entries]
+            stale   = [t for t in tickers if t in self.entries and not self._is_fresh(self.entries[t], now)]
+        return missing, stale
+
+    async def _refresh_async(self, tickers: list):
+        sem  = asyncio.Semaphore(CONFIG["EARNINGS_CONCURRENCY"])
+        loop = asyncio.get_running_loop()
+
+        breaker = providers["yahoo"].breaker
+
+        async def one(t):
+            async with sem:
+                for attempt in range(CONFIG["YF_RETRIES"]):
+                    if breaker.state == "open":
+                        return   # yahoo giù: data ignota (is_clear → True), si riprova al prossimo run
+                    await rate_limiters["yahoo"].acquire()
+                    try:
+                        date = await loop.run_in_executor(executor, _fetch_earnings_date, t)
+                        breaker.record(True)
+                    except Exception:
+                        breaker.record(False)
+                        wait = _backoff_delay(attempt)
+                        rate_limiters["yahoo"].penalize(wait / 2)
+                        _count_throttle(wait)
+                        await asyncio.sleep(wait)
+                        continue
+                    with self._lock:
+                        self.entries[t] = {"date": date, "fetched": datetime.now().isoformat(timespec="seconds")}
+                    return
+
+        with ThreadPoolExecutor(max_workers=CONFIG["EARNINGS_CONCURRENCY"]) as executor:
+            await asyncio.gather(*(one(t) for t in tickers))
+
+    def _start(self, tickers: list) -> threading.Thread:
+        worker = threading.Thread(target=lambda: asyncio.run(self._refresh_async(tickers)), daemon=True)
+        worker.start()
+        self._workers = [w for w in self._workers if w.is_alive()] + [worker]
+        return worker
+
+    def prefetch(self, tickers: list):
+        """
+        Mancanti: scaricate subito (concorrenza limitata); con yahoo lento lo scan non le aspetta
+        oltre EARNINGS_PREFETCH_TIMEOUT e il resto finisce in background. Scadute: background.
+        """
+        missing, stale = self._split(tickers)
+        if missing:
+            print(f"📅 Earnings prefetch: {len(missing)} ticker senza calendario…")
+            with metrics.timer("earnings_prefetch"):
+                worker = self._start(missing)
+                worker.join(CONFIG["EARNINGS_PREFETCH_TIMEOUT"])
+            if worker.is_alive():
+                metrics.incr("earnings_prefetch_timeout")
+                print(f"⏱️  Earnings prefetch oltre {CONFIG['EARNINGS_PREFETCH_TIMEOUT']}s — "
+                      "completamento in background (data ignota = nessun blocco)")
+        if stale and not any(w.is_alive() for w in self._workers):
+            self._start(stale)
+            print(f"📅 Earnings refresh in background: {len(stale)} ticker")
+
+    def wait(self, timeout: float = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for w in self._workers:
+            w.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def _today(self):
+        return datetime.now().date()
+
+    def is_clear(self, ticker: str) -> bool:
+        """False se earnings dentro la finestra LOOKBACK/LOOKAHEAD; data ignota → True."""
+        with self._lock:
+            entry = self.entries.get(ticker)
+        if not entry or not entry.get("date"):
+            return True
+        try:
+            diff = (datetime.fromisoformat(entry["date"]).date() - self._today()).days
+            if -CONFIG["EARNINGS_LOOKBACK_DAYS"] <= diff <= CONFIG["EARNINGS_LOOKAHEAD_DAYS"]:
+                return False
+        except Exception:
+            pass
+        return True
+
+def load_earnings_cache() -> EarningsCalendar:
+    return EarningsCalendar.load(EARNINGS_CACHE)
+
+def save_earnings_cache(cache: EarningsCalendar):
+    cache.wait(timeout=CONFIG["EARNINGS_REFRESH_TIMEOUT"])
+    cache.save()
+
+@metrics.timed("earnings_check")
+def check_earnings_risk(ticker: str, cache: EarningsCalendar) -> bool:
+    return cache.is_clear(ticker)
+
+# ==============================
+# 🌍 UNIVERSE (costituenti, filtri mid-cap, shard)
+# ==============================
+_SYMBOL_COLUMNS = ("symbol", "ticker", "ticker symbol")
+_SECTOR_COLUMNS = ("gics sector", "sector")
+_MCAP_COLUMNS   = ("market_cap", "market cap", "marketcap")
+_ADV_COLUMNS    = ("dollar_volume", "avg_dollar_volume", "adv")
+
+def _normalize_symbol(symbol) -> str:
+    return str(symbol).strip().upper().replace(".", "-")   # BRK.B → BRK-B (formato Yahoo)
+
+def _pick_column(df: pd.DataFrame, names: tuple):
+    cols = {str(c).strip().lower(): c for c in df.columns}
+    return next((cols[n] for n in names if n in cols), None)
+
+def _read_universe_source(source: str) -> list:
+    """
+    Righe {ticker, sector, market_cap, adv, curated} da una sorgente:
+    "watchlist" (MY_WATCHLIST + SECTOR_MAP), URL con tabella HTML o CSV locale.
+    """
+    if source == "watchlist":
+        return [{"ticker": t, "sector": SECTOR_MAP.get(t, "Other"), "market_cap": None,
+                 "adv": None, "curated": True} for t in MY_WATCHLIST]
+    if source.startswith(("http://", "https://")):
+        resp = session.get(source, timeout=30)
+        resp.raise_for_status()
+        tables = pd.read_html(io.StringIO(resp.text))
+    else:
+        tables = [pd.read_csv(source)]
+
+    for table in tables:
+        sym = _pick_column(table, _SYMBOL_COLUMNS)
+        if sym is None:
+            continue
+        sec  = _pick_column(table, _SECTOR_COLUMNS)
+        mcap = _pick_column(table, _MCAP_COLUMNS)
+        adv  = _pick_column(table, _ADV_COLUMNS)
+        rows = []
+        for _, r in table.iterrows():
+            if pd.isna(r[sym]):
+                continue
+            rows.append({
+                "ticker":     _normalize_symbol(r[sym]),
+                "sector":     str(r[sec]).strip() if sec is not None and pd.notna(r[sec]) else "Other",
+                "market_cap": float(r[mcap]) if mcap is not None and pd.notna(r[mcap]) else None,
+                "adv":        float(r[adv]) if adv is not None and pd.notna(r[adv]) else None,
+                "curated":    False,
+            })
+        return rows
+    raise ValueError(f"nessuna colonna ticker/symbol in {source}")
+
+def _fetch_liquidity(ticker: str) -> dict:
+    """Market cap e controvalore medio (3 mesi) da fast_info. Solleva solo per rate limit."""
+    for attempt in range(CONFIG["YF_RETRIES"]):
+        rate_limiters["yahoo"].acquire_sync()
+        try:
+            info = yf.Ticker(ticker, session=session).fast_info
+            return {"market_cap": float(info["marketCap"]),
+                    "adv":        float(info["lastPrice"]) * float(info["threeMonthAverageVolume"])}
+        except Exception as e:
+            if not _is_rate_limit(e):
+                return {}
+            wait = _backoff_delay(attempt)
+            rate_limiters["yahoo"].penalize(wait)
+            _count_throttle(wait)
+    return {}
+
+def build_universe(sources: list) -> dict:
+    """Scarica/legge le sorgenti remote, completa market cap e liquidità mancanti, salva la cache."""
+    tables = {source: _read_universe_source(source) for source in sources}
+    rows   = [r for source in sources for r in tables[source]]
+
+    missing = sorted({r["ticker"] for r in rows if r["market_cap"] is None or r["adv"] is None})
+    if missing:
+        print(f"🌍 Universe: market cap/liquidità per {len(missing)} ticker…", flush=True)
+        with ThreadPoolExecutor(max_workers=CONFIG["UNIVERSE_CONCURRENCY"]) as ex:
+            info = dict(zip(missing, ex.map(_fetch_liquidity, missing)))
+        for r in rows:
+            for k, v in info.get(r["ticker"], {}).items():
+                if r[k] is None:
+                    r[k] = v
+
+    data = {"built": datetime.now().isoformat(timespec="seconds"), "sources": tables}
+    def _write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+    _atomic_write(UNIVERSE_FILE, _write)
+    return data
+
+def _universe_filter(r: dict) -> bool:
+    if r["curated"]:
+        return True
+    # dato mancante (fast_info fallito) → il ticker resta: lo filtra MIN_VOLUME_USD in fase di scan
+    if r["market_cap"] is not None and not (
+            CONFIG["UNIVERSE_MIN_MCAP"] <= r["market_cap"] <= CONFIG["UNIVERSE_MAX_MCAP"]):
+        return False
+    return r["adv"] is None or r["adv"] >= CONFIG["UNIVERSE_MIN_DOLLAR_VOL"]
+
+def load_universe(refresh: bool = False) -> dict:
+    """
+    Universo filtrato {ticker: settore}, in ordine di sorgente (a parità di ticker vince la prima).
+    Le tabelle remote restano in cache UNIVERSE_TTL_DAYS giorni; la watchlist si rilegge
+    sempre. I filtri si applicano a ogni chiamata: cambiare soglie non richiede un download.
+    """
+    if snapshots.replaying is not None:
+        return snapshots.json("universe")
+    sources = list(CONFIG["UNIVERSE_SOURCES"])
+    remote  = [s for s in sources if s != "watchlist"]
+    tables  = {}
+    if remote:
+        data = None
+        try:
+            with open(UNIVERSE_FILE) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            pass
+        stale = (data is None or any(s not in data["sources"] for s in remote)
+                 or datetime.now() - datetime.fromisoformat(data["built"])
+                    > timedelta(days=CONFIG["UNIVERSE_TTL_DAYS"]))
+        if refresh or stale:
+            try:
+                data = build_universe(remote)
+            except Exception as e:
+                print(f"⚠️  Universe refresh fallito ({e}) — "
+                      + (f"uso la cache del {data['built']}" if data else "uso solo MY_WATCHLIST"))
+        tables = data["sources"] if data else {}
+        if not tables:
+            sources = ["watchlist"]
+
+    universe, seen = {}, set()
+    for source in sources:
+        rows = _read_universe_source(source) if source == "watchlist" else tables.get(source, [])
+        for r in rows:
+            if r["ticker"] in seen:
+                continue
+            seen.add(r["ticker"])
+            if _universe_filter(r):
+                universe[r["ticker"]] = r["sector"]
+    metrics.incr("universe_total", len(seen))
+    snapshots.record_json("universe", universe)
+    return universe
+
+def parse_shard(spec: str) -> tuple:
+    """"i/N" → (i, N) con 0 ≤ i < N (tipo argparse per --shard)."""
+    try:
+        i, n = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"formato shard non valido: {spec!r} (atteso i/N)")
+    if n < 1 or not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"shard fuori range: {spec!r} (0 ≤ i < N)")
+    return i, n
+
+def shard_tickers(tickers, shard: tuple = None) -> list:
+    """
+    Fetta deterministica dell'universo: crc32(ticker) mod N. Ogni ticker resta nello stesso
+    shard anche quando l'universo cambia, quindi store e cache locali restano caldi.
+    """
+    if not shard:
+        return list(tickers)
+    i, n = shard
+    return [t for t in tickers if zlib.crc32(t.encode()) % n == i]
+
+def _shard_path(shard: tuple) -> str:
+    return os.path.join(SHARD_DIR, f"shard-{shard[0]}-of-{shard[1]}.json")
+
+def write_shard_results(shard: tuple, results: list, scanned: int, regime: bool = True):
+    """Candidati dello shard (prima di sector cap e MAX_ALERTS) per il merge."""
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    data = {"shard": shard[0], "of": shard[1], "created": datetime.now().isoformat(timespec="seconds"),
+            "regime": regime, "scanned": scanned, "results": results}
+    def _write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(data, f, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+    _atomic_write(_shard_path(shard), _write)
+    print(f"🧩 Shard {shard[0]}/{shard[1]}: {len(results)} candidati su {scanned} ticker → {_shard_path(shard)}")
+
+def load_shard_results(shard_dir: str = None) -> list:
+    """Candidati di tutti gli shard recenti; avvisa se manca qualche fetta."""
+    shard_dir = shard_dir or SHARD_DIR
+    cutoff    = datetime.now() - timedelta(minutes=CONFIG["SHARD_MAX_AGE_MIN"])
+    shards: dict = {}
+    try:
+        names = sorted(os.listdir(shard_dir))
+    except OSError:
+        names = []
+    for name in names:
+        if not (name.startswith("shard-") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(shard_dir, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  {name} non leggibile: {e}")
+            continue
+        if datetime.fromisoformat(data["created"]) < cutoff:
+            print(f"⏭️  {name} ignorato — più vecchio di {CONFIG['SHARD_MAX_AGE_MIN']} min")
+            continue
+        shards[(data["shard"], data["of"])] = data
+
+    if not shards:
+        return []
+    total = max(n for _, n in shards)
+    found = sorted(i for i, n in shards if n == total)
+    if len(found) < total:
+        print(f"⚠️  Merge parziale: shard {found} su {total}")
+    if any(not d["regime"] for d in shards.values()):
+        print("🛑 Almeno uno shard ha visto regime Bearish — merge annullato.")
+        return []
+
+    results, seen = [], set()
+    for (i, n), data in sorted(shards.items()):
+        if n != total:
+            continue
+        metrics.incr("universe", data["scanned"])
+        for r in data["results"]:
+            key = (r.get("strategy"), r["ticker"])
+            if key not in seen:
+                seen.add(key)
+                results.append(r)
+    return results
+
+# ==============================
+# 🎞️ SNAPSHOT (record / replay degli input di uno scan)
+# ==============================
+class SnapshotArchive:
+    """
+    Archivio degli input di ogni scan: storici, SPY, universo, calendari earnings e ticker
+    già alertati. Oggetti compressi e indirizzati per contenuto (sha256) in objects/; ogni run
+    è un manifest JSON {giorno}/{HHMMSS}.json che li referenzia. Gli storici sono salvati come
+    barre precedenti + ultima barra: le scansioni di una giornata condividono il prefisso.
+    In replay le funzioni di accesso ai dati leggono dal manifest aperto: niente rete,
+    store, trade log né Telegram.
+    """
+
+    def __init__(self, root: str):
+        self.root      = root
+        self.recording = None     # manifest del run in registrazione
+        self.replaying = None     # manifest del run in riproduzione
+        self.signals   = []       # segnali selezionati nel replay corrente
+        self._lock     = threading.Lock()
+        self._known    = set()    # oggetti già presenti su disco
+        self._frames   = {}       # cache oggetti letti in replay (prefissi condivisi)
+
+    # ---------- oggetti ----------
+    def _object_path(self, key: str) -> str:
+        return os.path.join(self.root, "objects", key[:2], f"{key}.z")
+
+    def _put(self, payload: bytes) -> str:
+        key = hashlib.sha256(payload).hexdigest()
+        if key in self._known:
+            return key
+        path = self._object_path(key)
+        if not os.path.exists(path):
+            data = zlib.compress(payload, 6)
+            def _write(tmp):
+                with open(tmp, "wb") as f:
+                    f.write(data)
+            _atomic_write(path, _write)
+        self._known.add(key)
+        return key
+
+    def _get(self, key: str) -> bytes:
+        with open(self._object_path(key), "rb") as f:
+            return zlib.decompress(f.read())
+
+    @staticmethod
+    def _frame_bytes(df: pd.DataFrame) -> bytes:
+        """Serializzazione deterministica (stesso contenuto → stessa chiave): header JSON + date ns + float64."""
+        df  = _flat_columns(df)
+        idx = pd.DatetimeIndex(df.index)
+        tz  = str(idx.tz) if idx.tz is not None else None
+        if tz:
+            idx = idx.tz_convert("UTC").tz_localize(None)
+        head = json.dumps({"columns": [str(c) for c in df.columns], "rows": len(df),
+                           "tz": tz, "name": df.index.name}).encode()
+        return (head + b"\n" + idx.values.astype("datetime64[ns]").astype("<i8").tobytes()
+                + df.to_numpy(dtype="<f8").tobytes())
+
+    @staticmethod
+    def _frame_from(payload: bytes) -> pd.DataFrame:
+        head, body = payload.split(b"\n", 1)
+        meta = json.loads(head)
+        n, k = meta["rows"], len(meta["columns"])
+        idx  = pd.DatetimeIndex(np.frombuffer(body[:8 * n], dtype="<i8").astype("datetime64[ns]"),
+                                name=meta["name"])
+        if meta["tz"]:
+            idx = idx.tz_localize("UTC").tz_convert(meta["tz"])
+        values = np.frombuffer(body[8 * n:], dtype="<f8").reshape(n, k)
+        return pd.DataFrame(values.copy(), index=idx, columns=meta["columns"])
+
+    def _frame(self, key: str) -> pd.DataFrame:
+        df = self._frames.get(key)
+        if df is None:
+            df = self._frames[key] = self._frame_from(self._get(key))
+        return df
+
+    # ---------- record ----------
+    def begin(self, already_alerted: set):
+        with self._lock:
+            self.recording = {"version": 1, "as_of": datetime.now().isoformat(timespec="seconds"),
+                              "histories": {}}
+        self.record_json("already_alerted", sorted(already_alerted))
+
+    def record_json(self, name: str, value):
+        if self.recording is None:
+            return
+        key = self._put(json.dumps(value).encode())
+        with self._lock:
+            if self.recording is not None:
+                self.recording[name] = key
+
+    def record_frame(self, name: str, df: pd.DataFrame):
+        if self.recording is None or df is None:
+            return
+        key = self._put(self._frame_bytes(df))
+        with self._lock:
+            if self.recording is not None:
+                self.recording[name] = key
+
+    def record_histories(self, histories: dict):
+        if self.recording is None or not histories:
+            return
+        keys = {t: [self._put(self._frame_bytes(df.iloc[:-1])), self._put(self._frame_bytes(df.iloc[-1:]))]
+                for t, df in histories.items() if df is not None and not df.empty}
+        with self._lock:
+            if self.recording is not None:
+                self.recording["histories"].update(keys)
+
+    def commit(self, earnings_cache: "EarningsCalendar" = None):
+        """Chiude il run in registrazione: calendari earnings, manifest su disco, pulizia dei giorni vecchi."""
+        if self.recording is None:
+            return None
+        if earnings_cache is not None:
+            with earnings_cache._lock:
+                self.record_json("earnings", dict(earnings_cache.entries))
+        with self._lock:
+            manifest, self.recording = self.recording, None
+        as_of = datetime.fromisoformat(manifest["as_of"])
+        path  = os.path.join(self.root, as_of.strftime("%Y-%m-%d"), as_of.strftime("%H%M%S") + ".json")
+        if os.path.exists(path):
+            path = path[:-5] + f"_{os.getpid()}.json"
+        def _write(tmp):
+            with open(tmp, "w") as f:
+                json.dump(manifest, f)
+        try:
+            _atomic_write(path, _write)
+            print(f"🎞️  Snapshot: {len(manifest['histories'])} storici → {path}")
+            self.prune(CONFIG["SNAPSHOT_KEEP_DAYS"])
+        except Exception as e:
+            print(f"⚠️  Snapshot non salvato: {e}")
+            return None
+        return path
+
+    def prune(self, keep_days: int):
+        """Elimina i giorni oltre keep_days e gli oggetti non più referenziati da nessun manifest."""
+        cutoff = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+        days   = sorted(d for d in os.listdir(self.root) if d != "objects"
+                        and os.path.isdir(os.path.join(self.root, d)))
+        old    = [d for d in days if d < cutoff]
+        if not old:
+            return
+        for d in old:
+            shutil.rmtree(os.path.join(self.root, d), ignore_errors=True)
+        live = set()
+        for d in days:
+            for path in glob.glob(os.path.join(self.root, d, "*.json")):
+                with open(path) as f:
+                    manifest = json.load(f)
+                live.update(v for k, v in manifest.items() if k not in ("version", "as_of", "histories"))
+                for keys in manifest["histories"].values():
+                    live.update(keys)
+        removed = 0
+        for path in glob.glob(os.path.join(self.root, "objects", "*", "*.z")):
+            if os.path.basename(path)[:-2] not in live:
+                os.remove(path)
+                removed += 1
+        self._known &= live
+        print(f"🎞️  Snapshot: rimossi {len(old)} giorni, {removed} oggetti")
+
+    # ---------- replay ----------
+    def manifests(self, spec: str) -> list:
+        """Manifest di un run (percorso .json) o di un'intera giornata (YYYY-MM-DD), in ordine."""
+        if os.path.isfile(spec):
+            return [spec]
+        return sorted(glob.glob(os.path.join(self.root, spec, "*.json")))
+
+    def open(self, path: str) -> dict:
+        with open(path) as f:
+            manifest = json.load(f)
+        self.replaying = manifest
+        self.signals   = []
+        return manifest
+
+    def close(self):
+        self.replaying = None
+        self._frames.clear()
+
+    @property
+    def as_of(self) -> datetime:
+        return datetime.fromisoformat(self.replaying["as_of"])
+
+    def json(self, name: str, default=None):
+        key = self.replaying.get(name)
+        return default if key is None else json.loads(self._get(key))
+
+    def frame(self, name: str):
+        key = self.replaying.get(name)
+        return None if key is None else self._frame(key).copy()
+
+    def histories(self, tickers: list) -> dict:
+        recorded = self.replaying["histories"]
+        return {t: pd.concat([self._frame(recorded[t][0]), self._frame(recorded[t][1])])
+                for t in tickers if t in recorded}
+
+snapshots = SnapshotArchive(SNAPSHOT_DIR)
+
+class SnapshotEarnings(EarningsCalendar):
+    """Calendario earnings registrato nello snapshot, valutato alla data del run. Nessun refresh."""
+
+    def __init__(self, entries: dict, as_of: datetime):
+        super().__init__(None, entries)
+        self.as_of = as_of
+
+    def _today(self):
+        return self.as_of.date()
+
+    def prefetch(self, tickers: list):
+        pass
+
+    def wait(self, timeout: float = None):
+        pass
+
+    def save(self):
+        pass
+
+def replay_snapshots(spec: str) -> list:
+    """
+    Riesegue run_scan sugli snapshot di `spec` (manifest o giorno YYYY-MM-DD) con la CONFIG
+    corrente, senza rete né effetti collaterali. Ritorna [(as_of, [ticker selezionati])].
+    """
+    paths = snapshots.manifests(spec)
+    if not paths:
+        print(f"❌ Nessuno snapshot per {spec} in {SNAPSHOT_DIR}")
+        return []
+    t0, out = time.perf_counter(), []
+    for path in paths:
+        manifest = snapshots.open(path)
+        print("=" * 70)
+        print(f"🎞️  REPLAY {manifest['as_of']} — {len(manifest['histories'])} storici")
+        print("=" * 70)
+        try:
+            earnings = SnapshotEarnings(snapshots.json("earnings", {}), snapshots.as_of)
+            skip     = snapshots.json("already_alerted", [])
+            # snapshot senza alert per strategia: lo stesso insieme per tutte le strategie attive
+            alerted  = snapshots.json("alerted", None) or {name: skip for name in CONFIG["ACTIVE_STRATEGIES"]}
+            set_alerted(alerted)
+            run_scan(earnings, set(skip))
+            primary = primary_strategy().name
+            out.append((manifest["as_of"], [r["ticker"] if r.get("strategy", primary) == primary
+                                            else f"{r['strategy']}:{r['ticker']}" for r in snapshots.signals]))
+        finally:
+            snapshots.close()
+        print("🔻 Funnel: " + " → ".join(f"{k} {v}" for k, v in metrics.to_dict()["funnel"].items()))
+    print(f"🎞️  Replay: {len(paths)} run in {time.perf_counter() - t0:.1f}s")
+    for as_of, tickers in out:
+        print(f"   {as_of}  {', '.join(tickers) or '—'}")
+    return out
+
+# ==============================
+# 📊 MARKET REGIME
+# ==============================
+def get_market_regime():
+    """SPY via store locale (se attivo) o provider: yfinance con stooq in failover/hedging."""
+    if snapshots.replaying is not None:
+        spy = snapshots.frame("spy")
+    elif CONFIG["STORE_ENABLED"]:
+        spy = store_update(["SPY"]).get("SPY")
+    else:
+        spy = fetch_history_with_retry("SPY", period="1y", interval="1d")
+    snapshots.record_frame("spy", spy)
+
+    if spy is None:
+        print("❌ SPY non disponibile da nessuna fonte.")
+        return False, None
+
+    if len(spy) < 60:
+        return False, None
+
+    spy["SMA50"] = spy["Close"].rolling(50).mean()
+    is_bull = float(spy["Close"].iloc[-1]) > float(spy["SMA50"].iloc[-1])
+    slope   = float(spy["SMA50"].iloc[-1]) > float(spy["SMA50"].iloc[-5])
+    print(f"📡 SPY: ${float(spy['Close'].iloc[-1]):.2f} | SMA50: ${float(spy['SMA50'].iloc[-1]):.2f} | {'🟢 BULL' if is_bull else '🔴 BEAR'}")
+    return bool(is_bull and slope), spy
+
+# ==============================
+# 🧠 HELPER: ADX Calculator
+# ==============================
+@metrics.timed("adx")
+def calc_adx(df: pd.DataFrame, period: int = 14) -> float:
+    """Calcola ADX (Average Directional Index) — misura forza del trend"""
+    try:
+        high  = df["High"]
+        low   = df["Low"]
+        close = df["Close"]
+
+        # True Range
+        tr = pd.concat([
+            high - low,
+            (high - close.shift()).abs(),
+            (low  - close.shift()).abs(),
+        ], axis=1).max(axis=1)
+
+        # Directional Movement
+        dm_plus  = (high - high.shift()).clip(lower=0)
+        dm_minus = (low.shift() - low).clip(lower=0)
+        # Se DM+ < DM- o DM- < DM+, zero l'altro
+        dm_plus  = dm_plus.where(dm_plus > dm_minus, 0)
+        dm_minus = dm_minus.where(dm_minus > dm_plus, 0)
+
+        # Smoothed (Wilder)
+        atr_s    = tr.ewm(alpha=1/period, adjust=False).mean()
+        di_plus  = 100 * dm_plus.ewm(alpha=1/period, adjust=False).mean() / atr_s
+        di_minus = 100 * dm_minus.ewm(alpha=1/period, adjust=False).mean() / atr_s
+
+        dx = (100 * (di_plus - di_minus).abs() / (di_plus + di_minus).replace(0, np.nan))
+        adx = dx.ewm(alpha=1/period, adjust=False).mean()
+        return float(adx.iloc[-1])
+    except Exception:
+        return 0.0
+
+# ==============================
+# 🧷 INDICATOR STATE (incrementale, O(1) per barra)
+# ==============================
+ADX_PERIOD = 14
+
+def _ewm_step(w, old_wt, cur, alpha: float):
+    """Un passo di ewm(alpha, adjust=False) identico a pandas (scalari o array per ticker)."""
+    w, old_wt, cur = np.asarray(w, dtype=float), np.asarray(old_wt, dtype=float), np.asarray(cur, dtype=float)
+    obs    = ~np.isnan(cur)
+    have   = ~np.isnan(w)
+    old_wt = np.where(have, old_wt * (1.0 - alpha), old_wt)
+    upd    = have & obs
+    with np.errstate(invalid="ignore"):
+        mixed = (old_wt * w + alpha * cur) / (old_wt + alpha)
+    w      = np.where(upd & (w != cur), mixed, w)
+    old_wt = np.where(upd, 1.0, old_wt)
+    w      = np.where(~have & obs, cur, w)
+    return w, old_wt
+
+def _adx_step(acc: dict, h, l, c, ph, pl, pc, period: int = ADX_PERIOD) -> dict:
+    """
+    Aggiunge una barra agli accumulatori Wilder {"tr","dmp","dmm","dx": (w, old_wt)}.
+    Stessa formula di calc_adx; ph/pl/pc = barra precedente (NaN alla prima barra).
+    """
+    h, l, c, ph, pl, pc = (np.asarray(x, dtype=float) for x in (h, l, c, ph, pl, pc))
+    alpha = 1 / period
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tr       = np.fmax(np.fmax(h - l, np.abs(h - pc)), np.abs(l - pc))
+        dm_plus  = np.maximum(h - ph, 0)
+        dm_minus = np.maximum(pl - l, 0)
+        dm_plus  = np.where(dm_plus > dm_minus, dm_plus, 0.0)
+        dm_minus = np.where(dm_minus > dm_plus, dm_minus, 0.0)
+        out = {k: _ewm_step(*acc[k], x, alpha) for k, x in (("tr", tr), ("dmp", dm_plus), ("dmm", dm_minus))}
+        atr_s    = out["tr"][0]
+        di_plus  = 100 * out["dmp"][0] / atr_s
+        di_minus = 100 * out["dmm"][0] / atr_s
+        denom    = di_plus + di_minus
+        dx       = 100 * np.abs(di_plus - di_minus) / np.where(denom == 0, np.nan, denom)
+    out["dx"] = _ewm_step(*acc["dx"], dx, alpha)
+    return out
+
+def _ewm_step_scalar(w: float, old_wt: float, cur: float, alpha: float) -> tuple:
+    """_ewm_step per un solo ticker su float Python: stesse operazioni, senza overhead numpy."""
+    if w == w:                                   # w già inizializzato (non NaN)
+        old_wt = old_wt * (1.0 - alpha)
+        if cur == cur:
+            if w != cur:
+                w = (old_wt * w + alpha * cur) / (old_wt + alpha)
+            old_wt = 1.0
+    elif cur == cur:
+        w = cur
+    return w, old_wt
+
+def _adx_step_scalar(acc: dict, h: float, l: float, c: float, ph: float, pl: float, pc: float,
+                     period: int = ADX_PERIOD) -> dict:
+    """_adx_step per un solo ticker (push di IndicatorState); risultati identici bit a bit."""
+    alpha = 1 / period
+    tr    = h - l
+    if pc == pc:
+        tr = max(tr, abs(h - pc), abs(l - pc))
+    up, down = h - ph, pl - l                    # NaN alla prima barra
+    dm_plus  = max(up, 0.0) if up == up else up
+    dm_minus = max(down, 0.0) if down == down else down
+    dm_plus  = dm_plus if dm_plus > dm_minus else 0.0
+    dm_minus = dm_minus if dm_minus > dm_plus else 0.0
+    out = {k: _ewm_step_scalar(*acc[k], x, alpha) for k, x in (("tr", tr), ("dmp", dm_plus), ("dmm", dm_minus))}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        atr_s    = np.float64(out["tr"][0])
+        di_plus  = 100 * out["dmp"][0] / atr_s
+        di_minus = 100 * out["dmm"][0] / atr_s
+        denom    = di_plus + di_minus
+        dx       = float(100 * abs(di_plus - di_minus) / (np.nan if denom == 0 else denom))
+    out["dx"] = _ewm_step_scalar(*acc["dx"], dx, alpha)
+    return out
+
+class RollingWindow:
+    """
+    Ultimi `size` valori con somma corrente: append ed evict O(1). I NaN sono contati a parte
+    (media NaN finché uno resta nella finestra); ogni `size` evict la somma si riallinea con
+    fsum, così l'errore di arrotondamento non cresce con il numero di barre.
+    """
+    __slots__ = ("size", "values", "total", "nans", "_evicted")
+
+    def __init__(self, size: int, values=()):
+        self.size, self.values = size, deque()
+        self.total, self.nans, self._evicted = 0.0, 0, 0
+        for x in values:
+            self.append(float(x))
+
+    def append(self, x: float):
+        self.values.append(x)
+        if x == x:
+            self.total += x
+        else:
+            self.nans += 1
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            if old == old:
+                self.total -= old
+            else:
+                self.nans -= 1
+            self._evicted += 1
+            if self._evicted >= self.size:
+                self.total, self._evicted = math.fsum(v for v in self.values if v == v), 0
+
+    def copy(self) -> "RollingWindow":
+        w = RollingWindow(self.size)
+        w.values, w.total, w.nans, w._evicted = deque(self.values), self.total, self.nans, self._evicted
+        return w
+
+    def mean(self) -> float:
+        if len(self.values) < self.size or self.nans:
+            return np.nan
+        return self.total / self.size
+
+    def __len__(self):
+        return len(self.values)
+
+class IndicatorState:
+    """
+    Stato indicatori di un ticker fino all'ultima barra chiusa:
+    accumulatori Wilder (ADX/ATR), max 20gg su deque monotona, somme mobili
+    Volume(20) e True Range(14). push() è O(1); provisional() applica la barra
+    parziale di oggi e rollback() la annulla (finestre e somme ripristinate dallo snapshot).
+    """
+    HIGH_WIN = 20
+    VOL_WIN  = 20
+    ATR_WIN  = 14
+
+    def __init__(self):
+        self.date  = None                       # ultima barra applicata (YYYY-MM-DD)
+        self.prev  = [np.nan, np.nan, np.nan]   # High/Low/Close ultima barra
+        self.acc   = {k: [np.nan, 1.0] for k in ("tr", "dmp", "dmm", "dx")}
+        self.seq   = 0
+        self.high_max   = deque()               # deque monotona [[seq, high], ...]
+        self.resistance = np.nan                # max High dei 20gg prima dell'ultima barra
+        self.vol_win = RollingWindow(self.VOL_WIN)
+        self.tr_win  = RollingWindow(self.ATR_WIN)
+        self._saved  = None
+
+    # --- aggiornamento ---
+    def push(self, date, h: float, l: float, c: float, v: float):
+        h, l, c = float(h), float(l), float(c)
+        ph, pl, pc = self.prev
+        if h == h and l == l and c == c:
+            acc = _adx_step_scalar(self.acc, h, l, c, ph, pl, pc)
+        else:
+            acc = _adx_step(self.acc, h, l, c, ph, pl, pc)
+        self.acc = {k: [float(w), float(o)] for k, (w, o) in acc.items()}
+
+        tr = max(h - l, abs(h - pc), abs(l - pc)) if pd.notna(pc) else h - l
+        self.vol_win.append(float(v))
+        self.tr_win.append(float(tr))
+
+        # resistenza = max dei 20 High precedenti, poi entra la barra nuova
+        self.resistance = self.high_max[0][1] if len(self.high_max) and self.seq >= self.HIGH_WIN else np.nan
+        while self.high_max and self.high_max[-1][1] <= h:
+            self.high_max.pop()
+        self.high_max.append([self.seq, float(h)])
+        self.seq += 1
+        while self.high_max[0][0] <= self.seq - 1 - self.HIGH_WIN:
+            self.high_max.popleft()
+
+        self.prev = [float(h), float(l), float(c)]
+        self.date = pd.Timestamp(date).strftime("%Y-%m-%d")
+
+    def provisional(self, date, h: float, l: float, c: float, v: float):
+        """Applica la barra parziale di oggi; rollback() torna all'ultima barra chiusa."""
+        self.rollback()
+        self._saved = self._snapshot()
+        self.push(date, h, l, c, v)
+
+    def rollback(self):
+        if self._saved is not None:
+            saved, self._saved = self._saved, None
+            self.__dict__.update(saved)
+
+    def _snapshot(self) -> dict:
+        # copia delle finestre con le loro somme correnti: il rollback non ricalcola nulla
+        snap = {k: v for k, v in self.__dict__.items() if k != "_saved"}
+        snap.update(prev=list(self.prev), acc={k: list(v) for k, v in self.acc.items()},
+                    high_max=deque(list(x) for x in self.high_max),
+                    vol_win=self.vol_win.copy(), tr_win=self.tr_win.copy())
+        return snap
+
+    # --- valori correnti ---
+    @property
+    def adx(self) -> float:
+        return self.acc["dx"][0]
+
+    @property
+    def atr(self) -> float:
+        return self.tr_win.mean()
+
+    @property
+    def vol_mean(self) -> float:
+        return self.vol_win.mean()
+
+    # --- persistenza ---
+    def to_dict(self) -> dict:
+        return {
+            "date": self.date, "prev": list(self.prev), "acc": {k: list(v) for k, v in self.acc.items()},
+            "seq": self.seq, "high_max": [list(x) for x in self.high_max], "resistance": self.resistance,
+            "vol_win": list(self.vol_win.values), "tr_win": list(self.tr_win.values),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IndicatorState":
+        st = cls()
+        for k, v in data.items():
+            setattr(st, k, v)
+        st.high_max = deque(list(x) for x in data.get("high_max", ()))
+        st.vol_win  = RollingWindow(cls.VOL_WIN, data.get("vol_win", ()))
+        st.tr_win   = RollingWindow(cls.ATR_WIN, data.get("tr_win", ()))
+        return st
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame) -> "IndicatorState":
+        st = cls()
+        for date, h, l, c, v in zip(df.index, df["High"].to_numpy(float), df["Low"].to_numpy(float),
+                                    df["Close"].to_numpy(float), df["Volume"].to_numpy(float)):
+            st.push(date, h, l, c, v)
+        return st
+
+    def advance(self, df: pd.DataFrame):
+        """Applica solo le barre successive a self.date."""
+        new = df[df.index > pd.Timestamp(self.date)] if self.date else df
+        for date, h, l, c, v in zip(new.index, new["High"].to_numpy(float), new["Low"].to_numpy(float),
+                                    new["Close"].to_numpy(float), new["Volume"].to_numpy(float)):
+            self.push(date, h, l, c, v)
+
+# ==============================
+# 🧠 INSTITUTIONAL FLOW SCORE (10-point)
+# ==============================
+@metrics.timed("ifs_score")
+def ifs_features(df: pd.DataFrame, rs_val: float, spy_df: pd.DataFrame) -> dict:
+    """
+    Grandezze grezze delle componenti IFS per un solo storico (le soglie sono in
+    CONFIG["IFS_RULES"]). NaN = componente non calcolabile (nessun punto).
+    """
+    feats = {"rs_val": rs_val}
+
+    # 1. Volume accumulation: giorni degli ultimi 5 sopra la media 20gg
+    avg20 = df["Volume"].rolling(20).mean()
+    feats["accum_days"] = int((df["Volume"].iloc[-5:] > avg20.iloc[-5:]).sum())
+
+    # 2. VCP range compression: range medio 20gg − range medio 5gg
+    hl  = df["High"] - df["Low"]
+    r5  = float(hl.rolling(5).mean().iloc[-1])
+    r20 = float(hl.rolling(20).mean().iloc[-1])
+    feats["vcp_gap"] = r20 - r5 if pd.notna(r5) and pd.notna(r20) and r20 > 0 else np.nan
+
+    # 4. Bullish close structure: posizione della chiusura nel range del giorno
+    day_range = float(df["High"].iloc[-1]) - float(df["Low"].iloc[-1])
+    feats["close_pos"] = ((float(df["Close"].iloc[-1]) - float(df["Low"].iloc[-1])) / day_range
+                          if day_range > 0 else np.nan)
+
+    # 5. RS Line new high: scarto dal massimo dei 20gg precedenti
+    feats["rs_line_gap"] = np.nan
+    try:
+        # RS Line = Close ticker / Close SPY (allineati per data)
+        aligned = df["Close"].align(spy_df["Close"], join="inner")
+        rs_line = aligned[0] / aligned[1]
+        if len(rs_line) >= 21:
+            feats["rs_line_gap"] = float(rs_line.iloc[-1]) - float(rs_line.iloc[-21:-1].max())
+    except Exception:
+        pass
+
+    # 6. Volume dry-up: giorni dei 3 pre-breakout sotto VOLUME_DRYUP_RATIO · media 20gg
+    feats["dry_days"] = np.nan
+    try:
+        feats["dry_days"] = int((df["Volume"].iloc[-4:-1]
+                                 < avg20.iloc[-4:-1] * CONFIG["VOLUME_DRYUP_RATIO"]).sum())
+    except Exception:
+        pass
+    return feats
+
+def institutional_score(df: pd.DataFrame, rs_val: float, spy_df: pd.DataFrame) -> tuple:
+    """
+    Score 0-10 dalle componenti di CONFIG["IFS_RULES"] (default):
+      +2  Volume accumulation   (3/5 giorni sopra media 20gg)
+      +2  Range compression VCP (range 5gg < range 20gg)
+      +2  Relative strength     (sovraperformance SPY 63gg)
+      +1  Bullish close         (chiusura top 25% range giornaliero)
+      +2  RS Line new high      (RS line fa nuovo max con il breakout)
+      +1  Volume dry-up         (3gg prima del breakout: volumi < 50% media)
+
+    ADX viene restituito separatamente come filtro hard (non nel score).
+    """
+    if len(df) < 30:
+        return 0, 0.0
+    feats = ifs_features(df, rs_val, spy_df)
+    return int(ifs_points(feats.get)), calc_adx(df)
+
+# ==============================
+# 🔎 ANALYZE TICKER
+# ==============================
+def _build_signal(ticker: str, price: float, resistance: float, vol_ratio: float,
+                  rs_val: float, ifs: int, adx: float, atr: float, strategy: "Strategy" = None):
+    """
+    Stop/target/size dal breakout confermato (comune a analyze_ticker e panel engine),
+    con i moltiplicatori della strategia (default: la primaria).
+    """
+    if pd.isna(atr) or atr == 0:
+        return None
+
+    strategy  = strategy or primary_strategy()
+    cfg       = strategy.config
+    stop_loss = price - atr * cfg["STOP_ATR_MULT"]
+    risk      = price - stop_loss
+    if risk <= 0:
+        return None
+
+    target = price + risk * cfg["TARGET_R_MULT"]
+    size   = int((cfg["TOTAL_EQUITY"] * cfg["RISK_PER_TRADE_PERCENT"]) / risk)
+    strike = round(price * (1 + CONFIG["OPTIONS_OTM_PCT"]))
+    label  = "⚡ OPTION SWEEP" if vol_ratio > 2.0 else "🧊 ACCUMULATION"
+
+    result = {
+        "ticker":    ticker,
+        "price":     round(price, 2),
+        "ifs":       ifs,
+        "label":     label,
+        "strike":    strike,
+        "tg":        round(target, 2),
+        "sl":        round(stop_loss, 2),
+        "rs":        round(rs_val * 100, 1),
+        "size":      size,
+        "prob":      min(50 + ifs * 5, 92),  # scala su 10 punti
+        "sector":    sector_of(ticker),
+        "r1":        round(resistance, 2),
+        "r2":        round(price + atr * 2, 2),
+        "vol_ratio": round(vol_ratio, 2),
+        "adx":       round(adx, 1),
+        "strategy":  strategy.name,
+    }
+    print(f"   🚨 SEGNALE: {strategy.tag}{ticker} | IFS {ifs}/10 | ADX {adx:.1f} | ${round(price,2)} | {label}", flush=True)
+    return result
+
+def _earnings_skip(ticker: str, earnings_cache: EarningsCalendar = None) -> bool:
+    if earnings_cache is not None and not check_earnings_risk(ticker, earnings_cache):
+        print(f"   ⚠️  {ticker} — earnings imminenti, skip", flush=True)
+        metrics.incr("earnings_skip")
+        return True
+    return False
+
+def _signal_from_row(ticker: str, row, earnings_cache: EarningsCalendar = None, strategy: "Strategy" = None):
+    """Breakout che ha superato le regole della strategia → controllo earnings e segnale (o None)."""
+    if _earnings_skip(ticker, earnings_cache):
+        return None
+    return _build_signal(ticker, float(row["price"]), float(row["resistance"]), float(row["vol_ratio"]),
+                         float(row["rs_val"]), int(row["ifs"]), float(row["adx"]), float(row["atr"]), strategy)
+
+def analyze_ticker(ticker: str, spy_df: pd.DataFrame,
+                   already_alerted: set, earnings_cache: EarningsCalendar,
+                   df: pd.DataFrame = None):
+    """Scan di un ticker con la sola strategia primaria: segnale o None."""
+    signals = analyze_strategies(ticker, spy_df, already_alerted, earnings_cache, df, [primary_strategy()])
+    return signals[0] if signals else None
+
+def analyze_strategies(ticker: str, spy_df: pd.DataFrame,
+                       already_alerted: set, earnings_cache: EarningsCalendar,
+                       df: pd.DataFrame = None, active: list = None) -> list:
+    """
+    Scan di un ticker per le strategie attive (scan_threaded): fetch, earnings e feature una
+    volta sola, poi le regole di ogni strategia sullo stesso FrameFeatures.
+    Ritorna i segnali, uno per strategia che seleziona il ticker.
+    """
+    active = active or strategies or activate_strategies()
+    print(f"🔎 Scanning: {ticker}", flush=True)
+    if ticker in already_alerted:
+        print(f"   ⏭️  {ticker} — già alertato oggi", flush=True)
+        return []
+    if not check_earnings_risk(ticker, earnings_cache):
+        print(f"   ⚠️  {ticker} — earnings imminenti, skip", flush=True)
+        metrics.incr("earnings_skip")
+        return []
+    metrics.funnel_add("scanned")
+    try:
+        if df is None:
+            # modalità singola (BATCH_DOWNLOAD disattivato)
+            if snapshots.replaying is not None:
+                df = snapshots.histories([ticker]).get(ticker)
+            else:
+                time.sleep(random.uniform(0.2, 0.6))
+                df = fetch_history_with_retry(ticker, period="1y", interval="1d")
+                snapshots.record_histories({ticker: df} if df is not None else {})
+        if df is None or len(df) < 60:
+            return []
+        source   = FrameFeatures({ticker: df}, spy_df)
+        signals  = []
+        rejected = None
+        for st in active:
+            alive, report = st.engine.evaluate(source, st.members(source.index))
+            st.engine.record(report)
+            if len(alive):
+                res = _signal_from_row(ticker, source.table(alive).iloc[0], strategy=st)
+                if res:
+                    signals.append(res)
+            elif st.primary:
+                rejected = next((r["rule"] for r in report if r["seen"] and not r["passed"]), None)
+        if signals:
+            return signals
+        if rejected == "adx":
+            adx = float(source.get("adx", np.arange(1))[0])
+            print(f"   📉 {ticker} — ADX {adx:.1f} < {CONFIG['MIN_ADX']}, trend debole skip", flush=True)
+            return []
+        if rejected not in ("resistance", "breakout"):
+            return []
+
+    except Exception as e:
+        print(f"   ❌ {ticker} — errore: {e}", flush=True)
+        return []
+    print(f"   ➖ {ticker} — nessun breakout", flush=True)
+    return []
+
+# ==============================
+# 🧮 PANEL ENGINE (date × ticker, vettoriale)
+# ==============================
+def _flat_columns(df: pd.DataFrame) -> pd.DataFrame:
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.copy()
+        df.columns = df.columns.get_level_values(0)
+    return df
+
+def build_panel(histories: dict, spy_df: pd.DataFrame) -> dict:
+    """
+    Impila Close/High/Low/Volume di tutti i ticker in array 2-D (date × ticker)
+    sul calendario comune (unione delle date). Celle mancanti = NaN.
+    """
+    frames = {}
+    for t, df in histories.items():
+        if df is None or df.empty:
+            continue
+        df = _flat_columns(df)
+        if not df.index.is_unique:
+            df = df[~df.index.duplicated(keep="last")]
+        frames[t] = df
+    tickers = list(frames)
+    panel = {"tickers": tickers, "col": {t: i for i, t in enumerate(tickers)}}
+    if not tickers:
+        panel["dates"] = pd.DatetimeIndex([])
+        return panel
+    dates = pd.DatetimeIndex(np.unique(np.concatenate(
+        [frames[t].index.values.astype("datetime64[ns]") for t in tickers])))
+    panel["dates"] = dates
+    fields = ["Close", "High", "Low", "Volume"]
+    stack  = np.full((len(fields), len(dates), len(tickers)), np.nan)
+    for j, t in enumerate(tickers):
+        df   = frames[t]
+        rows = dates.searchsorted(df.index.values.astype("datetime64[ns]"))
+        cols = list(df.columns)
+        stack[:, rows, j] = df.to_numpy(dtype=float)[:, [cols.index(f) for f in fields]].T
+    for k, f in enumerate(fields):
+        panel[f.lower()] = stack[k]
+    spy_close = _flat_columns(spy_df)["Close"]
+    panel["spy"]    = spy_close.reindex(dates).to_numpy(dtype=float)
+    panel["spy_rs"] = float(spy_close.pct_change(63, fill_method=None).iloc[-1])
+    return panel
+
+def _ewm_wilder(x: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    ewm(alpha, adjust=False).mean() colonna per colonna, stessa ricorsione di pandas
+    (NaN iniziali saltati, NaN interni decadono il peso) — un'iterazione per data, non per ticker.
+    """
+    out    = np.empty_like(x)
+    w      = x[0].copy()
+    old_wt = np.ones(x.shape[1])
+    out[0] = w
+    for i in range(1, len(x)):
+        w, old_wt = _ewm_step(w, old_wt, x[i], alpha)
+        out[i] = w
+    return out
+
+def _window(x: np.ndarray, last: np.ndarray, size: int, offset: int = 0) -> np.ndarray:
+    """Finestra (size × ticker) che termina alla riga last-offset di ogni colonna."""
+    rows = last[None, :] - offset - np.arange(size)[::-1][:, None]
+    return x[np.clip(rows, 0, len(x) - 1), np.arange(x.shape[1])[None, :]]
+
+def panel_adx(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+              first: np.ndarray, period: int = ADX_PERIOD) -> np.ndarray:
+    """Wilder ADX su tutto il pannello — stessa formula di calc_adx."""
+    T = len(close)
+    prev_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+    prev_high  = np.vstack([np.full((1, high.shape[1]), np.nan), high[:-1]])
+    prev_low   = np.vstack([np.full((1, low.shape[1]), np.nan), low[:-1]])
+    before     = np.arange(T)[:, None] < first[None, :]
+
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+    dm_plus  = np.maximum(high - prev_high, 0)
+    dm_minus = np.maximum(prev_low - low, 0)
+    dm_plus  = np.where(dm_plus > dm_minus, dm_plus, 0.0)
+    dm_minus = np.where(dm_minus > dm_plus, dm_minus, 0.0)
+    dm_plus[before]  = np.nan    # righe prima della quotazione: fuori serie
+    dm_minus[before] = np.nan
+
+    alpha = 1 / period
+    with np.errstate(divide="ignore", invalid="ignore"):
+        atr_s    = _ewm_wilder(tr, alpha)
+        di_plus  = 100 * _ewm_wilder(dm_plus, alpha) / atr_s
+        di_minus = 100 * _ewm_wilder(dm_minus, alpha) / atr_s
+        denom    = di_plus + di_minus
+        dx       = 100 * np.abs(di_plus - di_minus) / np.where(denom == 0, np.nan, denom)
+    return _ewm_wilder(dx, alpha)
+
+def _panel_adx_from_states(panel: dict, last: np.ndarray, fast: np.ndarray, states: dict):
+    """
+    ADX dall'IndicatorState: un solo passo Wilder (vettoriale) con l'ultima barra del pannello.
+    Ritorna (adx, coperti); i ticker senza stato allineato restano a NaN / False.
+    """
+    N       = len(panel["tickers"])
+    adx     = np.full(N, np.nan)
+    covered = np.zeros(N, dtype=bool)
+    dates   = panel["dates"]
+    step_j, step_s = [], []
+    for j, t in enumerate(panel["tickers"]):
+        st = states.get(t)
+        if st is None or st.date is None or not fast[j]:
+            continue
+        if st.date == dates[last[j]].strftime("%Y-%m-%d"):
+            adx[j], covered[j] = st.adx, True          # nessuna barra parziale
+        elif last[j] > 0 and st.date == dates[last[j] - 1].strftime("%Y-%m-%d"):
+            step_j.append(j)
+            step_s.append(st)
+    if step_j:
+        j   = np.array(step_j)
+        acc = {k: (np.array([s.acc[k][0] for s in step_s]), np.array([s.acc[k][1] for s in step_s]))
+               for k in ("tr", "dmp", "dmm", "dx")}
+        ph, pl, pc = (np.array([s.prev[i] for s in step_s]) for i in range(3))
+        row = last[j]
+        out = _adx_step(acc, panel["high"][row, j], panel["low"][row, j], panel["close"][row, j], ph, pl, pc)
+        adx[j], covered[j] = out["dx"][0], True
+    return adx, covered
+
+@metrics.timed("panel_score")
+def panel_score_table(histories: dict, spy_df: pd.DataFrame, states: dict = None) -> pd.DataFrame:
+    """
+    Calcola per tutti i ticker in un colpo: resistenza 20gg, RS 63gg vs SPY, ATR(14),
+    ADX Wilder e le componenti IFS (CONFIG["IFS_RULES"]). Una riga per ticker.
+    "fast" = False se la serie ha buchi interni o non è allineata a SPY: quei ticker
+    vanno valutati con FrameFeatures (stessa logica, per-ticker).
+    Con states (IndicatorState) l'ADX costa un passo per ticker invece dell'intera storia.
+    Tabella completa (diagnostica / parity check): lo scan usa score_strategies, che
+    calcola le feature costose solo per i ticker che superano le regole economiche.
+    """
+    src = PanelFeatures(histories, spy_df, states)
+    if not len(src.index):
+        return pd.DataFrame()
+    cols = np.arange(len(src.index))
+    out  = {"fast": src.fast}
+    for f in ("price", "vol_last", "vol_mean", "vol_ratio", "resistance", "rs_val", "atr", "adx"):
+        out[f] = src.get(f, cols)
+    out["ifs"] = src.get("ifs", cols).astype(int)
+    with np.errstate(invalid="ignore"):
+        for name, feature, op, thr, points in CONFIG["IFS_RULES"]:
+            out[name] = np.where(_RULE_OPS[op](src.get(feature, cols), _threshold(thr)), points, 0)
+        liquid = src.base & (src.get("dollar_vol", cols) >= CONFIG["MIN_VOLUME_USD"])
+        out["liquid"]   = liquid
+        out["breakout"] = liquid & (out["price"] > out["resistance"]) & (out["vol_ratio"] > CONFIG["VOL_TRIGGER"])
+    return pd.DataFrame(out, index=src.index)
+
+def panel_parity_check(histories: dict, spy_df: pd.DataFrame, states: dict = None,
+                       rtol: float = 1e-9) -> pd.DataFrame:
+    """
+    Confronta le feature dello scan (pannello per i ticker "fast", FrameFeatures per gli altri,
+    come score_strategies) con institutional_score/calc_adx/ATR ticker per ticker, su tutti i
+    ticker: anche chi è scartato (storia corta, warmup NaN, volume nullo) deve esserlo da
+    entrambe le parti (campo "eligible").
+    """
+    spy_df = _flat_columns(spy_df)
+    spy_rs = float(spy_df["Close"].pct_change(63, fill_method=None).iloc[-1])
+    panel  = PanelFeatures(histories, spy_df, states)
+    fast   = set(panel.index[panel.fast])
+    frames = FrameFeatures({t: df for t, df in histories.items() if t not in fast}, spy_df)
+    fields = ("ifs", "adx", "atr", "rs_val", "resistance", "vol_mean")
+    scan   = {}
+    for src in (panel, frames):
+        rows = np.flatnonzero(src.base)
+        vals = {k: src.get(k, rows) for k in fields}
+        scan.update({t: {k: vals[k][i] for k in fields} for i, t in enumerate(src.index[rows])})
+
+    out = []
+    for t, df in histories.items():
+        df  = _flat_columns(df) if df is not None else None
+        ok  = df is not None and len(df) >= 60 and FrameFeatures._basic(df, spy_rs) is not None
+        if ok != (t in scan):
+            out.append({"ticker": t, "field": "eligible", "panel": t in scan, "reference": ok})
+        if not ok or t not in scan:
+            continue
+        rs_val   = float(df["Close"].pct_change(63, fill_method=None).iloc[-1]) - spy_rs
+        ifs, adx = institutional_score(df, rs_val, spy_df)
+        tr  = pd.concat([
+            df["High"] - df["Low"],
+            (df["High"] - df["Close"].shift()).abs(),
+            (df["Low"]  - df["Close"].shift()).abs(),
+        ], axis=1).max(axis=1)
+        ref = {
+            "ifs":        ifs,
+            "adx":        adx,
+            "atr":        float(tr.rolling(14).mean().iloc[-1]),
+            "rs_val":     rs_val,
+            "resistance": float(df["High"].rolling(20).max().iloc[-2]),
+            "vol_mean":   float(df["Volume"].rolling(20).mean().iloc[-1]),
+        }
+        for k, v in ref.items():
+            got  = scan[t][k]
+            same = (pd.isna(v) and pd.isna(got)) or (
+                got == v if k == "ifs" else np.isclose(got, v, rtol=rtol, atol=0))
+            if not same:
+                out.append({"ticker": t, "field": k, "panel": got, "reference": v})
+    return pd.DataFrame(out, columns=["ticker", "field", "panel", "reference"])
+
+def scan_panel(tickers: list, histories: dict, spy_df: pd.DataFrame,
+               already_alerted: set, earnings_cache: EarningsCalendar) -> list:
+    """Scan vettoriale: regole di ogni strategia sul pannello (FrameFeatures per i ticker non allineati)."""
+    fresh     = [t for t in tickers if t in histories and t not in already_alerted]
+    use_state = CONFIG["INCREMENTAL_STATE"] and CONFIG["STORE_ENABLED"]
+    states    = get_indicator_states(fresh) if use_state else None
+    scored, scanned = score_strategies({t: histories[t] for t in fresh}, spy_df, states)
+    metrics.funnel_add("scanned", scanned)
+    passed = len(set().union(*(table.index for table, _ in scored.values())))
+    print(f"🧮 Panel: {scanned} ticker valutati, {passed} superano le regole", flush=True)
+    return strategy_signals(scored, earnings_cache)
+
+def scan_threaded(tickers: list, spy_df: pd.DataFrame, already_alerted: set,
+                  earnings_cache: EarningsCalendar, histories: dict) -> list:
+    """Scan classico: un analyze_strategies per ticker sul thread pool (tutte le strategie attive)."""
+    active  = strategies or activate_strategies()
+    results = []
+    with ThreadPoolExecutor(max_workers=CONFIG["MAX_THREADS"]) as executor:
+        futures = {
+            executor.submit(analyze_strategies, t, spy_df, already_alerted, earnings_cache,
+                            histories.get(t), active): t
+            for t in tickers
+        }
+        for future in as_completed(futures):
+            results.extend(future.result())
+    return results
+
+# ==============================
+# 🧩 RULE ENGINE (filtri dichiarativi, valutazione lazy per costo)
+# ==============================
+def not_below(values, threshold):
+    """Scarta solo i valori sotto soglia: NaN passa, come `if adx < MIN_ADX: skip` di v14.5."""
+    return ~np.less(values, threshold)
+
+_RULE_OPS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal, "!<": not_below}
+
+# costo relativo (a priori) di una feature per ticker: le regole economiche e selettive
+# girano per prime, ADX e IFS solo sui sopravvissuti
+FEATURE_COSTS = {
+    "price": 1, "vol_last": 1, "dollar_vol": 1, "close_pos": 1,
+    "vol_mean": 2, "vol_ratio": 2, "resistance": 2, "rs_val": 2,
+    "atr": 3, "accum_days": 4, "vcp_gap": 4, "dry_days": 4, "rs_line_gap": 5,
+    "ifs": 20, "adx": 40,
+}
+SIGNAL_FIELDS = ("price", "resistance", "vol_ratio", "rs_val", "ifs", "adx", "atr")
+
+def _threshold(x) -> float:
+    return float(CONFIG[x]) if isinstance(x, str) else float(x)
+
+def ifs_points(get):
+    """Punti IFS da CONFIG["IFS_RULES"]; get(feature) → scalare o array (NaN = nessun punto)."""
+    total = 0
+    with np.errstate(invalid="ignore"):
+        for _, feature, op, thr, points in CONFIG["IFS_RULES"]:
+            total = total + np.where(_RULE_OPS[op](get(feature), _threshold(thr)), points, 0)
+    return total
+
+def compile_rules(specs: list, params: dict = None) -> list:
+    """
+    (nome, feature, op, soglia) → regole compilate. La soglia può essere un numero,
+    una chiave di CONFIG o di `params` (letta a ogni valutazione) o un'altra feature.
+    """
+    rules = []
+    for name, feature, op, rhs in specs:
+        if feature not in FEATURE_COSTS:
+            raise ValueError(f"Regola {name}: feature sconosciuta {feature!r}")
+        if op not in _RULE_OPS:
+            raise ValueError(f"Regola {name}: operatore non supportato {op!r}")
+        cost = FEATURE_COSTS[feature]
+        if isinstance(rhs, str) and rhs in FEATURE_COSTS:
+            kind, cost = "feature", cost + FEATURE_COSTS[rhs]
+        elif isinstance(rhs, str):
+            if rhs not in CONFIG and rhs not in (params or {}):
+                raise ValueError(f"Regola {name}: soglia sconosciuta {rhs!r}")
+            kind = "config"
+        else:
+            kind, rhs = "const", float(rhs)
+        rules.append({"name": name, "feature": feature, "op": _RULE_OPS[op],
+                      "rhs": (kind, rhs), "cost": cost})
+    return rules
+
+class _FeatureSource:
+    """Feature per ticker calcolate su richiesta e in cache, solo per le righe chieste."""
+
+    def __init__(self, tickers: list):
+        self.index   = pd.Index(tickers, name="ticker")
+        self.base    = np.zeros(len(tickers), dtype=bool)   # righe valutabili dalle regole
+        self.scanned = 0
+        self._vals   = {}
+        self._done   = {}
+
+    def _slot(self, name: str) -> tuple:
+        if name not in self._vals:
+            self._vals[name] = np.full(len(self.index), np.nan)
+            self._done[name] = np.zeros(len(self.index), dtype=bool)
+        return self._vals[name], self._done[name]
+
+    def get(self, name: str, idx: np.ndarray) -> np.ndarray:
+        vals, done = self._slot(name)
+        need = idx[~done[idx]]
+        if len(need):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                vals[need] = self._compute(name, need)
+            done[need] = True
+        return vals[idx]
+
+    def table(self, idx: np.ndarray, fields: tuple = SIGNAL_FIELDS) -> pd.DataFrame:
+        return pd.DataFrame({f: self.get(f, idx) for f in fields}, index=self.index[idx])
+
+class PanelFeatures(_FeatureSource):
+    """
+    Feature dal pannello date × ticker (build_panel), vettoriali sul sottoinsieme di colonne
+    richiesto. Valutabili solo i ticker "fast" (serie senza buchi e allineata a SPY).
+    """
+
+    def __init__(self, histories: dict, spy_df: pd.DataFrame, states: dict = None):
+        self.panel  = panel = build_panel(histories, spy_df)
+        self.states = states
+        super().__init__(panel["tickers"])
+        N = len(self.index)
+        if not N:
+            self.fast = self.base.copy()
+            return
+        close, high, low, vol = panel["close"], panel["high"], panel["low"], panel["volume"]
+        T = len(close)
+        valid       = ~(np.isnan(close) | np.isnan(high) | np.isnan(low) | np.isnan(vol))
+        n_valid     = valid.sum(axis=0)
+        self.first  = valid.argmax(axis=0)
+        self.last   = T - 1 - valid[::-1].argmax(axis=0)
+        spy_ok      = ~np.isnan(_window(panel["spy"][:, None].repeat(N, axis=1), self.last, 21))
+        self.fast   = (n_valid >= 60) & (n_valid == self.last - self.first + 1) & spy_ok.all(axis=0)
+        self.scanned = int(self.fast.sum())
+
+        fast = np.flatnonzero(self.fast)
+        vm   = self.get("vol_mean", fast)
+        ok   = ~np.isnan(vm) & (vm != 0) & ~np.isnan(self.get("resistance", fast)) & ~np.isnan(self.get("rs_val", fast))
+        self.base[fast[ok]] = True
+
+    def _compute(self, name: str, cols: np.ndarray) -> np.ndarray:
+        return getattr(self, f"_f_{name}")(cols)
+
+    def _w(self, field: str, cols: np.ndarray, size: int, offset: int = 0) -> np.ndarray:
+        return _window(self.panel[field][:, cols], self.last[cols], size, offset)
+
+    def _at_last(self, field: str, cols: np.ndarray) -> np.ndarray:
+        return self.panel[field][self.last[cols], cols]
+
+    def _avg20(self, cols: np.ndarray) -> np.ndarray:
+        """Media volumi 20gg alle righe last-4..last."""
+        vol24 = self._w("volume", cols, 24)
+        return np.stack([vol24[k:k + 20].sum(axis=0) / 20 for k in range(5)])
+
+    def _f_price(self, cols):      return self._at_last("close", cols)
+    def _f_vol_last(self, cols):   return self._at_last("volume", cols)
+    def _f_dollar_vol(self, cols): return self.get("price", cols) * self.get("vol_last", cols)
+    def _f_vol_mean(self, cols):   return self._w("volume", cols, 20).sum(axis=0) / 20
+    def _f_vol_ratio(self, cols):  return self.get("vol_last", cols) / self.get("vol_mean", cols)
+    def _f_resistance(self, cols): return self._w("high", cols, 20, offset=1).max(axis=0)
+
+    def _f_rs_val(self, cols):
+        close = self.panel["close"]
+        base  = close[np.clip(self.last[cols] - 63, 0, len(close) - 1), cols]
+        return (self.get("price", cols) / base - 1) - self.panel["spy_rs"]
+
+    def _f_atr(self, cols):
+        h, l = self._w("high", cols, 14), self._w("low", cols, 14)
+        pc   = self._w("close", cols, 14, offset=1)
+        tr   = np.fmax(np.fmax(h - l, np.abs(h - pc)), np.abs(l - pc))
+        return tr.sum(axis=0) / 14
+
+    def _f_accum_days(self, cols):
+        return (self._w("volume", cols, 5) > self._avg20(cols)).sum(axis=0)
+
+    def _f_vcp_gap(self, cols):
+        hl  = _window(self.panel["high"][:, cols] - self.panel["low"][:, cols], self.last[cols], 20)
+        r5  = hl[-5:].sum(axis=0) / 5
+        r20 = hl.sum(axis=0) / 20
+        return np.where(r20 > 0, r20 - r5, np.nan)
+
+    def _f_close_pos(self, cols):
+        low       = self._at_last("low", cols)
+        day_range = self._at_last("high", cols) - low
+        return np.where(day_range > 0, (self.get("price", cols) - low) / day_range, np.nan)
+
+    def _f_rs_line_gap(self, cols):
+        spy     = _window(self.panel["spy"][:, None].repeat(len(cols), axis=1), self.last[cols], 21)
+        rs_line = self._w("close", cols, 21) / spy
+        return rs_line[-1] - rs_line[:-1].max(axis=0)
+
+    def _f_dry_days(self, cols):
+        avg20 = self._avg20(cols)
+        return (self._w("volume", cols, 3, offset=1) < avg20[1:4] * CONFIG["VOLUME_DRYUP_RATIO"]).sum(axis=0)
+
+    def _f_ifs(self, cols):
+        return ifs_points(lambda f: self.get(f, cols))
+
+    def _f_adx(self, cols):
+        """ADX: un passo dall'IndicatorState dove c'è, Wilder sull'intera storia per il resto."""
+        p   = self.panel
+        sel = np.zeros(len(self.index), dtype=bool)
+        sel[cols] = True
+        adx, covered = (_panel_adx_from_states(p, self.last, self.fast & sel, self.states) if self.states
+                        else (np.full(len(self.index), np.nan), np.zeros(len(self.index), dtype=bool)))
+        rest = cols[~covered[cols]]
+        if len(rest):
+            adx[rest] = panel_adx(p["high"][:, rest], p["low"][:, rest], p["close"][:, rest],
+                                  self.first[rest])[self.last[rest], np.arange(len(rest))]
+        return adx[cols]
+
+class FrameFeatures(_FeatureSource):
+    """
+    Feature per-ticker dai DataFrame (stessa logica di institutional_score/calc_adx) per i
+    ticker non vettoriali. Le grandezze di base sono calcolate subito, i gruppi costosi
+    (IFS, ADX, ATR) per ticker solo quando una regola li chiede.
+    """
+    GROUPS = {
+        "accum_days": "ifs", "vcp_gap": "ifs", "close_pos": "ifs", "rs_line_gap": "ifs",
+        "dry_days": "ifs", "ifs": "ifs", "adx": "adx", "atr": "atr",
+    }
+
+    def __init__(self, histories: dict, spy_df: pd.DataFrame):
+        self.spy_df = spy_df = _flat_columns(spy_df)
+        spy_rs      = float(spy_df["Close"].pct_change(63, fill_method=None).iloc[-1])
+        frames, basics = {}, {}
+        for t, df in histories.items():
+            if df is None or len(df) < 60:
+                continue
+            df = _flat_columns(df)
+            try:
+                row = self._basic(df, spy_rs)
+            except Exception as e:
+                print(f"   ❌ {t} — errore: {e}", flush=True)
+                continue
+            if row is not None:
+                frames[t], basics[t] = df, row
+        super().__init__(list(frames))
+        self._frames = list(frames.values())
+        for name in FEATURE_COSTS:
+            if name not in self.GROUPS:
+                vals, done = self._slot(name)
+                vals[:] = [basics[t][name] for t in self.index]
+                done[:] = True
+        self.base[:] = True
+        self.scanned = len(self.index)
+
+    @staticmethod
+    def _basic(df: pd.DataFrame, spy_rs: float):
+        price    = float(df["Close"].iloc[-1])
+        vol_mean = float(df["Volume"].rolling(20).mean().iloc[-1])
+        if pd.isna(vol_mean) or vol_mean == 0:
+            return None
+        vol_last   = float(df["Volume"].iloc[-1])
+        resistance = float(df["High"].rolling(20).max().iloc[-2])
+        rs_val     = float(df["Close"].pct_change(63, fill_method=None).iloc[-1]) - spy_rs
+        if pd.isna(resistance) or pd.isna(rs_val):
+            return None
+        return {"price": price, "vol_last": vol_last, "dollar_vol": price * vol_last,
+                "vol_mean": vol_mean, "vol_ratio": vol_last / vol_mean,
+                "resistance": resistance, "rs_val": rs_val}
+
+    def _group(self, group: str, i: int) -> dict:
+        df = self._frames[i]
+        if group == "ifs":
+            feats = ifs_features(df, float(self._vals["rs_val"][i]), self.spy_df)
+            feats["ifs"] = int(ifs_points(feats.get))
+            return feats
+        if group == "adx":
+            return {"adx": calc_adx(df)}
+        tr = pd.concat([
+            df["High"] - df["Low"],
+            (df["High"] - df["Close"].shift()).abs(),
+            (df["Low"]  - df["Close"].shift()).abs(),
+        ], axis=1).max(axis=1)
+        return {"atr": float(tr.rolling(14).mean().iloc[-1])}
+
+    def _compute(self, name: str, rows: np.ndarray) -> np.ndarray:
+        group = self.GROUPS[name]
+        for i in rows:
+            try:
+                feats = self._group(group, i)
+            except Exception as e:
+                print(f"   ❌ {self.index[i]} — errore: {e}", flush=True)
+                feats = {}
+            for k, g in self.GROUPS.items():
+                if g == group:
+                    vals, done = self._slot(k)
+                    vals[i], done[i] = feats.get(k, np.nan), True
+        return self._vals[name][rows]
+
+class RuleEngine:
+    """
+    Valuta CONFIG["SIGNAL_RULES"] in AND su una sorgente di feature: ogni regola vede solo
+    i sopravvissuti delle precedenti, quindi le feature costose si calcolano per pochi ticker.
+    Ordine (RULE_ORDER="cost"): costo / (1 − pass rate osservato), ordine dichiarato a parità.
+    Tiene per regola visti / passati / secondi, sul run corrente e cumulati.
+    `params` sovrascrive le soglie di CONFIG (strategie); solo l'engine senza nome
+    (la strategia primaria) scrive metriche e funnel del run.
+    """
+    PRIOR_PASS = 0.5
+
+    def __init__(self, specs: list = None, params: dict = None, name: str = None):
+        self.specs    = specs          # None = CONFIG["SIGNAL_RULES"] a ogni valutazione
+        self.params   = params or {}
+        self.name     = name
+        self.history  = {}             # nome → [visti, passati, secondi] da inizio processo
+        self.run      = {}             # idem, solo run corrente
+        self._lock    = threading.Lock()
+
+    def param(self, key: str):
+        return self.params[key] if key in self.params else CONFIG[key]
+
+    def ordered(self) -> list:
+        rules = compile_rules(self.specs or CONFIG["SIGNAL_RULES"], self.params)
+        if CONFIG["RULE_ORDER"] == "declared":
+            return rules
+        with self._lock:
+            hist = {k: tuple(v) for k, v in self.history.items()}
+
+        def rank(rule):
+            seen, passed, _ = hist.get(rule["name"], (0, 0, 0.0))
+            rate = passed / seen if seen else self.PRIOR_PASS
+            return rule["cost"] / max(1 - rate, 0.02)
+        return sorted(rules, key=rank)
+
+    def evaluate(self, source: _FeatureSource, members: np.ndarray = None) -> tuple:
+        """
+        (posizioni dei ticker che passano tutte le regole, report per regola). Senza effetti
+        collaterali; `members` (maschera sull'indice della sorgente) limita i ticker valutati.
+        """
+        alive  = np.flatnonzero(source.base if members is None else source.base & members)
+        report = []
+        for rule in self.ordered():
+            t0   = time.perf_counter()
+            seen = len(alive)
+            if seen:
+                kind, rhs = rule["rhs"]
+                rhs = (source.get(rhs, alive) if kind == "feature"
+                       else float(self.param(rhs)) if kind == "config" else rhs)
+                with np.errstate(invalid="ignore"):
+                    alive = alive[rule["op"](source.get(rule["feature"], alive), rhs)]
+            report.append({"rule": rule["name"], "seen": seen, "passed": len(alive),
+                           "seconds": time.perf_counter() - t0})
+        return alive, report
+
+    def record(self, report: list):
+        """Report di evaluate → metriche (timing, scarti, funnel) e pass rate per l'ordinamento."""
+        for r in report:
+            if not r["seen"]:
+                continue
+            if self.name is None:
+                metrics.observe(f"rule_{r['rule']}", r["seconds"])
+                metrics.incr(f"rule_reject_{r['rule']}", r["seen"] - r["passed"])
+                if r["rule"] in metrics.FUNNEL:
+                    metrics.funnel_add(r["rule"], r["passed"])
+            with self._lock:
+                for stats in (self.history, self.run):
+                    s = stats.setdefault(r["rule"], [0, 0, 0.0])
+                    s[0] += r["seen"]
+                    s[1] += r["passed"]
+                    s[2] += r["seconds"]
+
+    def begin_run(self):
+        with self._lock:
+            self.run = {}
+
+    def summary(self) -> str:
+        with self._lock:
+            run = {k: tuple(v) for k, v in self.run.items()}
+        return " → ".join(f"{name} {passed}/{seen} ({sec * 1000:.0f} ms)"
+                          for name, (seen, passed, sec) in run.items())
+
+rule_engine = RuleEngine()
+
+def merge_reports(*reports: list) -> list:
+    """Somma i report di più evaluate (stessa regola = stessa riga)."""
+    merged = {}
+    for report in reports:
+        for r in report:
+            m = merged.setdefault(r["rule"], {"rule": r["rule"], "seen": 0, "passed": 0, "seconds": 0.0})
+            m["seen"]    += r["seen"]
+            m["passed"]  += r["passed"]
+            m["seconds"] += r["seconds"]
+    return list(merged.values())
+
+# ==============================
+# 🧭 STRATEGIE (più profili sullo stesso passaggio dati)
+# ==============================
+# chiavi di CONFIG che una strategia può sovrascrivere: soglie delle regole, selezione e sizing.
+# Le definizioni delle feature (IFS_RULES, VOLUME_DRYUP_RATIO) restano comuni a tutte:
+# ogni feature è calcolata una volta per ticker e condivisa.
+STRATEGY_PARAMS   = ("MIN_VOLUME_USD", "VOL_TRIGGER", "MIN_ADX", "MIN_IFS_SCORE", "MAX_PER_SECTOR",
+                     "MAX_ALERTS", "STOP_ATR_MULT", "TARGET_R_MULT", "RISK_PER_TRADE_PERCENT")
+STRATEGY_KEYS     = ("rules", "universe", "sectors", "chat")
+STRATEGY_UNIVERSE = ("all", "curated", "screened")   # tutto | solo MY_WATCHLIST | solo sorgenti remote
+
+class Strategy:
+    """
+    Profilo del registro CONFIG["STRATEGIES"]: soglie e selezione proprie, sottoinsieme
+    dell'universo e chat Telegram (nome di una variabile d'ambiente, default TELEGRAM_CHAT_ID).
+    La primaria usa `rule_engine` (metriche e funnel del run); le altre un RuleEngine proprio,
+    che conserva i pass rate tra un run e l'altro.
+    """
+
+    def __init__(self, name: str, primary: bool):
+        self.name    = name
+        self.primary = primary
+        self.engine  = rule_engine if primary else RuleEngine(name=name)
+        self.alerted: set = set()          # ticker già alertati oggi da questa strategia
+        self.configure({})
+
+    def configure(self, spec: dict):
+        unknown = set(spec) - set(STRATEGY_PARAMS) - set(STRATEGY_KEYS)
+        if unknown:
+            raise ValueError(f"Strategia {self.name}: chiavi non supportate {sorted(unknown)}")
+        universe = spec.get("universe", "all")
+        if isinstance(universe, str) and universe not in STRATEGY_UNIVERSE:
+            raise ValueError(f"Strategia {self.name}: universe {universe!r} non valido")
+        self.params   = {k: spec[k] for k in STRATEGY_PARAMS if k in spec}
+        self.config   = ChainMap(self.params, CONFIG)
+        self.universe = universe
+        self.sectors  = spec.get("sectors")
+        self.chat     = spec.get("chat")
+        self.engine.specs, self.engine.params = spec.get("rules"), self.params
+
+    @property
+    def tag(self) -> str:
+        """Prefisso per console e messaggi: vuoto per la primaria (output invariato)."""
+        return "" if self.primary else f"[{self.name}] "
+
+    @property
+    def chat_id(self) -> str:
+        return (os.getenv(self.chat) if self.chat else None) or TELEGRAM_CHAT_ID
+
+    def members(self, index: pd.Index):
+        """Maschera dei ticker di `index` nell'universo della strategia (None = tutti)."""
+        if self.universe == "all" and not self.sectors:
+            return None
+        if self.universe == "all":
+            mask = np.ones(len(index), dtype=bool)
+        elif self.universe == "curated":
+            mask = index.isin(MY_WATCHLIST)
+        elif self.universe == "screened":
+            mask = ~index.isin(MY_WATCHLIST)
+        else:
+            mask = index.isin(list(self.universe))
+        if self.sectors:
+            mask &= np.array([sector_of(t) in self.sectors for t in index], dtype=bool)
+        return mask
+
+_strategy_registry: dict = {}   # nome → Strategy (engine e alert del giorno restano tra i run)
+strategies: list = []           # strategie attive, la primaria per prima
+
+def activate_strategies() -> list:
+    """(Ri)configura le strategie di CONFIG["ACTIVE_STRATEGIES"] dal registro; ritorna la lista attiva."""
+    names = list(CONFIG["ACTIVE_STRATEGIES"])
+    if not names:
+        raise ValueError("ACTIVE_STRATEGIES vuoto: serve almeno una strategia")
+    active = []
+    for i, name in enumerate(names):
+        if name not in CONFIG["STRATEGIES"]:
+            raise ValueError(f"Strategia sconosciuta: {name!r}")
+        st = _strategy_registry.get(name)
+        if st is None or st.primary != (i == 0):
+            st = _strategy_registry[name] = Strategy(name, primary=i == 0)
+        st.configure(CONFIG["STRATEGIES"][name])
+        active.append(st)
+    strategies[:] = active
+    return active
+
+def primary_strategy() -> Strategy:
+    return (strategies or activate_strategies())[0]
+
+def set_alerted(by_strategy: dict) -> set:
+    """
+    Alert di oggi {strategia: ticker} → Strategy.alerted (None = righe senza strategia,
+    attribuite alla primaria). Ritorna i ticker alertati da tutte le strategie attive:
+    solo quelli si possono saltare nel fetch.
+    """
+    active = activate_strategies()
+    for st in active:
+        st.alerted = set(by_strategy.get(st.name, ()))
+        if st.primary:
+            st.alerted |= set(by_strategy.get(None, ()))
+    return set.intersection(*(st.alerted for st in active))
+
+def score_strategies(histories: dict, spy_df: pd.DataFrame, states: dict = None) -> tuple:
+    """
+    Regole di tutte le strategie attive su un gruppo di storici: pannello vettoriale per i ticker
+    allineati e FrameFeatures per gli altri, costruiti una volta sola. Le feature sono in cache
+    per ticker, quindi una strategia in più calcola solo quelle che le precedenti non avevano
+    chiesto (tipicamente ADX/IFS di pochi sopravvissuti in più).
+    Ritorna ({strategia: (tabella SIGNAL_FIELDS dei sopravvissuti, report)}, valutati).
+    """
+    panel  = PanelFeatures(histories, spy_df, states)
+    fast   = set(panel.index[panel.fast])
+    frames = FrameFeatures({t: df for t, df in histories.items() if t not in fast}, spy_df)
+    scored = {}
+    for st in strategies or activate_strategies():
+        alive, report     = st.engine.evaluate(panel, st.members(panel.index))
+        alive_f, report_f = st.engine.evaluate(frames, st.members(frames.index))
+        scored[st.name] = (pd.concat([panel.table(alive), frames.table(alive_f)]),
+                           merge_reports(report, report_f))
+    return scored, panel.scanned + frames.scanned
+
+def strategy_signals(scored: dict, earnings_cache: EarningsCalendar = None) -> list:
+    """
+    Sopravvissuti di ogni strategia → segnali (metriche/pass rate registrati per engine).
+    Il controllo earnings si fa una volta per ticker, anche se più strategie lo selezionano.
+    """
+    results, skip = [], {}
+    for st in strategies:
+        if st.name not in scored:
+            continue
+        table, report = scored[st.name]
+        st.engine.record(report)
+        for t, row in table.iterrows():
+            if t not in skip:
+                skip[t] = _earnings_skip(t, earnings_cache)
+            if not skip[t]:
+                res = _signal_from_row(t, row, strategy=st)
+                if res:
+                    results.append(res)
+    return results
+
+# ==============================
+# 🚰 PIPELINE (fetch → parse → scoring in streaming)
+# ==============================
+_score_ctx: dict = {}   # nel processo di scoring: SPY dell'ultimo run
+
+def _init_scorer(spy_df: pd.DataFrame, config: dict, history: dict = None, sectors: dict = None):
+    CONFIG.update(config)
+    _score_ctx["spy"] = spy_df
+    if sectors:
+        universe_sectors.update(sectors)            # filtri "sectors" delle strategie
+    for st in activate_strategies():
+        if history and st.name in history:           # pass rate per l'ordine delle regole
+            st.engine.history = {k: list(v) for k, v in history[st.name].items()}
+
+def _scorer_ready() -> bool:
+    return True
+
+def score_block(histories: dict, states: dict = None) -> tuple:
+    """
+    Stadio CPU (processo di scoring): score_strategies sul blocco.
+    Ritorna ({strategia: (sopravvissuti, report per regola)}, ticker valutati, secondi di calcolo).
+    """
+    t0 = time.perf_counter()
+    scored, scanned = score_strategies(histories, _score_ctx["spy"], states)
+    return scored, scanned, time.perf_counter() - t0
+
+def _parse_block(histories: dict) -> dict:
+    """Stadio di parse: colonne piatte, date uniche e ordinate, solo OHLCV numerico."""
+    out = {}
+    for t, df in histories.items():
+        if df is None or df.empty:
+            continue
+        df = _flat_columns(df)
+        if not df.index.is_unique:
+            df = df[~df.index.duplicated(keep="last")]
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        cols = [c for c in PANEL_FIELDS if c in df.columns]
+        out[t] = df[cols].astype(float)
+    return out
+
+def _scoring_pool(spy_df: pd.DataFrame, blocks: int):
+    """Processi di scoring (spawn: nessun lock ereditato dai thread di fetch); 1 → thread locale."""
+    n = min(CONFIG["PIPELINE_SCORERS"] or os.cpu_count() or 1, blocks)
+    if n <= 1:
+        return ThreadPoolExecutor(max_workers=1, initializer=_init_scorer, initargs=(spy_df, {})), 1
+    ctx = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=n, mp_context=ctx,
+                               initializer=_init_scorer,
+                               initargs=(spy_df, dict(CONFIG), {st.name: dict(st.engine.history) for st in strategies},
+                                         dict(universe_sectors))), n
+
+def scan_pipeline(tickers: list, spy_df: pd.DataFrame, already_alerted: set,
+                  earnings_cache: EarningsCalendar) -> tuple:
+    """
+    Scan a stadi collegati da code limitate:
+      fetch  (1 thread, blocchi di PIPELINE_BLOCK; concorrenza HTTP = FETCH_MAX_CONCURRENCY)
+      parse  (PIPELINE_PARSERS thread: normalizzazione + stato ADX)
+      score  (PIPELINE_SCORERS processi: score_strategies, regole di ogni strategia)
+    Ogni stadio si blocca quando il successivo ha PIPELINE_QUEUE blocchi in attesa.
+    I sopravvissuti passano al controllo earnings appena il loro blocco è calcolato.
+    Ritorna (segnali, ticker con storico).
+    """
+    tickers   = [t for t in tickers if t not in already_alerted]
+    size      = max(1, int(CONFIG["PIPELINE_BLOCK"]))
+    depth     = max(1, int(CONFIG["PIPELINE_QUEUE"]))
+    n_parsers = max(1, int(CONFIG["PIPELINE_PARSERS"]))
+    use_state = CONFIG["INCREMENTAL_STATE"] and CONFIG["STORE_ENABLED"]
+    raw_q     = queue.Queue(maxsize=depth)
+    done_q    = queue.Queue()
+    errors    = []
+    submitted = [0]
+    lock      = threading.Lock()
+    pool, n_scorers = _scoring_pool(spy_df, -(-len(tickers) // size))
+    in_flight = threading.BoundedSemaphore(n_scorers + depth)
+    # avvia i processi mentre il primo blocco è in download
+    pool.submit(_scorer_ready)
+
+    def _fetcher():
+        try:
+            with metrics.timer("fetch"):
+                for i in range(0, len(tickers), size):
+                    raw_q.put(fetch_histories(tickers[i:i + size]))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            for _ in range(n_parsers):
+                raw_q.put(None)
+
+    def _parser():
+        try:
+            while (block := raw_q.get()) is not None:
+                histories = _parse_block(block)
+                if not histories:
+                    continue
+                states = get_indicator_states(list(histories)) if use_state else None
+                in_flight.acquire()
+                try:
+                    fut = pool.submit(score_block, histories, states)
+                except Exception:
+                    in_flight.release()
+                    raise
+                with lock:
+                    submitted[0] += 1
+                fut.add_done_callback(done_q.put)
+        except Exception as e:
+            errors.append(e)
+            while raw_q.get() is not None:   # sblocca il fetcher
+                pass
+        finally:
+            done_q.put(None)
+
+    stages = [threading.Thread(target=_fetcher, name="pipeline-fetch", daemon=True)]
+    stages += [threading.Thread(target=_parser, name=f"pipeline-parse-{i}", daemon=True)
+               for i in range(n_parsers)]
+    print(f"🚰 Pipeline: {len(tickers)} ticker | blocchi da {size} | "
+          f"{n_parsers} parser | {n_scorers} scorer", flush=True)
+
+    results, scanned, finished, processed = [], 0, 0, 0
+    try:
+        for th in stages:
+            th.start()
+        while finished < n_parsers or processed < submitted[0]:
+            fut = done_q.get()
+            if fut is None:
+                finished += 1
+                continue
+            processed += 1
+            in_flight.release()
+            try:
+                scored, n, seconds = fut.result()
+            except Exception as e:
+                print(f"❌ Scoring blocco fallito: {e}", flush=True)
+                metrics.incr("score_errors")
+                continue
+            metrics.observe("score_block", seconds)
+            scanned += n
+            metrics.funnel_add("scanned", n)
+            results += strategy_signals(scored, earnings_cache)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    if errors:
+        raise errors[0]
+    print(f"🚰 Pipeline: {scanned} ticker valutati in {processed} blocchi", flush=True)
+    return results, scanned
+
+# ==============================
+# 🧊 SHARED PANEL (float32 in shared memory / mmap)
+# ==============================
+PANEL_FIELDS = ("Open", "High", "Low", "Close", "Volume")
+
+class SharedPanel:
+    """
+    OHLCV di molti ticker in un unico blocco di memoria: date int64 (ns) + float32
+    campo × data × ticker, un solo calendario (unione delle date) e indice ticker → colonna.
+    Il blocco vive in multiprocessing.shared_memory oppure in un file (np.memmap): i worker
+    fanno attach(spec) e leggono viste read-only senza copiare nulla, quindi la memoria
+    residente non cresce col numero di processi. Celle mancanti = NaN.
+    float32 tiene ~7 cifre significative: sufficiente per prezzi e volumi giornalieri.
+    """
+
+    def __init__(self, spec: dict, handle, owner: bool):
+        self.spec    = spec
+        self.tickers = list(spec["tickers"])
+        self.col     = {t: i for i, t in enumerate(self.tickers)}
+        self.fields  = list(spec["fields"])
+        self._handle = handle
+        self._owner  = owner
+        buf = handle.buf if isinstance(handle, shared_memory.SharedMemory) else handle
+        T, N = spec["rows"], len(self.tickers)
+        self._dates = np.ndarray((T,), np.int64, buffer=buf)
+        self.data   = np.ndarray((len(self.fields), T, N), np.float32, buffer=buf, offset=T * 8)
+        if not owner:
+            self._dates.flags.writeable = False
+            self.data.flags.writeable   = False
+        self.dates = pd.DatetimeIndex(self._dates.view("datetime64[ns]"))
+
+    @staticmethod
+    def _nbytes(rows: int, n: int, fields: int) -> int:
+        return max(rows * 8 + fields * rows * n * 4, 1)
+
+    @classmethod
+    def create(cls, dates, tickers: list, path: str = None) -> "SharedPanel":
+        """Blocco vuoto (tutto NaN) sul calendario dato. path → file mappato + spec in path.json."""
+        dates  = pd.DatetimeIndex(dates).values.astype("datetime64[ns]")
+        spec   = {"tickers": list(tickers), "fields": list(PANEL_FIELDS), "rows": len(dates),
+                  "shm": None, "path": path}
+        nbytes = cls._nbytes(len(dates), len(tickers), len(PANEL_FIELDS))
+        if path:
+            handle = np.memmap(path, dtype=np.uint8, mode="w+", shape=(nbytes,))
+            def _write(tmp):
+                with open(tmp, "w") as f:
+                    json.dump(spec, f)
+            _atomic_write(f"{path}.json", _write)
+        else:
+            handle = shared_memory.SharedMemory(create=True, size=nbytes)
+            spec["shm"] = handle.name
+        panel = cls(spec, handle, owner=True)
+        panel._dates[:] = dates.view(np.int64)
+        panel.data[...] = np.nan
+        return panel
+
+    @classmethod
+    def attach(cls, spec) -> "SharedPanel":
+        """Apre un panel esistente in sola lettura (spec dict, oppure il path del file mappato)."""
+        if isinstance(spec, str):
+            with open(f"{spec}.json") as f:
+                spec = json.load(f)
+        if spec.get("path"):
+            nbytes = cls._nbytes(spec["rows"], len(spec["tickers"]), len(spec["fields"]))
+            handle = np.memmap(spec["path"], dtype=np.uint8, mode="r", shape=(nbytes,))
+        else:
+            handle = shared_memory.SharedMemory(name=spec["shm"])
+        return cls(spec, handle, owner=False)
+
+    @classmethod
+    def from_histories(cls, histories: dict, path: str = None) -> "SharedPanel":
+        frames = {t: _flat_columns(df) for t, df in histories.items() if df is not None and len(df)}
+        dates  = np.unique(np.concatenate([df.index.values.astype("datetime64[ns]") for df in frames.values()])) \
+                 if frames else np.array([], dtype="datetime64[ns]")
+        panel  = cls.create(dates, list(frames), path)
+        for t, df in frames.items():
+            panel.put(t, df)
+        return panel
+
+    @classmethod
+    def from_store(cls, tickers: list, path: str = None) -> "SharedPanel":
+        """
+        Panel dallo store parquet con una sola lettura per ticker: ogni storico è ridotto
+        subito a (date, float32) così il picco resta ~2× il blocco, non i DataFrame float64.
+        """
+        def _load(t):
+            df = history_cache.get(t)
+            if df is None:
+                p = _store_path(t)
+                if not os.path.exists(p):
+                    return None
+                try:
+                    df = pd.read_parquet(p)
+                except Exception as e:
+                    print(f"⚠️  Store corrotto [{t}]: {e}")
+                    return None
+            df = _flat_columns(df)
+            if df.empty:
+                return None
+            if not df.index.is_unique:
+                df = df[~df.index.duplicated(keep="last")]
+            cols = [f for f in PANEL_FIELDS if f in df.columns]
+            return df.index.values.astype("datetime64[ns]"), cols, df[cols].to_numpy(dtype=np.float32)
+
+        tickers = list(dict.fromkeys(tickers))
+        with ThreadPoolExecutor(max_workers=CONFIG["MAX_THREADS"]) as executor:
+            loaded = {t: x for t, x in zip(tickers, executor.map(_load, tickers)) if x is not None}
+        dates = (np.unique(np.concatenate([x[0] for x in loaded.values()])) if loaded
+                 else np.array([], dtype="datetime64[ns]"))
+        panel = cls.create(dates, list(loaded), path)
+        for t in list(loaded):
+            idx, cols, values = loaded.pop(t)
+            panel._write(t, idx, cols, values)
+        return panel
+
+    def put(self, ticker: str, df: pd.DataFrame):
+        df = _flat_columns(df)
+        if not df.index.is_unique:
+            df = df[~df.index.duplicated(keep="last")]
+        cols = [f for f in self.fields if f in df.columns]
+        self._write(ticker, df.index.values.astype("datetime64[ns]"), cols, df[cols].to_numpy(dtype=np.float32))
+
+    def _write(self, ticker: str, idx: np.ndarray, cols: list, values: np.ndarray):
+        rows = self.dates.searchsorted(idx)
+        j    = self.col[ticker]
+        for c, f in enumerate(cols):
+            self.data[self.fields.index(f), rows, j] = values[:, c]
+
+    def field(self, name: str) -> np.ndarray:
+        """Vista date × ticker (float32, senza copia)."""
+        return self.data[self.fields.index(name)]
+
+    def view(self, ticker: str) -> np.ndarray:
+        """Vista campo × data del singolo ticker (float32, senza copia)."""
+        return self.data[:, :, self.col[ticker]]
+
+    def frame(self, ticker: str) -> pd.DataFrame:
+        """DataFrame OHLCV float64 del ticker (solo le sue barre) — input di institutional_score/analyze_ticker."""
+        v  = self.view(ticker)
+        ok = ~np.isnan(v[self.fields.index("Close")])
+        df = pd.DataFrame(v[:, ok].T.astype(float), index=self.dates[ok], columns=self.fields)
+        df.index.name = "Date"
+        return df
+
+    def panel(self, tickers: list, spy: str = "SPY") -> dict:
+        """
+        Dict nel formato di build_panel per un sottoinsieme di ticker (copie float64 delle sole
+        colonne richieste), righe iniziali/finali senza dati tagliate. spy = colonna del benchmark.
+        """
+        tickers = [t for t in tickers if t in self.col]
+        panel   = {"tickers": tickers, "col": {t: i for i, t in enumerate(tickers)}}
+        cols    = [self.col[t] for t in tickers]
+        close   = self.field("Close")[:, cols]
+        has     = ~np.isnan(close).all(axis=1)
+        if not has.any():
+            panel["tickers"], panel["col"], panel["dates"] = [], {}, pd.DatetimeIndex([])
+            return panel
+        lo, hi = int(has.argmax()), len(has) - int(has[::-1].argmax())
+        panel["dates"] = self.dates[lo:hi]
+        for f in ("Close", "High", "Low", "Volume"):
+            panel[f.lower()] = self.field(f)[lo:hi, cols].astype(float)
+        spy_close = self.spy_close(spy)
+        panel["spy"]    = spy_close.reindex(panel["dates"]).to_numpy(dtype=float)
+        panel["spy_rs"] = float(spy_close.pct_change(63, fill_method=None).iloc[-1]) if len(spy_close) else np.nan
+        return panel
+
+    def spy_close(self, spy: str = "SPY") -> pd.Series:
+        if spy not in self.col:
+            return pd.Series(dtype=float)
+        return self.frame(spy)["Close"]
+
+    def close(self):
+        """Rilascia le viste e il mapping (il blocco resta per gli altri processi)."""
+        self.dates = self._dates = self.data = None
+        if isinstance(self._handle, shared_memory.SharedMemory):
+            self._handle.close()
+        elif self._owner and isinstance(self._handle, np.memmap):
+            self._handle.flush()
+        self._handle = None
+
+    def unlink(self):
+        """Solo il creatore: libera il blocco (o cancella il file mappato)."""
+        if self.spec.get("path"):
+            for p in (self.spec["path"], f"{self.spec['path']}.json"):
+                if os.path.exists(p):
+                    os.remove(p)
+        else:
+            shm = shared_memory.SharedMemory(name=self.spec["shm"])
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self._owner:
+            self.unlink()
+
+# ==============================
+# 🧾 OPTIONS FLOW (conferma dei finalisti)
+# ==============================
+_CHAIN_COLUMNS = ("strike", "volume", "openInterest", "bid", "ask")
+
+class OptionChainCache:
+    """
+    Catene opzioni già scaricate: {"TICKER|scadenza": {"fetched": epoch, "calls": [...], "puts": [...]}}
+    e {"TICKER|expiries": {"fetched": epoch, "list": [...]}}. TTL breve (OPTIONS_CACHE_TTL):
+    i run cron ravvicinati non riscaricano le stesse catene. Thread-safe.
+    """
+
+    def __init__(self, path: str):
+        self.path    = path
+        self.entries = {}
+        self._lock   = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry and time.time() - entry["fetched"] < CONFIG["OPTIONS_CACHE_TTL"]:
+            metrics.incr("options_cache_hits")
+            return entry
+        return None
+
+    def put(self, key: str, entry: dict) -> dict:
+        entry["fetched"] = time.time()
+        with self._lock:
+            self.entries[key] = entry
+        return entry
+
+    def save(self):
+        cutoff = time.time() - CONFIG["OPTIONS_CACHE_TTL"]
+        with self._lock:
+            self.entries = {k: v for k, v in self.entries.items() if v["fetched"] >= cutoff}
+            payload = dict(self.entries)
+        def _write(tmp):
+            with open(tmp, "w") as f:
+                json.dump(payload, f)
+        try:
+            _atomic_write(self.path, _write)
+        except Exception as e:
+            print(f"⚠️  Cache opzioni non salvata: {e}")
+
+def _chain_rows(df: pd.DataFrame) -> list:
+    cols = [c for c in _CHAIN_COLUMNS if c in df.columns]
+    if len(cols) < len(_CHAIN_COLUMNS):
+        return []
+    return df[cols].apply(pd.to_numeric, errors="coerce").fillna(0).to_numpy(dtype=float).tolist()
+
+def _option_expiries(ticker: str, cache: OptionChainCache) -> list:
+    key   = f"{ticker}|expiries"
+    entry = cache.get(key)
+    if entry is None:
+        rate_limiters["yahoo"].acquire_sync()
+        metrics.incr("options_requests")
+        entry = cache.put(key, {"list": list(yf.Ticker(ticker, session=session).options)})
+    return entry["list"]
+
+def _option_chain(ticker: str, expiry: str, cache: OptionChainCache) -> dict:
+    key   = f"{ticker}|{expiry}"
+    entry = cache.get(key)
+    if entry is None:
+        rate_limiters["yahoo"].acquire_sync()
+        metrics.incr("options_requests")
+        chain = yf.Ticker(ticker, session=session).option_chain(expiry)
+        entry = cache.put(key, {"calls": _chain_rows(chain.calls), "puts": _chain_rows(chain.puts)})
+    return entry
+
+def option_flow(ticker: str, price: float, cache: OptionChainCache):
+    """
+    Flusso opzioni sulle OPTIONS_EXPIRIES scadenze più vicine (almeno OPTIONS_MIN_DTE giorni):
+    volume/open interest delle call, skew volume call/put e lo strike call liquido
+    (OI ≥ OPTIONS_MIN_OI, bid > 0) più vicino a +OPTIONS_OTM_PCT. None se il ticker non ha opzioni.
+    """
+    today    = _ny_today()
+    expiries = [e for e in _option_expiries(ticker, cache)
+                if (datetime.strptime(e, "%Y-%m-%d").date() - today).days >= CONFIG["OPTIONS_MIN_DTE"]]
+    expiries = expiries[:CONFIG["OPTIONS_EXPIRIES"]]
+    if not expiries:
+        return None
+    target = price * (1 + CONFIG["OPTIONS_OTM_PCT"])
+    flow   = {"expiries": expiries, "call_vol": 0.0, "put_vol": 0.0, "call_oi": 0.0,
+              "strike": None, "strike_oi": None, "expiry": None}
+    for expiry in expiries:
+        chain = _option_chain(ticker, expiry, cache)
+        calls = np.asarray(chain["calls"], dtype=float).reshape(-1, len(_CHAIN_COLUMNS))
+        puts  = np.asarray(chain["puts"], dtype=float).reshape(-1, len(_CHAIN_COLUMNS))
+        flow["call_vol"] += float(calls[:, 1].sum())
+        flow["call_oi"]  += float(calls[:, 2].sum())
+        flow["put_vol"]  += float(puts[:, 1].sum())
+        liquid = calls[(calls[:, 0] > price) & (calls[:, 2] >= CONFIG["OPTIONS_MIN_OI"]) & (calls[:, 3] > 0)]
+        if flow["strike"] is None and len(liquid):
+            best = liquid[np.abs(liquid[:, 0] - target).argmin()]
+            flow.update(strike=float(best[0]), strike_oi=int(best[2]), expiry=expiry)
+    flow["vol_oi"] = round(flow["call_vol"] / flow["call_oi"], 2) if flow["call_oi"] else None
+    flow["skew"]   = round(flow["call_vol"] / max(flow["put_vol"], 1.0), 2)
+    return flow
+
+def apply_option_flow(r: dict, flow: dict):
+    """
+    Label e strike del segnale dal flusso opzioni reale (al posto della stima dal solo volume
+    azioni). flow None = nessuna opzione quotata: niente sweep possibile.
+    """
+    if flow is None:
+        r["label"] = "🧊 ACCUMULATION"
+        return
+    sweep = (flow["vol_oi"] is not None and flow["vol_oi"] >= CONFIG["OPTIONS_SWEEP_VOL_OI"]
+             and flow["skew"] >= CONFIG["OPTIONS_SWEEP_SKEW"])
+    r["label"]       = "⚡ OPTION SWEEP" if sweep else "🧊 ACCUMULATION"
+    r["opt_vol_oi"]  = flow["vol_oi"]
+    r["opt_cp_skew"] = flow["skew"]
+    if flow["strike"] is not None:
+        r["strike"]        = flow["strike"]
+        r["opt_expiry"]    = flow["expiry"]
+        r["opt_strike_oi"] = flow["strike_oi"]
+
+@metrics.timed("options")
+def confirm_options(selected: list) -> int:
+    """
+    Catene opzioni dei soli finalisti, in parallelo (OPTIONS_CONCURRENCY) e con attesa massima
+    OPTIONS_TIMEOUT: chi non risponde in tempo tiene la label dal volume azioni.
+    In replay usa il flusso registrato nello snapshot. Ritorna i segnali confermati.
+    """
+    if snapshots.replaying is not None:
+        flows = snapshots.json("options", {})
+    elif providers["yahoo"].breaker.state == "open":
+        print("🧾 Opzioni: yahoo non disponibile (circuit aperto) — label dal volume azioni")
+        return 0
+    else:
+        cache = OptionChainCache(OPTIONS_CACHE)
+        pool  = ThreadPoolExecutor(max_workers=CONFIG["OPTIONS_CONCURRENCY"], thread_name_prefix="options")
+        prices  = {r["ticker"]: r["price"] for r in selected}       # un ticker scelto da più strategie: una catena
+        futures = {pool.submit(option_flow, t, price, cache): t for t, price in prices.items()}
+        done, late = wait(futures, timeout=CONFIG["OPTIONS_TIMEOUT"])
+        pool.shutdown(wait=False, cancel_futures=True)
+        flows = {}
+        for fut in done:
+            try:
+                flows[futures[fut]] = fut.result()
+            except Exception as e:
+                metrics.incr("options_errors")
+                print(f"   ⚠️  {futures[fut]} — catena opzioni non disponibile: {e}")
+        if late:
+            metrics.incr("options_timeouts", len(late))
+        cache.save()
+        snapshots.record_json("options", flows)
+
+    for r in selected:
+        if r["ticker"] in flows:
+            apply_option_flow(r, flows[r["ticker"]])
+    confirmed = sum(f is not None for f in flows.values())
+    print(f"🧾 Opzioni: {confirmed}/{len({r['ticker'] for r in selected})} finalisti con flusso reale, "
+          f"{len(flows) - confirmed} senza opzioni quotate")
+    return confirmed
+
+# ==============================
+# 📈 OUTCOME TRACKER (esiti dei segnali, incrementale)
+# ==============================
+def resolve_outcomes(high: np.ndarray, low: np.ndarray, close: np.ndarray, start: np.ndarray,
+                     cols: np.ndarray, entry: np.ndarray, stop: np.ndarray, target: np.ndarray,
+                     remaining: np.ndarray) -> dict:
+    """
+    Tutti i segnali aperti in un colpo solo: per ognuno le barre dalla riga `start` della
+    colonna `cols`, al massimo `remaining` barre valide (NaN = ticker senza barra quel giorno).
+    Stesso criterio di backtest.resolve_trades: primo tocco, stessa barra → stop.
+    Ritorna esito ("target" / "stop" / "open"), barre consumate, ultima barra usata, MFE/MAE in R.
+    """
+    T, n = len(close), len(start)
+    W    = max(int(T - start.min()) if n else 0, 1)
+    step = np.arange(W)
+    fwd  = start[:, None] + step[None, :]
+    inb  = fwd < T
+    fr   = np.clip(fwd, 0, T - 1)
+    c    = cols[:, None]
+    hi   = np.where(inb, high[fr, c], np.nan)
+    lo   = np.where(inb, low[fr, c], np.nan)
+    cl   = np.where(inb, close[fr, c], np.nan)
+
+    valid = ~np.isnan(cl)
+    valid &= np.cumsum(valid, axis=1) <= remaining[:, None]
+    with np.errstate(invalid="ignore"):
+        hit_stop = valid & (lo <= stop[:, None])
+        hit_tgt  = valid & (hi >= target[:, None])
+    i_stop = np.where(hit_stop.any(axis=1), hit_stop.argmax(axis=1), W)
+    i_tgt  = np.where(hit_tgt.any(axis=1), hit_tgt.argmax(axis=1), W)
+    first  = np.minimum(i_stop, i_tgt)
+
+    used = valid & (step[None, :] <= first[:, None])      # fino al tocco incluso
+    bars = used.sum(axis=1)
+    last = np.where(bars > 0, W - 1 - used[:, ::-1].argmax(axis=1), 0)
+    risk = entry - stop
+    with np.errstate(invalid="ignore"):
+        mfe = (np.where(used, hi, -np.inf).max(axis=1) - entry) / risk
+        mae = (entry - np.where(used, lo, np.inf).min(axis=1)) / risk
+    outcome = np.where(first == W, "open", np.where(i_stop <= i_tgt, "stop", "target"))
+    exit_px = np.where(outcome == "stop", stop,
+              np.where(outcome == "target", target, cl[np.arange(n), last]))
+    return {"outcome": outcome, "bars": bars, "last": start + last, "exit": exit_px,
+            "mfe": np.where(bars > 0, mfe, np.nan), "mae": np.where(bars > 0, mae, np.nan)}
+
+def _opt_float(x):
+    return None if x is None or np.isnan(x) else round(float(x), 3)
+
+@metrics.timed("outcomes")
+def update_outcomes(max_hold: int = None) -> dict:
+    """
+    Aggiorna gli esiti dei segnali del trade log con le sole barre chiuse dello store
+    successive all'ultima valutata: un run senza barre nuove non riscrive nulla.
+    Oltre `max_hold` barre senza tocchi il segnale chiude "expired" al close.
+    Ritorna il conteggio per esito dei segnali chiusi in questo aggiornamento.
+    """
+    max_hold = max_hold or CONFIG["OUTCOME_MAX_HOLD"]
+    log      = open_trade_log()
+    pending  = log.open_outcomes()
+    if pending.empty:
+        return {}
+
+    since  = pd.Timestamp(pending["last_date"].min())
+    frames = {}
+    for t in pending["ticker"].unique():
+        df = store_load(t)
+        if df is not None and not df.empty and df.index[-1] > since:
+            frames[t] = df[df.index > since]
+    pending = pending[pending["ticker"].isin(frames)]
+    if pending.empty:
+        return {}
+
+    high  = pd.DataFrame({t: df["High"] for t, df in frames.items()}).sort_index()
+    low   = pd.DataFrame({t: df["Low"] for t, df in frames.items()}).reindex(high.index)
+    close = pd.DataFrame({t: df["Close"] for t, df in frames.items()}).reindex(high.index)
+    dates = high.index
+    start = dates.searchsorted(pd.to_datetime(pending["last_date"]).to_numpy(), side="right")
+    prev  = pending["bars"].to_numpy()
+    res   = resolve_outcomes(high.to_numpy(float), low.to_numpy(float), close.to_numpy(float),
+                             start, high.columns.get_indexer(pending["ticker"]),
+                             pending["entry"].to_numpy(float), pending["stop"].to_numpy(float),
+                             pending["target"].to_numpy(float), np.maximum(max_hold - prev, 1))
+
+    bars    = prev + res["bars"]
+    status  = np.where((res["outcome"] == "open") & (bars >= max_hold), "expired", res["outcome"])
+    moved   = res["bars"] > 0
+    last    = dates[np.minimum(res["last"], len(dates) - 1)].strftime("%Y-%m-%d")
+    mfe     = np.fmax(pending["mfe"].to_numpy(float), res["mfe"])
+    mae     = np.fmax(pending["mae"].to_numpy(float), res["mae"])
+    updates = [(st, day, int(b), _opt_float(f), _opt_float(a), None if st == "open" else float(x), int(tid))
+               for st, day, b, f, a, x, tid, m in zip(status, last, bars, mfe, mae, res["exit"],
+                                                      pending["trade_id"], moved) if m]
+    log.save_outcomes(updates)
+
+    closed = pd.Series(status[moved & (status != "open")]).value_counts().to_dict()
+    metrics.incr("outcomes_updated", len(updates))
+    print(f"📈 Esiti: {len(updates)}/{len(pending)} segnali aggiornati"
+          + (" | chiusi " + ", ".join(f"{k} {v}" for k, v in sorted(closed.items())) if closed else ""))
+    return closed
+
+def track_outcomes():
+    """Aggiornamento esiti a fine run: un errore qui non deve far fallire lo scan."""
+    if not CONFIG["OUTCOME_TRACKING"] or snapshots.replaying is not None:
+        return
+    try:
+        update_outcomes()
+    except Exception as e:
+        print(f"⚠️  Outcome tracker: {e}")
+
+def print_outcomes():
+    """Tabelle di calibrazione: hit rate osservato vs prob promessa, per IFS, settore e strategia (--outcomes)."""
+    update_outcomes()
+    log = open_trade_log()
+    for by in ("ifs", "sector", "strategy"):
+        table = log.outcome_table(by)
+        if by == "strategy" and len(table) < 2:
+            continue                                   # una sola strategia: tabella ridondante
+        print()
+        print(f"📈 Esiti per {by.upper()} (hit_rate = target / chiusi, %)")
+        print(table.to_string(index=False) if not table.empty else "   nessun segnale nel trade log")
+
+# ==============================
+# 📤 TELEGRAM
+# ==============================
+TELEGRAM_MAX_CHARS = 4096
+
+# connessione keep-alive dedicata: niente handshake TLS per ogni alert
+telegram_session = requests.Session()
+telegram_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+def _telegram_post(message: str, chat_id: str = None) -> tuple:
+    """Un tentativo di invio. Ritorna (ok, retry_after): retry_after > 0 solo per i 429."""
+    try:
+        resp = telegram_session.post(
+            f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
+            data={"chat_id": chat_id or TELEGRAM_CHAT_ID, "text": message, "parse_mode": "Markdown"},
+            timeout=10,
+        )
+    except Exception as e:
+        print(f"❌ Telegram exception: {e}")
+        metrics.incr("telegram_errors")
+        return False, 0.0
+    if resp.status_code == 429:
+        try:
+            return False, float(resp.json().get("parameters", {}).get("retry_after", 1))
+        except Exception:
+            return False, 1.0
+    if resp.status_code != 200:
+        print(f"❌ Telegram error: {resp.text}")
+        metrics.incr("telegram_errors")
+        return False, 0.0
+    return True, 0.0
+
+def telegram_bucket(chat_id: str = None) -> TokenBucket:
+    key    = chat_id or TELEGRAM_CHAT_ID
+    bucket = telegram_buckets.get(key)
+    if bucket is None:
+        bucket = telegram_buckets.setdefault(key, TokenBucket(*CONFIG["RATE_LIMITS"]["telegram"]))
+    return bucket
+
+@metrics.timed("telegram")
+def send_telegram(message: str, chat_id: str = None) -> bool:
+    """Invio sincrono: token bucket per chat, dopo un 429 attende esattamente retry_after."""
+    bucket = telegram_bucket(chat_id)
+    for attempt in range(CONFIG["TELEGRAM_RETRIES"]):
+        bucket.acquire_sync()
+        ok, retry_after = _telegram_post(message, chat_id)
+        if ok or not retry_after:
+            return ok
+        bucket.penalize(retry_after)
+        _count_throttle(retry_after, "telegram")
+        print(f"⏳ Telegram 429 — retry_after {retry_after:.1f}s "
+              f"(attempt {attempt+1}/{CONFIG['TELEGRAM_RETRIES']})", flush=True)
+    return False
+
+class TelegramDispatcher:
+    """
+    Coda di invio su un thread dedicato: submit() ritorna subito un Future e lo scan
+    prosegue mentre i messaggi partono al ritmo consentito da Telegram.
+    flush() attende i messaggi ancora in coda (fine run / chiusura daemon).
+    """
+
+    def __init__(self):
+        self._queue   = queue.Queue()
+        self._pending = set()
+        self._lock    = threading.Lock()
+        self._worker  = None
+
+    def submit(self, message: str, chat_id: str = None) -> Future:
+        fut = Future()
+        with self._lock:
+            self._pending.add(fut)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="telegram", daemon=True)
+                self._worker.start()
+        self._queue.put((message, chat_id, fut))
+        return fut
+
+    def _run(self):
+        while True:
+            message, chat_id, fut = self._queue.get()
+            try:
+                fut.set_result(send_telegram(message, chat_id))
+            except Exception as e:
+                fut.set_exception(e)
+            with self._lock:
+                self._pending.discard(fut)
+
+    def flush(self, timeout: float = None) -> bool:
+        """True se la coda si è svuotata entro il timeout."""
+        with self._lock:
+            pending = list(self._pending)
+        if not pending:
+            return True
+        print(f"📤 Telegram: attesa di {len(pending)} messaggi in coda…", flush=True)
+        return not wait(pending, timeout).not_done
+
+telegram = TelegramDispatcher()
+
+def format_alert(r: dict, strategy: str = None) -> str:
+    if r.get("opt_expiry"):
+        strike = f"🎯 *Call Strike:* `${r['strike']}` exp `{r['opt_expiry']}` (OI `{r['opt_strike_oi']}`)\n"
+    else:
+        strike = f"🎯 *Call Strike (+{CONFIG['OPTIONS_OTM_PCT']:.0%} OTM):* `${r['strike']}`\n"
+    if "opt_cp_skew" in r:
+        strike += f"🧾 *OPTIONS:* Vol/OI `{r['opt_vol_oi']}` | Call/Put vol `{r['opt_cp_skew']}x`\n"
+    header = f"🧭 *STRATEGY:* {strategy}\n" if strategy else ""
+    return (
+        f"🔭 *INSTITUTIONAL FLOW: {r['ticker']}*\n"
+        f"{header}"
+        f"━━━━━━━━━━━━━━━━━━\n"
+        f"🏭 *SECTOR:* {r['sector']}\n"
+        f"📊 *FLOW:* {r['label']} | IFS: `{r['ifs']}/10` | ADX: `{r['adx']}`\n"
+        f"✅ *BREAKOUT:* above `${r['r1']}`\n"
+        f"━━━━━━━━━━━━━━━━━━\n"
+        f"💰 Price: `${r['price']}` | 📈 RS vs SPY: `{r['rs']}%`\n"
+        f"💎 *INSTRUMENT:* STOCKS / CALL OPTIONS\n"
+        f"{strike}"
+        f"🚀 Target: `${r['tg']}` | 🛑 Stop: `${r['sl']}`\n"
+        f"🛡️ Size: `{r['size']} sh` | 🎯 Prob: `{r['prob']}%`\n"
+        f"📊 R1: `${r['r1']}` / R2: `${r['r2']}`\n"
+        f"━━━━━━━━━━━━━━━━━━\n"
+        f"R:R = {round((r['tg'] - r['price']) / (r['price'] - r['sl']), 2)}:1"
+    )
+
+def format_digest(selected: list, strategy: str = None) -> list:
+    """
+    Tutti i segnali in un messaggio (o pochi, se si supera il limite di 4096 caratteri).
+    Ritorna [(testo, n_segnali)]; i segnali non vengono mai spezzati tra due messaggi.
+    """
+    name   = f" {strategy}" if strategy else ""
+    header = f"🔭 *NEXUS DIGEST{name} — {len(selected)} segnali* ({datetime.now().strftime('%H:%M')})"
+    parts, body, count = [], header, 0
+    for r in selected:
+        block = format_alert(r)[:TELEGRAM_MAX_CHARS - len(header) - 2]
+        if count and len(body) + 2 + len(block) > TELEGRAM_MAX_CHARS:
+            parts.append((body, count))
+            body, count = header, 0
+        body  += "\n\n" + block
+        count += 1
+    if count:
+        parts.append((body, count))
+    return parts
+
+def _report_delivery(label: str, n: int = 1, funnel: bool = True):
+    """Callback sul Future di invio: funnel "sent" (solo strategia primaria) ed esito a console."""
+    def done(fut: Future):
+        ok = fut.exception() is None and fut.result()
+        if ok and funnel:
+            metrics.funnel_add("sent", n)
+        print(f"{'✅ Telegram' if ok else '🖨️  Console'}: {label}", flush=True)
+    return done
+
+# ==============================
+# 🚀 MAIN
+# ==============================
+def load_already_alerted() -> set:
+    """Alert di oggi per strategia (Strategy.alerted); ritorna i ticker da saltare nello scan."""
+    already_alerted = set_alerted({})
+    today = datetime.now().strftime("%Y-%m-%d")
+    try:
+        already_alerted = set_alerted(open_trade_log().alerted_by_strategy(today))
+        if already_alerted:
+            print(f"⏭️  Already alerted today: {len(already_alerted)} tickers")
+    except Exception as e:
+        print(f"⚠️  Trade log non leggibile: {e}")
+    return already_alerted
+
+def run_scan(earnings_cache: EarningsCalendar, already_alerted: set, shard: tuple = None) -> int:
+    """
+    Un ciclo completo: regime, fetch, scoring, selezione e alert. Ritorna gli alert processati.
+    Con `shard` scansiona solo la sua fetta e salva i candidati per --merge (niente alert).
+    Con SNAPSHOT_RECORD gli input del ciclo finiscono in SNAPSHOT_DIR (anche se il ciclo fallisce).
+    """
+    recording = CONFIG["SNAPSHOT_RECORD"] and snapshots.replaying is None
+    if recording:
+        snapshots.begin(already_alerted)
+        snapshots.record_json("alerted", {st.name: sorted(st.alerted) for st in strategies})
+    try:
+        return _scan_cycle(earnings_cache, already_alerted, shard)
+    finally:
+        if recording:
+            snapshots.commit(earnings_cache)
+
+def _scan_cycle(earnings_cache: EarningsCalendar, already_alerted: set, shard: tuple = None) -> int:
+    metrics.reset()
+    for st in strategies or activate_strategies():
+        st.engine.begin_run()
+    with metrics.timer("regime"):
+        is_bull, spy_df = get_market_regime()
+    if not is_bull or spy_df is None:
+        print("🛑 Regime Bearish / SPY unavailable. Scan cancelled.")
+        if shard:
+            write_shard_results(shard, [], 0, regime=False)
+        return 0
+    print("✅ Market Regime: BULLISH")
+
+    with metrics.timer("universe"):
+        universe = load_universe()
+    universe_sectors.clear()
+    universe_sectors.update(universe)
+    tickers = shard_tickers(universe, shard)
+    if shard:
+        print(f"🧩 Shard {shard[0]}/{shard[1]}: {len(tickers)} di {len(universe)} ticker")
+
+    # calendari earnings fuori dal percorso caldo dello scan
+    earnings_cache.prefetch([t for t in tickers if t not in already_alerted])
+
+    metrics.incr("universe", len(tickers))
+    if CONFIG["BATCH_DOWNLOAD"] and CONFIG["STREAM_PIPELINE"]:
+        with metrics.timer("scan"):
+            results, scanned = scan_pipeline(tickers, spy_df, already_alerted, earnings_cache)
+        return _finish_scan(results, scanned, already_alerted, shard)
+
+    histories = {}
+    scan_list = tickers
+    if CONFIG["BATCH_DOWNLOAD"]:
+        to_fetch  = [t for t in tickers if t not in already_alerted]
+        with metrics.timer("fetch"):
+            histories = fetch_histories(to_fetch)
+        # i ticker falliti anche nel retry singolo non vengono riscaricati
+        scan_list = [t for t in tickers if t in histories or t in already_alerted]
+
+    print(f"🔍 Scanning {len(scan_list)} tickers ({CONFIG['MAX_THREADS']} threads)…")
+    results = []
+
+    import sys; sys.stdout.flush()  # forza output prima del scan
+    with metrics.timer("scan"):
+        if CONFIG["PANEL_ENGINE"] and histories:
+            results = scan_panel(scan_list, histories, spy_df, already_alerted, earnings_cache)
+        else:
+            results = scan_threaded(scan_list, spy_df, already_alerted, earnings_cache, histories)
+
+    return _finish_scan(results, len(scan_list), already_alerted, shard)
+
+def _finish_scan(results: list, scanned: int, already_alerted: set, shard: tuple = None) -> int:
+    for st in strategies:
+        if st.engine.run:
+            print(f"🧩 {st.tag}Regole: {st.engine.summary()}")
+    print(f"📊 Raw candidates (IFS ≥ {CONFIG['MIN_IFS_SCORE']}): {len(results)}")
+    if shard:
+        write_shard_results(shard, results, scanned)
+        return 0
+    return dispatch_signals(results, already_alerted)
+
+def dispatch_signals(results: list, already_alerted: set) -> int:
+    """
+    Selezione per strategia (sector cap + MAX_ALERTS della strategia), trade log e invio
+    sulla chat della strategia. Comune a scan e --merge.
+    """
     if not results:
         print("❌ No high-quality signals found.")
-        save_earnings_cache(earnings_cache)
-    #     return
 
-    results.sort(key=lambda x: (x["ifs"], x["rs"]), reverse=True)
+    active = strategies or activate_strategies()
+    picks  = []                                  # (strategia, selezionati, conteggio per settore)
+    with metrics.timer("selection"):
+        for st in active:
+            cands = [r for r in results if r.get("strategy", active[0].name) == st.name
+                     and r["ticker"] not in st.alerted]
+            cands.sort(key=lambda x: (x["ifs"], x["rs"]), reverse=True)
 
-    sector_count: defaultdict = defaultdict(int)
-    selected = []
-    for r in results:
-        sec = r["sector"]
-        if sector_count[sec] < CONFIG["MAX_PER_SECTOR"]:
-            selected.append(r)
-            sector_count[sec] += 1
-        else:
-            print(f"⚠️  {r['ticker']} skipped — {sec} sector cap reached")
-        if len(selected) >= CONFIG["MAX_ALERTS"]:
-            break
+            sector_count: defaultdict = defaultdict(int)
+            selected = []
+            for r in cands:
+                sec = r["sector"]
+                if sector_count[sec] < st.config["MAX_PER_SECTOR"]:
+                    selected.append(r)
+                    sector_count[sec] += 1
+                else:
+                    print(f"⚠️  {st.tag}{r['ticker']} skipped — {sec} sector cap reached")
+                if len(selected) >= st.config["MAX_ALERTS"]:
+                    break
+            picks.append((st, selected, sector_count))
+            if not st.primary:
+                metrics.incr(f"strategy_{st.name}_selected", len(selected))
+    metrics.funnel_add("sector_cap", len(picks[0][1]))
+
+    finalists = [r for _, selected, _ in picks for r in selected]
+    if CONFIG["OPTIONS_CONFIRM"] and finalists:
+        confirm_options(finalists)
 
-    print(f"🎯 Selected: {len(selected)} | Sectors: {dict(sector_count)}")
+    for st, selected, sector_count in picks:
+        print(f"🎯 {st.tag}Selected: {len(selected)} | Sectors: {dict(sector_count)}")
     print()
 
     alerts_sent = 0
-    for r in selected:
-        vol_ratio = r.pop("vol_ratio")
-        log_trade(r, vol_ratio)
-
-        msg = (
-            f"🔭 *INSTITUTIONAL FLOW: {r['ticker']}*\n"
-            f"━━━━━━━━━━━━━━━━━━\n"
-            f"🏭 *SECTOR:* {r['sector']}\n"
-            f"📊 *FLOW:* {r['label']} | IFS: `{r['ifs']}/10` | ADX: `{r['adx']}`\n"
-            f"✅ *BREAKOUT:* above `${r['r1']}`\n"
-            f"━━━━━━━━━━━━━━━━━━\n"
-            f"💰 Price: `${r['price']}` | 📈 RS vs SPY: `{r['rs']}%`\n"
-            f"💎 *INSTRUMENT:* STOCKS / CALL OPTIONS\n"
-            f"🎯 *Call Strike (+5% OTM):* `${r['strike']}`\n"
-            f"🚀 Target: `${r['tg']}` | 🛑 Stop: `${r['sl']}`\n"
-            f"🛡️ Size: `{r['size']} sh` | 🎯 Prob: `{r['prob']}%`\n"
-            f"📊 R1: `${r['r1']}` / R2: `${r['r2']}`\n"
-            f"━━━━━━━━━━━━━━━━━━\n"
-            f"R:R = {round((r['tg'] - r['price']) / (r['price'] - r['sl']), 2)}:1"
-        )
+    digest = CONFIG["TELEGRAM_DIGEST"]
+    for st, selected, _ in picks:
+        name = None if st.primary else st.name
+        for r in selected:
+            vol_ratio = r.pop("vol_ratio")
+            label = f"{st.tag}{r['ticker']} | IFS {r['ifs']}/10 | ADX {r['adx']} | {r['sector']}"
+            if snapshots.replaying is not None:
+                # replay: niente trade log né Telegram
+                snapshots.signals.append(r)
+                print(f"🎞️  Replay: {label}")
+                alerts_sent += 1
+                continue
+            log_trade(r, vol_ratio)
+            st.alerted.add(r["ticker"])
+            if all(r["ticker"] in other.alerted for other in active):
+                already_alerted.add(r["ticker"])
 
-        sent = send_telegram(msg)
-        status = "✅ Telegram" if sent else "🖨️  Console"
-        print(f"{status}: {r['ticker']} | IFS {r['ifs']}/10 | ADX {r['adx']} | {r['sector']}")
-        print(msg)
-        print()
+            msg   = format_alert(r, name)
+            if not digest:
+                telegram.submit(msg, st.chat_id).add_done_callback(_report_delivery(label, funnel=st.primary))
+            print(f"📤 {'Digest' if digest else 'Queued'}: {label}")
+            print(msg)
+            print()
+            alerts_sent += 1
+
+        if digest and selected and snapshots.replaying is None:
+            for text, n in format_digest(selected, name):
+                telegram.submit(text, st.chat_id).add_done_callback(
+                    _report_delivery(f"{st.tag}digest ({n} segnali)", n, st.primary))
 
-        alerts_sent += 1
-        time.sleep(2)
+    print("=" * 70)
+    print(f"🏁 Done — {alerts_sent}/{len(finalists)} alerts processed")
+    print("=" * 70)
+    return alerts_sent
+
+def write_run_report(path: str = None, prom_path: str = None):
+    """Report JSON del run (+ textfile Prometheus se configurato) e riepilogo a console."""
+    if not metrics.enabled:
+        return
+    report = metrics.to_dict()
+    slow   = sorted(report["stages"].items(), key=lambda kv: kv[1]["total_s"], reverse=True)[:5]
+    print(f"⏱️  Run {report['duration_s']:.1f}s | "
+          + " | ".join(f"{k} {st['total_s']:.1f}s" for k, st in slow))
+    print("🔻 Funnel: " + " → ".join(f"{k} {v}" for k, v in report["funnel"].items()))
 
-    save_earnings_cache(earnings_cache)
+    def _json(tmp):
+        with open(tmp, "w") as f:
+            json.dump(report, f, indent=2)
+    try:
+        _atomic_write(path or METRICS_FILE, _json)
+        prom_path = prom_path or PROM_TEXTFILE
+        if prom_path:
+            text = metrics.to_prometheus()
+            def _prom(tmp):
+                with open(tmp, "w") as f:
+                    f.write(text)
+            _atomic_write(prom_path, _prom)
+    except Exception as e:
+        print(f"⚠️  Report non salvato: {e}")
+
+def main(shard: tuple = None):
     print("=" * 70)
-    print(f"🏁 Done — {alerts_sent}/{len(selected)} alerts processed")
+    print("🧬 NEXUS v14.5 — WHALE DETECTOR EDITION")
     print("=" * 70)
 
+    # Gold Hour gate — decommentare per attivare in produzione
+    if not is_market_gold_hour():
+        print(f"⏰ {market_calendar.gate_reason() or 'Outside Gold Hour'}. Exiting.")
+        return
 
-if __name__ == "__main__":
+    earnings_cache = load_earnings_cache()
+    print(f"📅 Earnings cache: {len(earnings_cache)} tickers")
+    try:
+        run_scan(earnings_cache, load_already_alerted(), shard)
+        if shard is None:
+            track_outcomes()
+    finally:
+        telegram.flush(timeout=CONFIG["TELEGRAM_FLUSH_TIMEOUT"])
+        save_earnings_cache(earnings_cache)
+        write_run_report()
+
+def merge_shards(shard_dir: str = None) -> int:
+    """Unisce i candidati degli shard e applica sector cap e MAX_ALERTS sull'universo intero."""
+    print("=" * 70)
+    print("🧬 NEXUS v14.5 — MERGE SHARD")
+    print("=" * 70)
+    metrics.reset()
+    already_alerted = load_already_alerted()
+    try:
+        results = [r for r in load_shard_results(shard_dir) if r["ticker"] not in already_alerted]
+        metrics.funnel_add("ifs", len(results))
+        print(f"📊 Candidati dagli shard: {len(results)}")
+        sent = dispatch_signals(results, already_alerted)
+        track_outcomes()
+        return sent
+    finally:
+        telegram.flush(timeout=CONFIG["TELEGRAM_FLUSH_TIMEOUT"])
+        write_run_report()
+
+# ==============================
+# 🔁 DAEMON (processo residente)
+# ==============================
+def run_daemon(interval: int):
+    """
+    Resta in memoria e lancia run_scan ogni `interval` secondi durante la Gold Hour.
+    SPY, storici, IndicatorState, earnings e already_alerted restano caldi tra i cicli.
+    SIGUSR1 → flush su disco; SIGTERM/SIGINT → flush e uscita.
+    """
+    stop           = threading.Event()
+    earnings_cache = load_earnings_cache()
+
+    def flush():
+        earnings_cache.save()
+        print(f"💾 Flush: earnings {len(earnings_cache)} | stati {len(indicator_states)} | "
+              f"storici {len(history_cache)}", flush=True)
+
+    def on_stop(signum, frame):
+        print(f"\n🛑 Segnale {signum} — chiusura daemon…", flush=True)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    if hasattr(signal, "SIGUSR1"):
+        # fuori dal signal handler: il lock della cache potrebbe essere già preso
+        signal.signal(signal.SIGUSR1, lambda *_: threading.Thread(target=flush).start())
+
+    print("=" * 70)
+    print(f"🧬 NEXUS v14.5 — DAEMON (scan ogni {interval}s in Gold Hour)")
+    print("=" * 70, flush=True)
+
+    alerted_day, already_alerted = None, set()
+    while not stop.is_set():
+        if not is_market_gold_hour():
+            wait = min(market_calendar.seconds_to_gold_hour(), CONFIG["DAEMON_IDLE_MAX_SLEEP"])
+            print(f"⏰ Outside Gold Hour — prossimo controllo tra {wait / 60:.0f} min", flush=True)
+            stop.wait(wait)
+            continue
+
+        started = time.monotonic()
+        if datetime.now().date() != alerted_day:
+            alerted_day     = datetime.now().date()
+            already_alerted = load_already_alerted()
+        try:
+            run_scan(earnings_cache, already_alerted)
+        except Exception as e:
+            print(f"💥 Scan error: {e}")
+            traceback.print_exc()
+        track_outcomes()
+        earnings_cache.save()
+        telegram.flush(timeout=CONFIG["TELEGRAM_FLUSH_TIMEOUT"])   # funnel "sent" completo nel report
+        write_run_report()
+        stop.wait(max(1.0, interval - (time.monotonic() - started)))
+
+    telegram.flush(timeout=CONFIG["TELEGRAM_FLUSH_TIMEOUT"])
+    earnings_cache.wait(timeout=CONFIG["EARNINGS_REFRESH_TIMEOUT"])
+    flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="NEXUS v14.5 — Whale Detector scanner")
+    parser.add_argument("--backfill", action="store_true",
+                        help="riscarica lo storico completo nello store locale ed esce")
+    parser.add_argument("--period", default=None,
+                        help="periodo per --backfill (default CONFIG['STORE_BACKFILL_PERIOD'])")
+    parser.add_argument("--check-panel", action="store_true",
+                        help="verifica parità panel engine vs funzioni per-ticker sullo store locale")
+    parser.add_argument("--daemon", action="store_true",
+                        help="processo residente: scan periodici in Gold Hour con stato in memoria")
+    parser.add_argument("--interval", type=int, default=None,
+                        help="secondi tra due scan in --daemon (default CONFIG['DAEMON_INTERVAL'])")
+    parser.add_argument("--export-trades", metavar="CSV", default=None,
+                        help="esporta il trade log SQLite nel formato CSV storico ed esce")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                        help="scansiona solo la fetta i di N (0 ≤ i < N) e salva i candidati per --merge")
+    parser.add_argument("--merge", nargs="?", const=SHARD_DIR, default=None, metavar="DIR",
+                        help="unisce i candidati degli shard (default .shards/) e invia gli alert")
+    parser.add_argument("--record", action="store_true",
+                        help="registra gli input di ogni scan in .snapshots/ (come SNAPSHOT_RECORD)")
+    parser.add_argument("--replay", default=None, metavar="SNAPSHOT|YYYY-MM-DD",
+                        help="riesegue lo scan su uno snapshot o su tutti quelli di un giorno, offline")
+    parser.add_argument("--outcomes", action="store_true",
+                        help="aggiorna gli esiti dei segnali e stampa hit rate vs prob per IFS e settore")
+    parser.add_argument("--refresh-universe", action="store_true",
+                        help="ricostruisce la tabella costituenti (sorgenti, market cap, liquidità) ed esce")
+    args = parser.parse_args(argv)
+    if args.shard and (args.daemon or args.merge):
+        parser.error("--shard non è combinabile con --daemon o --merge")
+    return args
+
+
+def check_panel():
+    """Parity check offline: panel_score_table vs institutional_score/calc_adx sullo store."""
+    spy_df = store_load("SPY")
+    if spy_df is None:
+        print("❌ SPY non presente nello store — eseguire prima --backfill")
+        return False
+    histories = {t: df for t in load_universe() if (df := store_load(t)) is not None}
+    diffs = panel_parity_check(histories, spy_df)
+    if diffs.empty:
+        print(f"✅ Panel parity OK su {len(histories)} ticker")
+        return True
+    print(f"❌ Panel parity: {len(diffs)} differenze")
+    print(diffs.to_string(index=False))
+    return False
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    if args.record:
+        CONFIG["SNAPSHOT_RECORD"] = True
     try:
-        main()
+        if args.replay:
+            replay_snapshots(args.replay)
+        elif args.backfill:
+            store_backfill(shard_tickers(load_universe(), args.shard) + ["SPY"], args.period)
+        elif args.refresh_universe:
+            universe = load_universe(refresh=True)
+            print(f"🌍 Universe: {len(universe)} ticker dopo i filtri → {UNIVERSE_FILE}")
+        elif args.merge:
+            merge_shards(args.merge)
+        elif args.check_panel:
+            check_panel()
+        elif args.export_trades:
+            n = open_trade_log().export_csv(args.export_trades)
+            print(f"🗃️  Trade log: {n} righe esportate in {args.export_trades}")
+        elif args.outcomes:
+            print_outcomes()
+        elif args.daemon:
+            run_daemon(args.interval or CONFIG["DAEMON_INTERVAL"])
+        else:
+            main(args.shard)
     except KeyboardInterrupt:
         print("\n🛑 Interrupted.")
     except Exception as e:
-        import traceback
         print(f"💥 Fatal: {e}")
         traceback.print_exc()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,63 @@
+"""Parity pannello vettoriale / FrameFeatures vs institutional_score, calc_adx e ATR su OHLCV sintetico."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import scanner_pro as sp
+from bench import spy_frame, synthetic_frame
+
+END  = pd.Timestamp("2026-10-16")
+BARS = 300
+
+
+def _nan_head(ticker: str, valid: int, cols=("Open", "High", "Low", "Close", "Volume")) -> pd.DataFrame:
+    df = synthetic_frame(ticker, BARS, END)
+    df.iloc[:BARS - valid, [df.columns.get_loc(c) for c in cols]] = np.nan
+    return df
+
+
+@pytest.fixture(scope="module")
+def histories() -> dict:
+    h = {f"FULL{i}": synthetic_frame(f"FULL{i}", BARS, END) for i in range(8)}
+    # storia corta: attorno alle soglie di 60 barre (pannello), 63 (RS) e 30 (IFS)
+    for n in (200, 100, 70, 64, 63, 61, 60, 59, 40, 29, 10, 1):
+        h[f"SHORT{n}"] = synthetic_frame(f"SHORT{n}", n, END)
+    # warmup NaN: ticker quotati da poco allineati all'indice di SPY
+    for n in (5, 20, 40, 100):
+        h[f"WARM{n}"] = _nan_head(f"WARM{n}", n)
+    h["WARMV"] = _nan_head("WARMV", 50, cols=("Volume",))
+    gap = synthetic_frame("GAP", BARS, END)
+    gap.iloc[150] = np.nan
+    h["GAP"]  = gap
+    hole = synthetic_frame("HOLE", BARS, END)
+    h["HOLE"] = hole.drop(hole.index[150])
+    zero = synthetic_frame("ZEROV", BARS, END)
+    zero.iloc[-20:, zero.columns.get_loc("Volume")] = 0
+    h["ZEROV"] = zero
+    return h
+
+
+@pytest.fixture(scope="module")
+def spy_df() -> pd.DataFrame:
+    return spy_frame(BARS, END)
+
+
+def _assert_parity(diffs: pd.DataFrame):
+    assert diffs.empty, "panel ≠ riferimento:\n" + diffs.to_string(index=False)
+
+
+def test_fixture_covers_every_path(histories, spy_df):
+    fast = sp.PanelFeatures(histories, spy_df).fast
+    assert fast.any() and not fast.all()
+    assert len(sp.FrameFeatures({t: df for t, df in histories.items()}, spy_df).index) < len(histories)
+
+
+def test_panel_parity(histories, spy_df):
+    _assert_parity(sp.panel_parity_check(histories, spy_df))
+
+
+def test_panel_parity_with_indicator_states(histories, spy_df):
+    # stato all'ultima barra (ADX letto) o a quella prima (un passo Wilder con la barra di oggi)
+    states = {t: sp.IndicatorState.from_history(df.dropna().iloc[:len(df.dropna()) - i % 2])
+              for i, (t, df) in enumerate(histories.items()) if len(df.dropna()) > 1}
+    _assert_parity(sp.panel_parity_check(histories, spy_df, states))
@@ -0,0 +1,53 @@
+"""Funnel di prossimità: le soglie seguono la strategia attiva più permissiva."""
+import pandas as pd
+import pytest
+
+import scanner_pro as sp
+from bench import synthetic_frame
+
+
+@pytest.fixture
+def active(monkeypatch):
+    def _activate(*names):
+        monkeypatch.setitem(sp.CONFIG, "ACTIVE_STRATEGIES", list(names))
+        sp.activate_strategies()
+    yield _activate
+    monkeypatch.undo()
+    sp.activate_strategies()
+
+
+def _candidate(vol_ratio: float) -> tuple:
+    """Storico chiuso fino a ieri + barra di oggi sopra la resistenza con il vol_ratio dato."""
+    today = pd.Timestamp(sp._ny_today())
+    hist  = synthetic_frame("LOOSE", 120, today - pd.offsets.BDay(1))
+    s19   = float(hist["Volume"].iloc[-19:].sum())
+    bar   = hist.iloc[-1:].copy()
+    bar.index = [today]
+    bar["Close"]  = float(hist["High"].iloc[-20:].max()) * 1.01
+    bar["Volume"] = vol_ratio * s19 / (20 - vol_ratio)   # V / ((S19 + V) / 20) = vol_ratio
+    return hist, bar
+
+
+def test_gates_take_loosest_strategy(active):
+    active("v14.5")
+    assert sp.proximity_gates() == {"vol_trigger": 1.5, "price": True}
+    active("v14.5", "midcap_loose", "adx_strict")
+    assert sp.proximity_gates() == {"vol_trigger": 1.3, "price": True}
+
+
+def test_loose_candidate_survives_funnel(active):
+    hist, bar = _candidate(1.35)
+    full = pd.concat([hist, bar])
+    vol_ratio = full["Volume"].iloc[-1] / full["Volume"].rolling(20).mean().iloc[-1]
+    assert 1.3 < vol_ratio < 1.5
+
+    active("v14.5")
+    gates = sp.proximity_gates()
+    entry = sp.build_proximity_index({"LOOSE": full}, gates)["tickers"]["LOOSE"]
+    assert not sp._is_near(entry, bar.iloc[-1], gates)
+
+    active("v14.5", "midcap_loose")
+    gates = sp.proximity_gates()
+    entry = sp.build_proximity_index({"LOOSE": full}, gates)["tickers"]["LOOSE"]
+    assert sp._is_near(entry, bar.iloc[-1], gates)
+
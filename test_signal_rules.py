@@ -0,0 +1,49 @@
+"""Regole di segnale: stessa semantica nel RuleEngine live e in backtest.signal_mask (ADX NaN passa)."""
+import numpy as np
+import pandas as pd
+
+import backtest as bt
+import scanner_pro as sp
+
+# ticker che superano tutte le altre regole, ADX: NaN / sotto soglia / sulla soglia / sopra
+TICKERS = ["NANADX", "WEAK", "EDGE", "STRONG"]
+ADX     = np.array([np.nan, 10.0, sp.CONFIG["MIN_ADX"], 40.0])
+
+
+def _source() -> sp._FeatureSource:
+    n   = len(TICKERS)
+    src = sp._FeatureSource(TICKERS)
+    feats = {
+        "price":      np.full(n, 50.0),
+        "resistance": np.full(n, 48.0),
+        "dollar_vol": np.full(n, 10 * sp.CONFIG["MIN_VOLUME_USD"]),
+        "vol_ratio":  np.full(n, 2.0),
+        "ifs":        np.full(n, 8.0),
+        "adx":        ADX,
+    }
+    for name, values in feats.items():
+        vals, done = src._slot(name)
+        vals[:], done[:] = values, True
+    src.base[:] = True
+    return src
+
+
+def test_nan_adx_passes_engine():
+    alive, report = sp.RuleEngine().evaluate(_source())
+    assert list(pd.Index(TICKERS)[alive]) == ["NANADX", "EDGE", "STRONG"]
+    assert {r["rule"]: r["passed"] for r in report}["adx"] == 3
+
+
+def test_engine_matches_backtest_mask():
+    alive, _ = sp.RuleEngine().evaluate(_source())
+    n    = len(TICKERS)
+    feat = {
+        "eligible": np.ones((1, n), dtype=bool),
+        "vol_ratio": np.full((1, n), 2.0),
+        "adx":       ADX[None, :],
+        "atr":       np.ones((1, n)),
+        "ifs_base":  np.full((1, n), 8),
+        "dry_feat":  np.full((1, n), np.inf),
+    }
+    mask, _ = bt.signal_mask(feat, bt.LIVE_PARAMS)
+    assert list(np.flatnonzero(mask[0])) == list(alive)